@@ -1,26 +1,104 @@
-from flask import Flask, render_template, request, jsonify
-import webview
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 import threading
 import os
 import sys
 import subprocess
 import json
+import time
+from itertools import islice
 from pathlib import Path
 
 # Add src directory to path so we can import our modules
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.agent import stream_graph_updates, conversation_history, conversation_summary
-from src.tools.system_commands import run_command, list_directory, detect_system, get_system_info
+from src.tools.system_commands import run_command, list_directory, detect_system, get_system_info, stream_in_shell, start_sudo_job, resolve_path
+from src.tools.listing import scan_directory, list_page, format_listing, DEFAULT_LIMIT
+from src.tools.jobs import jobs
+from src.tools.history import history
+from src.tools.completion import complete
+from src.tools.batch import arun_batch, astream_batch, validate as validate_batch
+from src.tools.async_runtime import run_sync, iterate_sync
+from src.channel import Channel
+
+# The WebSocket transport needs flask-sock (pip install -e '.[websocket]'). Without it
+# the frontend keeps using the HTTP endpoints
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+from src.tools.fingerprint import get_fingerprint, invalidate_fingerprint
+from src.tools.session import sessions, bind_session, unbind_session, use_session, current_session, is_valid_session_id, new_session_id
+from src.tools.metrics import record, render_prometheus, METRICS_ENABLED
+
+# Production serving (--serve): address and gunicorn worker/thread counts. Sessions,
+# shells and jobs live in the worker process, so more than one worker needs sticky
+# routing of each session id to the same worker.
+SERVE_HOST = os.getenv("AGENT_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("AGENT_PORT", "5000"))
+SERVE_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+SERVE_THREADS = int(os.getenv("AGENT_THREADS", "16"))
+# Seconds in-flight requests get to finish on shutdown
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("AGENT_GRACEFUL_TIMEOUT", "30"))
+# Seconds between WebSocket pings, so proxies don't drop idle connections
+WS_PING_INTERVAL = int(os.getenv("AGENT_WS_PING_INTERVAL", "25"))
 
 app = Flask(__name__, 
             static_folder='front_end',
             static_url_path='')
 
-class AIAgentAPI:
-    def __init__(self):
-        self.conversation_history = []
-        self.conversation_summary = ""
+# Clients identify their session with this cookie or the X-Session-ID header
+SESSION_COOKIE = 'session_id'
+
+@app.before_request
+def load_session():
+    """Bind the caller's session so tools and the agent use its history and cwd"""
+    session_id = request.headers.get('X-Session-ID') or request.cookies.get(SESSION_COOKIE)
+    g.new_session = not is_valid_session_id(session_id)
+    if g.new_session:
+        session_id = new_session_id()
+    g.session = sessions.get(session_id)
+    g.session_token = bind_session(g.session)
+
+@app.after_request
+def save_session_cookie(response):
+    """Hand newly created session ids back to the client"""
+    if getattr(g, 'new_session', False):
+        response.set_cookie(SESSION_COOKIE, g.session.id, httponly=True, samesite='Strict')
+    return response
+
+@app.teardown_request
+def release_session(exc):
+    """Unbind the session once the request (including any streamed body) is done"""
+    token = g.pop('session_token', None)
+    if token is not None:
+        unbind_session(token)
+
+if METRICS_ENABLED:
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        """Time every route; streamed bodies are timed until the stream is closed"""
+        start = g.request_start
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}"
+        error = response.status_code >= 500
+
+        def finish():
+            record('route', route, time.perf_counter() - start, error=error,
+                   output_bytes=response.content_length or 0)
+
+        if response.is_streamed:
+            response.call_on_close(finish)
+        else:
+            finish()
+        return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latency histograms, call and error counts, output bytes and LLM tokens in Prometheus text format"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -37,6 +115,16 @@ def execute_command():
         if not command:
             return jsonify({'error': 'No command provided'}), 400
         
+        # sudo runs as a background job; the client polls /api/jobs/<id> for its output
+        if command.startswith('sudo'):
+            job = start_sudo_job(command)
+            return jsonify({
+                'result': f'Started background job {job.id}',
+                'command': command,
+                'job': job.to_dict(),
+                'status': 'success'
+            })
+        
         # Execute the command using our system_commands tool
         result = run_command(command)
         
@@ -52,6 +140,137 @@ def execute_command():
             'status': 'error'
         }), 500
 
+def _sse_event(event: str, data: dict) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _bound_to_session(iterator):
+    """Produce each item of a streamed body with the caller's session bound.
+
+    Streamed bodies are iterated after the view returns, outside the context
+    load_session bound the session in.
+    """
+    session = g.session
+    try:
+        while True:
+            with use_session(session):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        iterator.close()
+
+def _command_events(command: str, cancelled: threading.Event = None):
+    """(event, data) pairs of a streamed command, sent over SSE or the WebSocket"""
+    yield 'start', {'command': command}
+    try:
+        # sudo runs as a background job; the client polls /api/jobs/<id> for its output
+        if command.startswith('sudo'):
+            yield 'job', start_sudo_job(command).to_dict()
+            return
+        
+        # The session's shell runs it, so cd, export, source and alias carry over
+        for stream, payload in stream_in_shell(command, cancelled=cancelled):
+            if stream == 'exit':
+                yield 'exit', {'code': payload}
+            elif stream == 'error':
+                yield 'error', {'error': payload}
+            else:
+                yield 'output', {'stream': stream, 'text': payload}
+    except Exception as e:
+        yield 'error', {'error': f'Error executing command: {str(e)}'}
+
+def _ai_events(query: str, cancelled: threading.Event = None):
+    """(event, data) pairs of a streamed agent turn, sent over SSE or the WebSocket"""
+    try:
+        from src.agent import stream_agent_events
+        
+        yield from stream_agent_events(query, cancelled)
+    except Exception as agent_error:
+        yield 'error', {'error': f'AI Agent Error: {str(agent_error)}'}
+
+@app.route('/api/command/stream', methods=['POST'])
+def stream_command_output():
+    """Execute system commands and stream their output as Server-Sent Events"""
+    data = request.get_json()
+    command = data.get('command', '').strip()
+    
+    if not command:
+        return jsonify({'error': 'No command provided'}), 400
+    
+    def generate():
+        for event, payload in _command_events(command):
+            yield _sse_event(event, payload)
+    
+    return Response(
+        stream_with_context(_bound_to_session(generate())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Start a command as a background job and return its id at once"""
+    try:
+        data = request.get_json()
+        command = data.get('command', '').strip()
+        
+        if not command:
+            return jsonify({'error': 'No command provided'}), 400
+        
+        job = jobs.submit(command, g.session.cwd, g.session.id)
+        return jsonify({'job': job.to_dict(), 'status': 'success'}), 202
+        
+    except Exception as e:
+        return jsonify({
+            'error': f'Error starting job: {str(e)}',
+            'status': 'error'
+        }), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List the session's background jobs"""
+    return jsonify({
+        'jobs': [job.to_dict() for job in jobs.list(g.session.id)],
+        'status': 'success'
+    })
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Stop a queued or running background job"""
+    job = jobs.get(job_id, g.session.id)
+    if job is None:
+        return jsonify({'error': f'No job with id {job_id}', 'status': 'error'}), 404
+    
+    cancelled = jobs.cancel(job)
+    return jsonify({'job': job.to_dict(), 'cancelled': cancelled, 'status': 'success'})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a background job and its output from byte ?offset= on"""
+    job = jobs.get(job_id, g.session.id)
+    if job is None:
+        return jsonify({'error': f'No job with id {job_id}', 'status': 'error'}), 404
+    
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'offset must be an integer', 'status': 'error'}), 400
+    
+    # Status first: once it reads finished, the output read after it is complete
+    info = job.to_dict()
+    text, start, end = job.read_output(offset)
+    return jsonify({
+        'job': info,
+        'output': text,
+        # Output between offset and start was dropped from memory before it was read
+        'skipped': start - offset,
+        'offset': end,
+        'status': 'success'
+    })
+
 @app.route('/api/ai', methods=['POST'])
 def execute_ai_query():
     """Execute AI queries using the agent - backend processing only"""
@@ -64,35 +283,9 @@ def execute_ai_query():
         
         # Process the query directly in backend without streaming
         try:
-            # Import the agent's internal functions for direct processing
-            from src.agent import graph, conversation_history, conversation_summary
-            from langchain_core.messages import HumanMessage
-            
-            # Add user message to history
-            user_message = HumanMessage(content=query)
-            conversation_history.append(user_message)
-            
-            # Use recent messages for context
-            recent_messages = conversation_history[-4:]
-            
-            initial_state = {
-                "messages": recent_messages,
-                "conversation_summary": conversation_summary
-            }
-            
-            # Process through the graph and collect the final response
-            final_response = ""
-            for event in graph.stream(initial_state):
-                for value in event.values():
-                    if "messages" in value:
-                        last_msg = value["messages"][-1]
-                        if hasattr(last_msg, 'content') and last_msg.content:
-                            final_response = last_msg.content
-                            # Add assistant response to history
-                            conversation_history.append(last_msg)
+            from src.agent import run_agent
             
-            if not final_response:
-                final_response = "I processed your request successfully."
+            final_response = run_agent(query)
                 
             return jsonify({
                 'result': final_response,
@@ -112,10 +305,85 @@ def execute_ai_query():
             'status': 'error'
         }), 500
 
+@app.route('/api/ai/stream', methods=['POST'])
+def stream_ai_query():
+    """Execute AI queries and stream tokens and tool progress as Server-Sent Events"""
+    data = request.get_json()
+    query = data.get('query', '').strip()
+    
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+    
+    def generate():
+        for event, payload in _ai_events(query):
+            yield _sse_event(event, payload)
+    
+    return Response(
+        stream_with_context(_bound_to_session(generate())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """Recent commands, oldest first: the last ?limit= entries before index ?before="""
+    try:
+        limit = min(int(request.args.get('limit', 100)), history.max_entries)
+        before = request.args.get('before')
+        before = int(before) if before is not None else None
+    except ValueError:
+        return jsonify({'error': 'limit and before must be integers', 'status': 'error'}), 400
+    
+    entries, start = history.recent(g.session.id, limit, before)
+    return jsonify({
+        'history': entries,
+        # Pass as before= to page further back
+        'start': start,
+        'status': 'success'
+    })
+
+@app.route('/api/history', methods=['POST'])
+def add_history():
+    """Record a command entered in the terminal"""
+    data = request.get_json() or {}
+    command = data.get('command', '').strip()
+    
+    if not command:
+        return jsonify({'error': 'No command provided'}), 400
+    
+    try:
+        history.add(g.session.id, command)
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        return jsonify({
+            'error': f'Error recording command: {str(e)}',
+            'status': 'error'
+        }), 500
+
+@app.route('/api/complete', methods=['GET'])
+def complete_command():
+    """Completions for the partly typed command line ?line=, from history, PATH and the file system"""
+    line = request.args.get('line', '')
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer', 'status': 'error'}), 400
+    
+    try:
+        result = complete(line, g.session.cwd, g.session.id, limit)
+        return jsonify({**result, 'line': line, 'status': 'success'})
+    except Exception as e:
+        return jsonify({
+            'error': f'Error completing command: {str(e)}',
+            'status': 'error'
+        }), 500
+
 @app.route('/api/system-info', methods=['GET'])
 def get_system_information():
     """Get system information"""
     try:
+        if request.args.get('refresh'):
+            invalidate_fingerprint()
         system_info = get_system_info()
         return jsonify({
             'result': system_info,
@@ -129,16 +397,56 @@ def get_system_information():
 
 @app.route('/api/list-directory', methods=['POST'])
 def list_dir():
-    """List directory contents"""
+    """List directory contents with size, mtime and type.
+
+    Takes path, pattern (glob), offset, limit, show_hidden, recursive and max_depth. Plain
+    listings return one page sorted by name; recursive ones (or stream: true) are streamed
+    as newline-delimited JSON, one entry per line, in scan order.
+    """
+    data = request.get_json() or {}
+    try:
+        offset = int(data.get('offset', 0))
+        limit = int(data.get('limit', DEFAULT_LIMIT))
+        max_depth = data.get('max_depth')
+        if max_depth is not None:
+            max_depth = int(max_depth)
+            if max_depth < 0:
+                raise ValueError('max_depth must not be negative')
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'offset, limit and max_depth must be integers: {str(e)}', 'status': 'error'}), 400
+    
     try:
-        data = request.get_json()
         path = data.get('path', '.')
+        pattern = data.get('pattern') or None
+        show_hidden = bool(data.get('show_hidden', True))
+        recursive = bool(data.get('recursive', False))
+        directory = resolve_path(path)
+        if not os.path.isdir(directory):
+            return jsonify({'error': f"Not a directory: '{directory}'", 'status': 'error'}), 404
         
-        result = list_directory(path)
+        if recursive or data.get('stream'):
+            def generate():
+                entries = scan_directory(directory, pattern=pattern, recursive=recursive,
+                                         show_hidden=show_hidden, max_depth=max_depth)
+                try:
+                    for item in islice(entries, max(0, offset), max(0, offset) + max(0, limit)):
+                        yield json.dumps(item) + '\n'
+                except OSError as e:
+                    yield json.dumps({'error': f'Error listing directory: {str(e)}'}) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
         
+        try:
+            entries, total = list_page(directory, offset, limit, pattern, show_hidden)
+        except OSError as e:
+            # e.g. a directory that can't be read
+            return jsonify({'error': f'Error listing directory: {str(e)}', 'status': 'error'}), 400
         return jsonify({
-            'result': result,
-            'path': path,
+            'result': format_listing(directory, entries, offset, total, offset + len(entries) < total, pattern),
+            'entries': entries,
+            'total': total,
+            'offset': offset,
+            'path': directory,
             'status': 'success'
         })
         
@@ -148,11 +456,103 @@ def list_dir():
             'status': 'error'
         }), 500
 
+@app.route('/api/batch', methods=['POST'])
+def run_batch():
+    """Run many command, list-directory and system-info operations concurrently.
+
+    Takes {"operations": [{"op": "command", "command": "uptime", "cwd": "/srv"}, ...]}.
+    Each operation may set cwd (relative to the session's directory) and an id that is
+    echoed back; commands run as separate processes and never change the session's
+    shell. Results come back in order, or with stream: true as newline-delimited JSON
+    in the order they finish, each carrying the index of its operation.
+    """
+    data = request.get_json() or {}
+    operations = data.get('operations')
+    error = validate_batch(operations)
+    if error:
+        return jsonify({'error': error, 'status': 'error'}), 400
+    
+    cwd = g.session.cwd
+    if data.get('stream'):
+        def generate():
+            try:
+                for _, result in iterate_sync(astream_batch(operations, cwd)):
+                    yield json.dumps(result) + '\n'
+            except Exception as e:
+                yield json.dumps({'error': f'Error running batch: {str(e)}', 'status': 'error'}) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    try:
+        return jsonify({'results': run_sync(arun_batch(operations, cwd)), 'status': 'success'})
+    except Exception as e:
+        return jsonify({
+            'error': f'Error running batch: {str(e)}',
+            'status': 'error'
+        }), 500
+
+def _ws_command(frame: dict, cancelled: threading.Event):
+    command = str(frame.get('command', '')).strip()
+    if not command:
+        yield 'error', {'error': 'No command provided'}
+        return
+    yield from _command_events(command, cancelled)
+
+def _ws_ai(frame: dict, cancelled: threading.Event):
+    query = str(frame.get('query', '')).strip()
+    if not query:
+        yield 'error', {'error': 'No query provided'}
+        return
+    yield from _ai_events(query, cancelled)
+
+def _ws_history(frame: dict, cancelled: threading.Event):
+    history.add(current_session().id, str(frame.get('command', '')))
+    yield from ()
+
+def _ws_complete(frame: dict, cancelled: threading.Event):
+    # Runs on the channel's thread, outside the request; the session is bound there
+    session = current_session()
+    yield 'completions', complete(str(frame.get('line', '')), session.cwd, session.id)
+
+# Request types the WebSocket accepts, each producing the events of its HTTP counterpart
+WS_HANDLERS = {
+    'command': _ws_command,
+    'ai': _ws_ai,
+    'history': _ws_history,
+    'complete': _ws_complete,
+}
+
+if Sock is not None:
+    sock = Sock(app)
+    app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': WS_PING_INTERVAL}
+    
+    @sock.route('/ws')
+    def websocket(ws):
+        """One persistent connection per client carrying commands, AI queries, their streamed
+        output and background job notifications (see src/channel.py for the framing)"""
+        origin = request.headers.get('Origin')
+        if origin and origin.split('://', 1)[-1] != request.host:
+            # Another site's page; the session cookie alone must not let it run commands
+            ws.close(reason=1008, message='Cross-origin connection refused')
+            return
+        
+        channel = Channel(ws, WS_HANDLERS, g.session)
+        
+        def on_job_finished(job):
+            if job.session_id == channel.session.id:
+                channel.notify('job_finished', job.to_dict())
+        
+        jobs.add_listener(on_job_finished)
+        try:
+            channel.serve()
+        finally:
+            jobs.remove_listener(on_job_finished)
+
 def start_flask_server():
     """Start the Flask server in a separate thread"""
     app.run(host='127.0.0.1', port=5000, debug=False, use_reloader=False)
 
-def create_webview_window():
+def create_webview_window(webview):
     """Create and configure the webview window"""
     webview.create_window(
         title='AI Agent Terminal',
@@ -167,6 +567,59 @@ def create_webview_window():
         shadow=True,
     )
 
+def prepare_worker():
+    """Build the agent graph and chat model once per server process, before it takes requests"""
+    # A long history takes a moment to index; do it alongside instead of on the first completion
+    threading.Thread(target=history.load, daemon=True).start()
+    try:
+        from src.agent import get_graph, get_llm
+        get_graph()
+        get_llm()
+    except Exception as e:
+        # The command endpoints still work; /api/ai will report the error when used
+        print(f"⚠️  AI agent unavailable: {e}")
+
+def shutdown_worker():
+    """Release per-process resources: background jobs, shells and the checkpoint database"""
+    jobs.shutdown()
+    sessions.close_all()
+    agent = sys.modules.get('src.agent')
+    if agent is not None:
+        agent.close()
+
+def serve(host: str = SERVE_HOST, port: int = SERVE_PORT, workers: int = SERVE_WORKERS,
+          threads: int = SERVE_THREADS):
+    """Run the app under gunicorn with threaded workers instead of the Flask dev server"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("❌ --serve needs gunicorn: pip install -e '.[serve]'")
+        sys.exit(1)
+    
+    class AgentServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('graceful_timeout', SERVE_GRACEFUL_TIMEOUT)
+            # Streams (SSE) can stay open far longer than gunicorn's default 30 s
+            self.cfg.set('timeout', 0)
+            self.cfg.set('post_worker_init', lambda worker: prepare_worker())
+            self.cfg.set('worker_exit', lambda server, worker: shutdown_worker())
+        
+        def load(self):
+            return app
+    
+    print(f"🌐 Serving on http://{host}:{port} with {workers} worker(s) x {threads} thread(s)")
+    AgentServer().run()
+
+def _arg_value(name: str, default: int) -> int:
+    """Integer value of a `--name N` command line option"""
+    if name in sys.argv[:-1]:
+        return int(sys.argv[sys.argv.index(name) + 1])
+    return default
+
 def main():
     """Main application entry point"""
     print("🤖 Starting AI Agent Terminal...")
@@ -176,12 +629,27 @@ def main():
     print("🛠️  System Commands: src/tools/system_commands.py")
     print("-" * 50)
     
+    # Probe the system once up front so the first /api/system-info poll is served from cache
+    get_fingerprint()
+    
+    # --serve runs headless under a production server; each worker loads the history
+    # itself in prepare_worker, after the fork, so the master starts no threads
+    if '--serve' in sys.argv:
+        serve(
+            port=_arg_value('--port', SERVE_PORT),
+            workers=_arg_value('--workers', SERVE_WORKERS),
+            threads=_arg_value('--threads', SERVE_THREADS)
+        )
+        return
+    
+    # A long history takes a moment to index; do it alongside instead of on the first completion
+    threading.Thread(target=history.load, daemon=True).start()
+    
     # Check if --no-webview flag is passed
-    import sys
     if '--no-webview' in sys.argv:
         print("🌐 Starting Flask server only (no webview)")
-        print("🔗 Open http://127.0.0.1:5000 in your browser")
-        app.run(host='127.0.0.1', port=5000, debug=False)
+        print(f"🔗 Open http://{SERVE_HOST}:{SERVE_PORT} in your browser")
+        app.run(host=SERVE_HOST, port=SERVE_PORT, debug=False, threaded=True)
         return
     
     # Start Flask server in a separate thread
@@ -195,8 +663,10 @@ def main():
     print("🌐 Flask server started on http://127.0.0.1:5000")
     print("🚀 Opening webview window...")
     
-    # Create and start the webview with Qt GUI explicitly
-    create_webview_window()
+    # Create and start the webview with Qt GUI explicitly. Imported here so the
+    # headless modes don't load the GUI toolkit
+    import webview
+    create_webview_window(webview)
     webview.start(gui='qt', debug=False)
 
 if __name__ == '__main__':
@@ -0,0 +1,222 @@
+"""Offline latency benchmarks for the agent graph, the HTTP endpoints and every agent tool.
+
+The agent runs on the deterministic fake chat model (src/fake_llm.py) and web_search
+on the local stub server, so no API key or network access is needed. Save a run with
+--json and pass it to --compare on the next run to fail on regressions:
+
+    python benchmarks/bench_agent.py --rounds 50
+    python benchmarks/bench_agent.py --rounds 50 --json baseline.json
+    python benchmarks/bench_agent.py --rounds 50 --compare baseline.json --max-slowdown 1.25
+    python benchmarks/bench_agent.py --only graph --llm-delay 0.05
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from stub_search_server import serve_in_thread
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _measure(func, rounds: int, warmup: int = 1) -> dict:
+    for i in range(warmup):
+        func(-1 - i)
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "rounds": rounds,
+        "min": samples[0],
+        "p50": statistics.median(samples),
+        "p95": samples[max(0, int(len(samples) * 0.95) - 1)],
+        "max": samples[-1],
+        "ops": rounds / sum(samples),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def _graph_cases(args):
+    from src import agent
+    from src.fake_llm import fake_chat_model
+    from src.tools.session import sessions, use_session
+
+    scripts = {
+        "graph/reply": [],
+        "graph/one-tool": [[{"name": "calculator", "args": {"expression": "sqrt(2) * 3"}}], "It is 4.24."],
+        "graph/parallel-tools": [
+            [{"name": "detect_system"}, {"name": "get_system_info"},
+             {"name": "calculator", "args": {"expression": "2 ** 64"}}],
+            "Here is what I found."
+        ],
+        "graph/run-command": [[{"name": "run_command", "args": {"command": "echo hi"}}], "It printed hi."],
+    }
+
+    def case(name, script):
+        def run(i):
+            agent.set_llm(fake_chat_model(script=script, delay=args.llm_delay))
+            with use_session(sessions.get(f"bench-{name.replace('/', '-')}")):
+                for _ in agent.stream_agent_events(f"benchmark question number {i}"):
+                    pass
+        return run
+
+    return [(name, case(name, script)) for name, script in scripts.items()]
+
+def _http_cases(args):
+    from app import app
+    from src import agent
+    from src.fake_llm import fake_chat_model
+
+    client = app.test_client()
+    headers = {"X-Session-ID": "bench-http"}
+
+    def post(path, body):
+        response = client.post(path, json=body, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    def ai(i):
+        agent.set_llm(fake_chat_model(script=[], delay=args.llm_delay))
+        post("/api/ai", {"query": f"benchmark question number {i}"})
+
+    def system_info(i):
+        response = client.get("/api/system-info", headers=headers)
+        assert response.status_code == 200
+
+    return [
+        ("http/ai", ai),
+        ("http/command", lambda i: post("/api/command", {"command": "echo hi"})),
+        # Twenty commands in one request, against twenty /api/command round trips
+        ("http/batch", lambda i: post("/api/batch", {"operations": [
+            {"op": "command", "command": f"echo {n}"} for n in range(20)
+        ]})),
+        ("http/system-info", system_info),
+    ]
+
+def _tool_cases(args):
+    from src import tools
+    from src.tools.output_capture import OutputCapture
+    from src.tools.session import sessions, use_session
+
+    session = sessions.get("bench-tools")
+    root = str(Path(__file__).parent.parent)
+
+    # A spilled output for read_output to page through
+    capture = OutputCapture()
+    for line in range(200_000):
+        capture.write(f"line {line} of benchmark output\n".encode())
+    capture.close()
+
+    # One finished job for the job_* tools to look at
+    with use_session(session):
+        started = tools.start_job.invoke({"command": "seq 1000"})
+    job_id = re.search(r"Started job (\w+)", started).group(1)
+
+    calls = {
+        "calculator": lambda i: {"expression": f"sqrt({i + 2}) * 3"},
+        "detect_system": lambda i: {},
+        "get_system_info": lambda i: {},
+        "list_directory": lambda i: {"path": root},
+        "index_files": lambda i: {"path": root},
+        # Warm index after the first round, so this is the query path plus the refresh check
+        "search_files": lambda i: {"query": "def main", "path": root},
+        "run_command": lambda i: {"command": "echo hi"},
+        # A new query every round measures the uncached path against the stub server
+        "web_search": lambda i: {"query": f"benchmark query {i}"},
+        "read_output": lambda i: {"output_id": capture.output_id, "start_line": 150_000, "max_lines": 200},
+        "start_job": lambda i: {"command": "true"},
+        "job_status": lambda i: {"job_id": job_id},
+        "job_output": lambda i: {"job_id": job_id, "lines": 50},
+        "list_jobs": lambda i: {},
+        "cancel_job": lambda i: {"job_id": job_id},
+    }
+
+    def case(tool, make_args):
+        def run(i):
+            with use_session(session):
+                tool.invoke(make_args(i))
+        return run
+
+    return [(f"tool/{name}", case(getattr(tools, name), make_args)) for name, make_args in calls.items()]
+
+def _print_table(results: dict):
+    print(f"{'benchmark':<24}{'rounds':>7}{'min ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"
+          f"{'ops/s':>10}{'peak RSS MB':>13}")
+    for name, stats in results.items():
+        print(f"{name:<24}{stats['rounds']:>7}{stats['min'] * 1000:>10.3f}{stats['p50'] * 1000:>10.3f}"
+              f"{stats['p95'] * 1000:>10.3f}{stats['max'] * 1000:>10.3f}{stats['ops']:>10.1f}"
+              f"{stats['peak_rss_mb']:>13.1f}")
+
+def _regressions(results: dict, baseline: dict, max_slowdown: float, min_delta: float) -> list:
+    slower = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["p50"]
+        # Sub-millisecond cases are too noisy for a ratio alone
+        if stats["p50"] > before * max_slowdown and stats["p50"] - before > min_delta:
+            slower.append(f"{name}: p50 {stats['p50'] * 1000:.3f} ms vs {baseline[name]['p50'] * 1000:.3f} ms")
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--only", choices=["graph", "http", "tool"], help="run one group of benchmarks")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds per fake model call")
+    parser.add_argument("--search-delay", type=float, default=0.0, help="stub search server delay in seconds")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare p50 latencies with")
+    parser.add_argument("--max-slowdown", type=float, default=1.25, help="allowed p50 ratio against --compare")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="p50 increases smaller than this are never reported")
+    args = parser.parse_args()
+
+    # Must be set before the agent and tool modules read them at import time
+    scratch = tempfile.mkdtemp(prefix="bench-agent-")
+    server = serve_in_thread(delay=args.search_delay)
+    os.environ.update({
+        "AGENT_CHAT_MODEL": "fake",
+        "AGENT_CHECKPOINT_DB": os.path.join(scratch, "checkpoints.sqlite"),
+        "AGENT_OUTPUT_DIR": os.path.join(scratch, "output"),
+        "AGENT_INDEX_DIR": os.path.join(scratch, "index"),
+        # Every round should go through the model, not the reply cache or the command router
+        "AGENT_RESPONSE_CACHE": "0",
+        "AGENT_ROUTER": "0",
+        "WEB_SEARCH_ENDPOINT": f"http://127.0.0.1:{server.server_port}/",
+        "WEB_SEARCH_CACHE_PATH": "",
+    })
+
+    groups = {"graph": _graph_cases, "http": _http_cases, "tool": _tool_cases}
+    results = {}
+    for group, make_cases in groups.items():
+        if args.only and group != args.only:
+            continue
+        for name, func in make_cases(args):
+            results[name] = _measure(func, args.rounds)
+
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = _regressions(results, json.load(f), args.max_slowdown, args.min_delta_ms / 1000)
+        for line in slower:
+            print(f"REGRESSION {line}")
+        if slower:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Measure response cache lookup latency for exact, near-duplicate and missing prompts.
+
+    python benchmarks/bench_response_cache.py --entries 256 --lookups 2000
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.response_cache import ResponseCache
+
+def _lookup_times(cache, prompts, context):
+    samples = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        cache.get(prompt, context)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=256)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.8, help="similarity threshold for near-duplicates")
+    args = parser.parse_args()
+
+    context = ("/home/user", "Debian/Ubuntu")
+    # Near-duplicate matching is off by default; turn it on to measure it
+    cache = ResponseCache(max_entries=args.entries, ttl=3600, threshold=args.threshold)
+    prompts = [f"how much space does volume {i} have left" for i in range(args.entries)]
+    for prompt in prompts:
+        cache.put(prompt, context, "reply")
+
+    picks = [prompts[i % len(prompts)] for i in range(args.lookups)]
+    cases = (
+        ("exact", picks),
+        # Normalization makes case, spacing and punctuation differences exact hits
+        ("normalized", [f"  {prompt.upper()}?" for prompt in picks]),
+        # Extra filler words miss the exact key and go through the similarity search
+        ("near", [f"please tell me {prompt}" for prompt in picks]),
+        ("miss", [f"unrelated question number {i}" for i in range(args.lookups)]),
+    )
+    for name, lookups in cases:
+        samples = sorted(_lookup_times(cache, lookups, context))
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"{name:>10}: p50 {statistics.median(samples) * 1e6:8.1f} us   p95 {p95 * 1e6:8.1f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure requests/sec of /api/command and /api/system-info under the dev server and --serve.
+
+    python benchmarks/bench_serve.py --mode dev
+    python benchmarks/bench_serve.py --mode serve --workers 1 --threads 16
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).parent.parent
+
+ENDPOINTS = {
+    "/api/system-info": ("GET", None),
+    "/api/command": ("POST", {"command": "echo hi"}),
+}
+
+def _start_server(args) -> subprocess.Popen:
+    command = [sys.executable, "app.py"]
+    if args.mode == "dev":
+        command.append("--no-webview")
+    else:
+        command += ["--serve", "--workers", str(args.workers), "--threads", str(args.threads)]
+    env = dict(os.environ, AGENT_PORT=str(args.port))
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{args.port}/api/system-info", timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.kill()
+    sys.exit("server did not come up")
+
+def _client(url: str, method: str, body: dict, session_id: str, stop: float, latencies: list):
+    http = requests.Session()
+    headers = {"X-Session-ID": session_id}
+    while time.monotonic() < stop:
+        start = time.perf_counter()
+        response = http.request(method, url, json=body, headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("dev", "serve"), default="serve")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--clients", type=int, default=16, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per endpoint")
+    args = parser.parse_args()
+
+    server = _start_server(args)
+    try:
+        for path, (method, body) in ENDPOINTS.items():
+            url = f"http://127.0.0.1:{args.port}{path}"
+            stop = time.monotonic() + args.duration
+            latencies = []
+            clients = [
+                threading.Thread(target=_client, args=(url, method, body, f"bench{i}", stop, latencies))
+                for i in range(args.clients)
+            ]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{path:>17}: {len(latencies) / args.duration:8.1f} req/s   "
+                  f"p50 {statistics.median(latencies) * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms")
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Measure cold import time of the app using python -X importtime.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --module src.agent --top 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+def _import_once(module: str) -> tuple:
+    """Import module in a fresh interpreter; returns (wall seconds, {module: cumulative us})."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    elapsed = time.perf_counter() - start
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Only top-level packages, so nested modules are not counted twice
+        name = name.strip()
+        top = name.split(".")[0]
+        if name == top:
+            cumulative[top] = max(cumulative.get(top, 0), int(cumulative_us))
+    return elapsed, cumulative
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    args = parser.parse_args()
+
+    # The first run warms the OS file cache and .pyc files
+    _import_once(args.module)
+    runs = [_import_once(args.module) for _ in range(args.runs)]
+
+    walls = [wall for wall, _ in runs]
+    print(f"import {args.module}: median {statistics.median(walls) * 1000:.0f} ms, "
+          f"min {min(walls) * 1000:.0f} ms over {args.runs} runs (interpreter start included)")
+
+    totals = runs[-1][1]
+    print(f"\nslowest top-level imports (last run):")
+    for name, micros in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
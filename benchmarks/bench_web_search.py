@@ -0,0 +1,45 @@
+"""Measure web_search cache hit vs. miss latency against the local stub server.
+
+    python benchmarks/bench_web_search.py --queries 50 --delay 0.2
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from stub_search_server import serve_in_thread
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.2, help="stub server response delay in seconds")
+    args = parser.parse_args()
+
+    server = serve_in_thread(delay=args.delay)
+    # Must be set before the tool module reads it at import time
+    os.environ["WEB_SEARCH_ENDPOINT"] = f"http://127.0.0.1:{server.server_port}/"
+    from src.tools.web_search import web_search
+
+    queries = [f"benchmark query {i}" for i in range(args.queries)]
+    misses = [_timed(web_search.invoke, query) for query in queries]
+    # Same queries with different case and spacing hit the normalized cache key
+    hits = [_timed(web_search.invoke, "  " + query.upper() + " ") for query in queries]
+
+    for name, samples in (("miss", misses), ("hit", hits)):
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"{name:>4}: p50 {statistics.median(samples) * 1000:9.3f} ms   p95 {p95 * 1000:9.3f} ms")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Local stand-in for the DuckDuckGo Instant Answer API.
+
+Serves canned JSON after an artificial delay so web_search can be benchmarked
+offline. Run it directly, or use serve_in_thread() from another script:
+
+    python benchmarks/stub_search_server.py --port 8765 --delay 0.2
+    WEB_SEARCH_ENDPOINT=http://127.0.0.1:8765/ python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+def make_handler(delay: float):
+    class StubSearchHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+            time.sleep(delay)
+            body = json.dumps({
+                "Abstract": f"Stub abstract for {query}.",
+                "AbstractURL": "https://example.com/stub",
+                "RelatedTopics": [{"Text": f"Related topic {i} for {query}"} for i in range(3)],
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubSearchHandler
+
+def serve_in_thread(port: int = 0, delay: float = 0.2) -> ThreadingHTTPServer:
+    """Start the stub server on a daemon thread and return it (server_port holds the port)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.2, help="seconds to wait before answering")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.delay))
+    print(f"Stub search API on http://127.0.0.1:{args.port}/ (delay {args.delay}s)")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,96 @@
 class TerminalApp {
     constructor() {
-        this.commandHistory = JSON.parse(localStorage.getItem('commandHistory') || '[]');
+        // Recent commands for arrow-key navigation; the full history lives on the server
+        this.commandHistory = [];
         this.historyIndex = -1;
+        this.maxLocalHistory = 1000;
         this.isProcessing = false;
+        this.maxStreamChars = 1000000;
+        this.jobPollInterval = 1000;
+        // Persistent connection to the server, null while it is down
+        this.socket = null;
+        this.socketRequests = new Map();
+        this.nextRequestId = 1;
+        this.socketRetryDelay = 1000;
+        // Jobs whose output is already being shown, so their completion isn't announced twice
+        this.followedJobs = new Set();
         
         this.initializeElements();
         this.bindEvents();
-        this.loadHistory();
+        // The history request sets the session cookie the socket handshake then carries
+        this.loadHistory().then(() => this.connectSocket());
+    }
+
+    connectSocket() {
+        // One connection carries commands, AI queries, their output and job notifications.
+        // Until it is open, or if the server has no WebSocket support, requests use fetch
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        let socket;
+        try {
+            socket = new WebSocket(`${protocol}//${location.host}/ws`);
+        } catch (error) {
+            return;
+        }
+
+        let opened = false;
+        socket.onopen = () => {
+            opened = true;
+            this.socket = socket;
+            this.socketRetryDelay = 1000;
+        };
+        socket.onmessage = (message) => this.handleSocketMessage(JSON.parse(message.data));
+        socket.onclose = () => {
+            this.socket = null;
+            // Requests in flight on this connection won't get any more events
+            for (const pending of this.socketRequests.values()) {
+                pending.onEvent('error', { error: 'Connection to the server was lost' });
+                pending.resolve();
+            }
+            this.socketRequests.clear();
+
+            // A server without WebSocket support refuses the first attempt; stay on fetch then
+            if (opened) {
+                setTimeout(() => this.connectSocket(), this.socketRetryDelay);
+                this.socketRetryDelay = Math.min(this.socketRetryDelay * 2, 30000);
+            }
+        };
+    }
+
+    socketRequest(type, payload, onEvent) {
+        // Resolves once the server sends the request's end frame
+        const id = String(this.nextRequestId++);
+        return new Promise((resolve) => {
+            this.socketRequests.set(id, { onEvent, resolve });
+            this.socket.send(JSON.stringify({ id, type, ...payload }));
+        });
+    }
+
+    handleSocketMessage(frame) {
+        if (frame.id === undefined || frame.id === null) {
+            // Notifications the server pushes on its own
+            if (frame.event === 'job_finished') {
+                this.announceJob(frame.data);
+            }
+            return;
+        }
+
+        const pending = this.socketRequests.get(frame.id);
+        if (!pending) return;
+        if (frame.event === 'end') {
+            this.socketRequests.delete(frame.id);
+            pending.resolve();
+        } else {
+            pending.onEvent(frame.event, frame.data);
+        }
+    }
+
+    announceJob(job) {
+        if (this.followedJobs.has(job.id)) return;
+        const exit = job.exit_code !== null ? ` (exit code ${job.exit_code})` : '';
+        this.addOutputToTerminal(
+            `Background job ${job.id} ${job.status}${exit}: ${job.command}`,
+            job.status === 'succeeded' ? 'success' : 'error'
+        );
     }
 
     initializeElements() {
@@ -29,6 +113,9 @@ class TerminalApp {
             } else if (e.key === 'ArrowDown') {
                 e.preventDefault();
                 this.navigateHistory('down');
+            } else if (e.key === 'Tab') {
+                e.preventDefault();
+                this.completeInput();
             }
         });
 
@@ -61,7 +148,6 @@ class TerminalApp {
         this.setProcessing(true);
 
         try {
-            let result;
             if (command.toLowerCase() === 'clear') {
                 this.clearTerminal();
                 this.setProcessing(false);
@@ -71,12 +157,10 @@ class TerminalApp {
             // Check if it's a gem (AI) command
             if (command.toLowerCase().startsWith('gem ')) {
                 const query = command.substring(4).trim();
-                result = await this.executeAICommand(query);
-                this.addOutputToTerminal(result, 'ai-response');
+                await this.executeAICommand(query);
             } else {
-                // Execute system command
-                result = await this.executeSystemCommand(command);
-                this.addOutputToTerminal(result, result.includes('Error') ? 'error' : 'success');
+                // Execute system command, rendering output as it streams in
+                await this.executeSystemCommand(command);
             }
         } catch (error) {
             this.addOutputToTerminal(`Error: ${error.message}`, 'error');
@@ -86,8 +170,14 @@ class TerminalApp {
     }
 
     async executeSystemCommand(command) {
+        if (this.socket) {
+            const outputDiv = this.addOutputToTerminal('', 'streaming');
+            await this.socketRequest('command', { command }, this.commandEventHandler(outputDiv));
+            return;
+        }
+
         try {
-            const response = await fetch('/api/command', {
+            const response = await fetch('/api/command/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -95,16 +185,136 @@ class TerminalApp {
                 body: JSON.stringify({ command })
             });
 
-            const data = await response.json();
-            return data.result || data.error || 'Command executed';
+            if (!response.ok || !response.body) {
+                const data = await response.json();
+                this.addOutputToTerminal(data.error || 'Command failed', 'error');
+                return;
+            }
+
+            const outputDiv = this.addOutputToTerminal('', 'streaming');
+            await this.readEventStream(response, this.commandEventHandler(outputDiv));
         } catch (error) {
-            return `Network error: ${error.message}`;
+            this.addOutputToTerminal(`Network error: ${error.message}`, 'error');
+        }
+    }
+
+    commandEventHandler(outputDiv) {
+        // Renders a command's events, whether they come over the socket or an event stream
+        return (event, data) => {
+            if (event === 'output') {
+                this.appendStreamText(outputDiv, data.text);
+            } else if (event === 'job') {
+                // Long running commands (sudo) continue in the background; keep the prompt free
+                this.appendStreamText(outputDiv, `Started background job ${data.id}\n`);
+                this.followJob(data.id, outputDiv);
+            } else if (event === 'error') {
+                this.appendStreamText(outputDiv, `\n${data.error}\n`);
+                outputDiv.className = 'output error';
+            } else if (event === 'exit') {
+                if (!outputDiv.hasChildNodes()) {
+                    this.appendStreamText(outputDiv, 'Command completed successfully (no output)');
+                }
+                if (!outputDiv.classList.contains('error')) {
+                    outputDiv.className = `output ${data.code === 0 ? 'success' : 'error'}`;
+                }
+            }
+        };
+    }
+
+    async followJob(jobId, outputDiv) {
+        // Poll a background job, appending its output until it finishes
+        this.followedJobs.add(jobId);
+        let offset = 0;
+        while (true) {
+            try {
+                const response = await fetch(`/api/jobs/${jobId}?offset=${offset}`);
+                const data = await response.json();
+                if (!response.ok) {
+                    this.appendStreamText(outputDiv, `\n${data.error}\n`);
+                    outputDiv.className = 'output error';
+                    return;
+                }
+
+                if (data.skipped > 0) {
+                    this.appendStreamText(outputDiv, `\n... [${data.skipped} bytes skipped] ...\n`);
+                }
+                if (data.output) {
+                    this.appendStreamText(outputDiv, data.output);
+                }
+                offset = data.offset;
+
+                if (data.job.status !== 'queued' && data.job.status !== 'running') {
+                    if (data.job.error) {
+                        this.appendStreamText(outputDiv, `\n${data.job.error}\n`);
+                    }
+                    outputDiv.className = `output ${data.job.status === 'succeeded' ? 'success' : 'error'}`;
+                    return;
+                }
+            } catch (error) {
+                this.appendStreamText(outputDiv, `\nLost track of job ${jobId}: ${error.message}\n`);
+                outputDiv.className = 'output error';
+                return;
+            }
+            await new Promise(resolve => setTimeout(resolve, this.jobPollInterval));
+        }
+    }
+
+    async readEventStream(response, onEvent) {
+        // Parse a text/event-stream body incrementally and dispatch each event
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) {
+                        event = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                }
+                onEvent(event, data ? JSON.parse(data) : {});
+            }
         }
     }
 
+    appendStreamText(outputDiv, text) {
+        // Remove the processing indicator as soon as the first output arrives
+        const loadingDots = this.output.querySelector('.loading-dots');
+        if (loadingDots) {
+            loadingDots.remove();
+        }
+
+        outputDiv.appendChild(document.createTextNode(text));
+        outputDiv.streamedLength = (outputDiv.streamedLength || 0) + text.length;
+
+        // Keep the DOM bounded for huge outputs by dropping the oldest chunks
+        while (outputDiv.streamedLength > this.maxStreamChars && outputDiv.childNodes.length > 1) {
+            outputDiv.streamedLength -= outputDiv.firstChild.textContent.length;
+            outputDiv.removeChild(outputDiv.firstChild);
+        }
+        this.scrollToBottom();
+    }
+
     async executeAICommand(query) {
+        if (this.socket) {
+            await this.socketRequest('ai', { query }, this.aiEventHandler());
+            return;
+        }
+
         try {
-            const response = await fetch('/api/ai', {
+            const response = await fetch('/api/ai/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -112,13 +322,43 @@ class TerminalApp {
                 body: JSON.stringify({ query })
             });
 
-            const data = await response.json();
-            return data.result || data.error || 'AI query processed';
+            if (!response.ok || !response.body) {
+                const data = await response.json();
+                this.addOutputToTerminal(data.error || 'AI query failed', 'error');
+                return;
+            }
+
+            await this.readEventStream(response, this.aiEventHandler());
         } catch (error) {
-            return `AI service error: ${error.message}`;
+            this.addOutputToTerminal(`AI service error: ${error.message}`, 'error');
         }
     }
 
+    aiEventHandler() {
+        // Tokens go into the current response block; tool activity starts a new one
+        let responseDiv = null;
+        return (event, data) => {
+            if (event === 'token') {
+                if (!responseDiv) {
+                    responseDiv = this.addOutputToTerminal('', 'ai-response');
+                }
+                this.appendStreamText(responseDiv, data.text);
+            } else if (event === 'tool_call') {
+                this.addOutputToTerminal(`⚙ ${data.name}(${JSON.stringify(data.args)})`, 'tool-progress');
+                responseDiv = null;
+            } else if (event === 'tool_result') {
+                this.addOutputToTerminal(`✓ ${data.name} finished`, 'tool-progress');
+                responseDiv = null;
+            } else if (event === 'done') {
+                if (!responseDiv) {
+                    this.addOutputToTerminal(data.result, 'ai-response');
+                }
+            } else if (event === 'error') {
+                this.addOutputToTerminal(data.error, 'error');
+            }
+        };
+    }
+
     addCommandToOutput(command) {
         const commandDiv = document.createElement('div');
         commandDiv.className = 'command-line';
@@ -142,6 +382,7 @@ class TerminalApp {
         
         this.output.appendChild(outputDiv);
         this.scrollToBottom();
+        return outputDiv;
     }
 
     highlightSyntax(command) {
@@ -177,12 +418,67 @@ class TerminalApp {
     addToHistory(command) {
         if (command && this.commandHistory[this.commandHistory.length - 1] !== command) {
             this.commandHistory.push(command);
-            if (this.commandHistory.length > 100) {
-                this.commandHistory.shift();
+            if (this.commandHistory.length > this.maxLocalHistory * 2) {
+                this.commandHistory.splice(0, this.commandHistory.length - this.maxLocalHistory);
             }
-            localStorage.setItem('commandHistory', JSON.stringify(this.commandHistory));
         }
         this.historyIndex = -1;
+
+        // Recorded on the server, which counts repeats for completion ranking
+        if (this.socket) {
+            this.socketRequest('history', { command }, () => {});
+            return;
+        }
+        fetch('/api/history', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ command })
+        }).catch(() => {});
+    }
+
+    async completeInput() {
+        const line = this.input.value;
+        if (!line.trim() || this.isProcessing) return;
+
+        try {
+            let data = null;
+            if (this.socket) {
+                await this.socketRequest('complete', { line }, (event, payload) => {
+                    if (event === 'completions') data = payload;
+                });
+            } else {
+                const response = await fetch(`/api/complete?line=${encodeURIComponent(line)}`);
+                data = response.ok ? await response.json() : null;
+            }
+            if (!data || this.input.value !== line) return;
+
+            // Completions of the current word first, then whole earlier commands
+            const options = [...new Set([...data.completions, ...data.history])];
+            if (options.length === 1) {
+                this.input.value = options[0];
+            } else if (options.length > 1) {
+                const common = this.commonPrefix(options);
+                if (common.length > line.length) {
+                    this.input.value = common;
+                } else {
+                    this.addOutputToTerminal(options.join('\n'), 'completions');
+                }
+            }
+        } catch (error) {
+            // Completion is best effort; keep the input as typed
+        }
+    }
+
+    commonPrefix(strings) {
+        let prefix = strings[0];
+        for (const string of strings.slice(1)) {
+            while (!string.startsWith(prefix)) {
+                prefix = prefix.slice(0, -1);
+            }
+        }
+        return prefix;
     }
 
     navigateHistory(direction) {
@@ -223,7 +519,18 @@ class TerminalApp {
         this.addOutputToTerminal(historyText, '');
     }
 
-    loadHistory() {
+    async loadHistory() {
+        try {
+            const response = await fetch(`/api/history?limit=${this.maxLocalHistory}`);
+            const data = await response.json();
+            if (response.ok) {
+                // Commands entered while the request was in flight go after the loaded ones
+                this.commandHistory = data.history.concat(this.commandHistory);
+            }
+        } catch (error) {
+            // Navigation still works for commands entered from now on
+        }
+
         // Display welcome message with some recent history if available
         if (this.commandHistory.length > 0) {
             const recentCommands = this.commandHistory.slice(-3);
@@ -3,72 +3,117 @@ from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
+import asyncio
 import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
 from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, RemoveMessage, ToolMessage
 # Handle both relative and absolute imports
 try:
-    from .tools import web_search, calculator, list_directory, run_command, detect_system, get_system_info
+    from .context import build_context, estimate_tokens, CONTEXT_TOKEN_BUDGET
+    from .memory import open_checkpointer, prune_checkpoints
+    from .response_cache import response_cache, CACHE_ENABLED, CACHEABLE_TOOLS
+    from .router import route
+    from .summarizer import fold_messages, needs_compaction, compact_summary
+    from .tools import web_search, calculator, list_directory, search_files, index_files, run_command, detect_system, get_system_info, read_output, start_job, job_status, job_output, cancel_job, list_jobs
+    from .tools.async_runtime import iterate_sync, run_sync
+    from .tools.fingerprint import get_fingerprint
+    from .tools.metrics import timed, record, record_tokens, METRICS_ENABLED
+    from .tools.session import current_session
 except ImportError:
-    from tools import web_search, calculator, list_directory, run_command, detect_system, get_system_info
-import requests
-import json
+    from context import build_context, estimate_tokens, CONTEXT_TOKEN_BUDGET
+    from memory import open_checkpointer, prune_checkpoints
+    from response_cache import response_cache, CACHE_ENABLED, CACHEABLE_TOOLS
+    from router import route
+    from summarizer import fold_messages, needs_compaction, compact_summary
+    from tools import web_search, calculator, list_directory, search_files, index_files, run_command, detect_system, get_system_info, read_output, start_job, job_status, job_output, cancel_job, list_jobs
+    from tools.async_runtime import iterate_sync, run_sync
+    from tools.fingerprint import get_fingerprint
+    from tools.metrics import timed, record, record_tokens, METRICS_ENABLED
+    from tools.session import current_session
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Any init_chat_model identifier, or "fake" for the offline model in fake_llm.py
+CHAT_MODEL = os.getenv("AGENT_CHAT_MODEL", "google_genai:gemini-2.0-flash")
+# Messages kept in a thread's checkpointed state; older turns are removed
+MAX_HISTORY_MESSAGES = int(os.getenv("AGENT_MAX_HISTORY_MESSAGES", "50"))
+
 class State(TypedDict):
     messages: Annotated[list, add_messages]
     conversation_summary: str
+    # Id of the last message folded into conversation_summary
+    summary_cursor: str
 
-# Global conversation history for persistence
-conversation_history = []
-conversation_summary = ""
+def _turn_starts(messages: list) -> list:
+    """Indexes of the HumanMessages that open each turn."""
+    return [i for i, msg in enumerate(messages) if isinstance(msg, HumanMessage)]
 
-def summarize_conversation(messages: list) -> str:
-    """Summarize the conversation to maintain context without storing all messages."""
-    if len(messages) < 4:  # Don't summarize very short conversations
-        return ""
-    
-    # Extract key points from recent conversation
-    summary_points = []
-    for msg in messages[-6:]:  # Last 6 messages
-        if isinstance(msg, HumanMessage):
-            summary_points.append(f"User asked: {msg.content[:100]}...")
-        elif isinstance(msg, AIMessage) and hasattr(msg, 'content') and msg.content:
-            summary_points.append(f"Assistant responded about: {msg.content[:100]}...")
-    
-    return "Recent conversation context: " + " | ".join(summary_points[-4:])  # Keep last 4 points
+def trim_history(messages: list, limit: int = MAX_HISTORY_MESSAGES) -> list:
+    """RemoveMessages that drop the oldest whole turns until at most `limit` messages remain."""
+    if len(messages) <= limit:
+        return []
+    cut = next((i for i in _turn_starts(messages) if len(messages) - i <= limit), None)
+    if cut is None:
+        return []
+    return [RemoveMessage(id=msg.id) for msg in messages[:cut]]
 
-tools = [web_search, calculator, list_directory, run_command, detect_system, get_system_info]
+tools = [web_search, calculator, list_directory, search_files, index_files, run_command, detect_system, get_system_info, read_output,
+         start_job, job_status, job_output, cancel_job, list_jobs]
 
-graph_builder = StateGraph(State)
+# The chat model, checkpointer and compiled graph are created on the first AI request,
+# so importing this module (and the terminal-only endpoints) stays cheap
+_llm = None
+_llm_with_tools = None
+_llm_lock = threading.Lock()
+_checkpointer = None
+_graph = None
+_graph_lock = None
 
+def get_llm():
+    """The chat model, created on first use."""
+    global _llm, _llm_with_tools
+    with _llm_lock:
+        if _llm is None:
+            if CHAT_MODEL == "fake":
+                try:
+                    from .fake_llm import fake_chat_model
+                except ImportError:
+                    from fake_llm import fake_chat_model
+                llm = fake_chat_model()
+            else:
+                from langchain.chat_models import init_chat_model
+                llm = init_chat_model(CHAT_MODEL)
+            _llm_with_tools = llm.bind_tools(tools)
+            _llm = llm
+    return _llm
 
-llm = init_chat_model("google_genai:gemini-2.0-flash")
-llm_with_tools = llm.bind_tools(tools)
+def set_llm(llm):
+    """Use llm instead of CHAT_MODEL, e.g. a FakeChatModel in benchmarks."""
+    global _llm, _llm_with_tools
+    with _llm_lock:
+        _llm_with_tools = llm.bind_tools(tools)
+        _llm = llm
 
-def agent_node(state: State):
-    """Main agent node that decides whether to use tools or respond directly."""
-    global conversation_summary
-    
-    messages = state["messages"]
-    current_summary = state.get("conversation_summary", "")
-    
-    # Check if there's already a system message
-    has_system_message = any(isinstance(msg, SystemMessage) for msg in messages)
-    
-    if not has_system_message:
-        system_content = """You are a helpful AI assistant with access to system tools. You MUST use tools when users request system operations:
+SYSTEM_PROMPT = """You are a helpful AI assistant with access to system tools. You MUST use tools when users request system operations:
 
 **ALWAYS use these tools for:**
 - run_command: For ANY system commands, terminal operations, navigation (cd), file operations, administrative tasks
 - list_directory: To show directory contents and file listings  
+- search_files: To find where text or a regex occurs in a directory tree (definitions, config settings) instead of grep -r
+- index_files: To index a large tree ahead of several searches
 - web_search: For current information, news, or facts you're unsure about
 - calculator: For mathematical calculations and computations
 - detect_system: To identify the operating system
 - get_system_info: To get detailed system information
+- read_output: To page through a long command output that was cut short (it gives an output id)
+- start_job: For long-running commands (builds, scans, downloads); runs them in the background, several at once
+- job_status, job_output, cancel_job, list_jobs: To follow up on background jobs and sudo commands by job id
 
 **Answer directly only for:** Pure conversations, explanations of concepts you already know
 
@@ -76,22 +121,55 @@ def agent_node(state: State):
 - When user asks to "cd" or navigate directories, ALWAYS use run_command tool
 - When user asks for system commands, file operations, ALWAYS use run_command tool
 - When user asks to list files or directory contents, use list_directory or run_command tool
+- When user asks where something is defined or mentioned, use search_files rather than grep or find
 - Never say you "cannot" do something if you have a tool that can do it
 - Always try to help by using the appropriate tools"""
 
-        if current_summary:
-            system_content += f"\n\n**Previous conversation context:** {current_summary}"
-        
-        system_msg = SystemMessage(content=system_content)
-        messages = [system_msg] + messages
+@timed("node", "agent")
+async def agent_node(state: State):
+    """Main agent node that decides whether to use tools or respond directly."""
+    history = state["messages"]
+    summary = state.get("conversation_summary", "")
+    cursor = state.get("summary_cursor", "")
+    
+    # The static prompt always comes first so providers can cache it as a prefix
+    history_budget = CONTEXT_TOKEN_BUDGET - estimate_tokens(SYSTEM_PROMPT) - estimate_tokens(summary)
+    context = build_context(history, history_budget)
+    
+    # Messages that no longer fit in the window are folded into the running summary
+    summary, cursor = fold_messages(summary, cursor, history, len(history) - len(context))
     
-    response = llm_with_tools.invoke(messages)
+    system_content = SYSTEM_PROMPT
+    if summary:
+        system_content += f"\n\n**Previous conversation context:** {summary}"
+    messages = [SystemMessage(content=system_content)] + context
     
-    # Update conversation summary if conversation is getting long
-    if len(messages) > 8:
-        conversation_summary = summarize_conversation(messages)
+    if _llm_with_tools is None:
+        # Importing and creating the client is slow, keep it off the event loop
+        await asyncio.to_thread(get_llm)
+    start = time.perf_counter()
+    try:
+        response = await _llm_with_tools.ainvoke(messages)
+    except Exception:
+        if METRICS_ENABLED:
+            record("llm", CHAT_MODEL, time.perf_counter() - start, error=True)
+        raise
+    if METRICS_ENABLED:
+        record("llm", CHAT_MODEL, time.perf_counter() - start)
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            record_tokens(CHAT_MODEL, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+    
+    # Keep the persisted thread bounded once the turn is complete, folding what gets dropped
+    removals = [] if response.tool_calls else trim_history(history)
+    if removals:
+        summary, cursor = fold_messages(summary, cursor, history, len(removals))
     
-    return {"messages": [response], "conversation_summary": conversation_summary}
+    return {
+        "messages": removals + [response],
+        "conversation_summary": summary,
+        "summary_cursor": cursor
+    }
 
 def should_continue(state: State) -> Literal["tools", "end"]:
     """Decide whether to use tools or end the conversation."""
@@ -102,65 +180,265 @@ def should_continue(state: State) -> Literal["tools", "end"]:
         return "tools"
     return "end"
 
-# Create tool node
-tool_node = ToolNode(tools)
+def _build_graph() -> StateGraph:
+    graph_builder = StateGraph(State)
+    
+    # Create tool node. The graph is driven with astream, so independent tool calls in one
+    # AIMessage run concurrently (capped by AGENT_MAX_TOOL_CONCURRENCY, see tools/async_runtime.py)
+    tool_node = ToolNode(tools)
+    
+    # Add nodes to graph
+    graph_builder.add_node("agent", agent_node)
+    graph_builder.add_node("tools", tool_node)
+    
+    # Add edges
+    graph_builder.add_edge(START, "agent")
+    graph_builder.add_conditional_edges(
+        "agent",
+        should_continue,
+        {"tools": "tools", "end": END}
+    )
+    graph_builder.add_edge("tools", "agent")
+    return graph_builder
 
-# Add nodes to graph
-graph_builder.add_node("agent", agent_node)
-graph_builder.add_node("tools", tool_node)
+async def aget_graph():
+    """The compiled graph, built on first use together with the checkpointer.
 
-# Add edges
-graph_builder.add_edge(START, "agent")
-graph_builder.add_conditional_edges(
-    "agent",
-    should_continue,
-    {"tools": "tools", "end": END}
-)
-graph_builder.add_edge("tools", "agent")
+    The chat model is created separately by the first agent step, so turns that the
+    router handles without the model never load it.
+    """
+    global _graph, _graph_lock, _checkpointer
+    if _graph is not None:
+        return _graph
+    if _graph_lock is None:
+        _graph_lock = asyncio.Lock()
+    async with _graph_lock:
+        if _graph is None:
+            # Conversation memory is checkpointed to SQLite, one thread per session
+            _checkpointer = await open_checkpointer()
+            _graph = _build_graph().compile(checkpointer=_checkpointer)
+    return _graph
 
-graph = graph_builder.compile()
+def get_graph():
+    """Synchronous version of aget_graph."""
+    return run_sync(aget_graph())
+
+def close():
+    """Close the checkpoint database if the graph was built."""
+    if _checkpointer is not None:
+        run_sync(_checkpointer.conn.close())
 
 def save_graph_visualization():
-    """Save the graph visualization as PNG file."""
+    """Save the graph visualization as PNG file. Rendering goes through the mermaid.ink web service."""
     try:
-        graph_png = graph.get_graph().draw_mermaid_png()
-        with open("/home/shynneri/Documents/project/ai_agent/graph_visualization.png", "wb") as f:
+        graph_png = get_graph().get_graph().draw_mermaid_png()
+        with open(Path(__file__).parent.parent / "graph_visualization.png", "wb") as f:
             f.write(graph_png)
         print("Graph visualization saved as 'graph_visualization.png'")
     except Exception as e:
         print(f"Could not save graph visualization: {e}")
 
 def stream_graph_updates(user_input: str):
-    global conversation_history, conversation_summary
+    """Run one conversation turn for the current session and print the replies."""
+    for event, payload in stream_agent_events(user_input):
+        if event == "tool_call":
+            print(f"[tool] {payload['name']}({payload['args']})")
+        elif event == "done":
+            print("Assistant:", payload["result"])
+
+def run_agent(user_input: str) -> str:
+    """Run one conversation turn for the current session and return the final reply."""
+    return run_sync(arun_agent(user_input))
+
+async def arun_agent(user_input: str) -> str:
+    """Async version of run_agent."""
+    final_response = ""
+    async for event, payload in astream_agent_events(user_input):
+        if event == "done":
+            final_response = payload["result"]
+    return final_response
+
+def _message_text(content) -> str:
+    """Extract plain text from message content, which may be a string or a list of parts."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+# Background summary compactions in flight, by session id
+_compaction_tasks = {}
+
+async def _compact_thread_summary(session, summary: str):
+    """Replace a thread's summary with an LLM-condensed version."""
+    try:
+        compacted = await compact_summary(get_llm(), summary)
+    except Exception as e:
+        print(f"Could not compact conversation summary: {e}")
+        return
     
-    # Add user message to history
-    user_message = HumanMessage(content=user_input)
-    conversation_history.append(user_message)
+    graph = await aget_graph()
+    config = {"configurable": {"thread_id": session.id}}
+    async with session.turn_lock:
+        state = await graph.aget_state(config)
+        current = state.values.get("conversation_summary", "")
+        # Points folded in while the compaction ran are kept after the condensed part
+        if current.startswith(summary):
+            await graph.aupdate_state(
+                config,
+                {"conversation_summary": compacted + current[len(summary):]},
+                as_node="agent"
+            )
+
+def stream_agent_events(user_input: str, cancelled=None):
+    """Synchronous wrapper around astream_agent_events for WSGI handlers and the CLI.
+
+    Setting the threading.Event cancelled cancels the turn on the loop, stopping a
+    model call or tool that is still running.
+    """
+    return iterate_sync(astream_agent_events(user_input), cancelled)
+
+async def _record_turn(graph, session, turn: list):
+    """Append a turn that did not go through the model to the session's thread.
+
+    Callers hold session.turn_lock. History is trimmed and folded into the summary
+    the same way agent_node does it.
+    """
+    config = {"configurable": {"thread_id": session.id}}
+    state = await graph.aget_state(config)
+    history = state.values.get("messages", []) + turn
+    summary = state.values.get("conversation_summary", "")
+    cursor = state.values.get("summary_cursor", "")
+    removals = trim_history(history)
+    if removals:
+        summary, cursor = fold_messages(summary, cursor, history, len(removals))
+    await graph.aupdate_state(
+        config,
+        {"messages": removals + turn, "conversation_summary": summary, "summary_cursor": cursor},
+        as_node="agent"
+    )
+    await prune_checkpoints(_checkpointer, session.id)
+
+async def _astream_direct_command(session, user_input: str, command: str):
+    """Run a command typed in AI mode without asking the model, and record the exchange
+    in the session's thread as if the model had called run_command."""
+    graph = await aget_graph()
+    call = {"name": "run_command", "args": {"command": command}, "id": f"direct-{uuid.uuid4().hex}"}
     
-    # Use recent messages + summary for context
-    recent_messages = conversation_history[-4:]  # Keep last 4 messages for immediate context
+    async with session.turn_lock:
+        yield "tool_call", {"name": call["name"], "args": call["args"]}
+        output = await run_command.ainvoke(call["args"])
+        yield "tool_result", {"name": call["name"], "content": output[:500]}
+        
+        await _record_turn(graph, session, [
+            HumanMessage(content=user_input, id=str(uuid.uuid4())),
+            AIMessage(content="", tool_calls=[call], id=str(uuid.uuid4())),
+            ToolMessage(content=output, tool_call_id=call["id"], name=call["name"], id=str(uuid.uuid4())),
+            # The output is already in the tool message; repeating it would double its context cost
+            AIMessage(content=f"Ran `{command}` directly, its output is above.", id=str(uuid.uuid4()))
+        ])
     
-    initial_state = {
-        "messages": recent_messages,
-        "conversation_summary": conversation_summary
-    }
+    yield "done", {"result": output}
+
+async def _astream_cached_reply(session, user_input: str, reply: str):
+    """Answer from the response cache and record the exchange in the session's thread."""
+    graph = await aget_graph()
+    async with session.turn_lock:
+        await _record_turn(graph, session, [
+            HumanMessage(content=user_input, id=str(uuid.uuid4())),
+            AIMessage(content=reply, id=str(uuid.uuid4()))
+        ])
+    yield "token", {"text": reply}
+    yield "done", {"result": reply}
+
+def _cache_context(session) -> tuple:
+    """What a cached reply depends on besides the prompt. Replies are never shared between sessions."""
+    fingerprint = get_fingerprint()
+    return (session.id, session.cwd, fingerprint['system'], fingerprint['distribution'],
+            fingerprint['kernel'], fingerprint['hostname'])
+
+async def astream_agent_events(user_input: str):
+    """Run the graph and yield (event, data) pairs as tokens and tool calls happen.
+
+    Events are 'token' (a piece of the assistant reply), 'tool_call', 'tool_result'
+    and a final 'done' carrying the complete reply. Input that is plainly a shell
+    command (see router.py) is run directly, skipping both model round trips, and
+    repeated questions are answered from the response cache.
+    """
+    session = current_session()
+    command = route(user_input, session.cwd)
+    if command is not None:
+        async for item in _astream_direct_command(session, user_input, command):
+            yield item
+        return
+
+    cache_context = _cache_context(session) if CACHE_ENABLED else None
+    cached = response_cache.get(user_input, cache_context) if CACHE_ENABLED else None
+    if cached is not None:
+        async for item in _astream_cached_reply(session, user_input, cached):
+            yield item
+        return
+
+    graph = await aget_graph()
     
-    for event in graph.stream(initial_state):
-        for value in event.values():
-            if "messages" in value:
-                last_msg = value["messages"][-1]
-                if hasattr(last_msg, 'content') and last_msg.content:
-                    print("Assistant:", last_msg.content)
-                    # Add assistant response to history
-                    conversation_history.append(last_msg)
+    # One turn at a time per session so concurrent requests can't interleave its history
+    async with session.turn_lock:
+        # Earlier messages and the summary are restored from the session's checkpoint thread
+        initial_state = {"messages": [HumanMessage(content=user_input)]}
+        config = {"configurable": {"thread_id": session.id}}
+        
+        final_response = ""
+        tools_used = set()
+        async for mode, chunk in graph.astream(initial_state, config, stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                message, metadata = chunk
+                # Only forward tokens produced by the LLM, tool output is reported below
+                if metadata.get("langgraph_node") == "agent":
+                    text = _message_text(message.content)
+                    if text:
+                        yield "token", {"text": text}
+                continue
             
-            # Update summary if provided
-            if "conversation_summary" in value:
-                conversation_summary = value["conversation_summary"]
+            for node, value in chunk.items():
+                if not value:
+                    continue
+                for msg in value.get("messages", []):
+                    if node == "agent":
+                        for tool_call in getattr(msg, "tool_calls", None) or []:
+                            tools_used.add(tool_call["name"])
+                            yield "tool_call", {"name": tool_call["name"], "args": tool_call["args"]}
+                        if msg.content:
+                            final_response = _message_text(msg.content)
+                    elif node == "tools":
+                        yield "tool_result", {
+                            "name": getattr(msg, "name", ""),
+                            "content": _message_text(msg.content)[:500]
+                        }
+        
+        await prune_checkpoints(_checkpointer, session.id)
+        
+        # Replies that depended on a tool with side effects must not be replayed
+        if CACHE_ENABLED and final_response and tools_used <= CACHEABLE_TOOLS:
+            response_cache.put(user_input, cache_context, final_response)
+        
+        state = await graph.aget_state(config)
+        summary = state.values.get("conversation_summary", "")
+        if needs_compaction(summary) and session.id not in _compaction_tasks:
+            # Condense the summary off the critical path; the next turn picks it up
+            task = asyncio.create_task(_compact_thread_summary(session, summary))
+            _compaction_tasks[session.id] = task
+            task.add_done_callback(lambda _: _compaction_tasks.pop(session.id, None))
+        
+        yield "done", {"result": final_response or "I processed your request successfully."}
 
 if __name__ == "__main__":
-    # Save graph visualization on startup
-    save_graph_visualization()
+    # Rendering the PNG needs a network round trip, so it only happens on request
+    if "--save-graph" in sys.argv:
+        save_graph_visualization()
     
     print("AI Assistant started. Type 'quit', 'exit', or 'q' to exit.")
     print("The assistant will remember our conversation context.\n")
@@ -0,0 +1,163 @@
+import json
+import os
+import queue
+import threading
+
+try:
+    from .tools.session import use_session
+except ImportError:
+    from tools.session import use_session
+
+# Frames waiting to be written to one client. A producer that gets this far ahead
+# blocks, which in turn stops it reading its command's output
+SEND_QUEUE_SIZE = int(os.getenv("AGENT_WS_SEND_QUEUE", "256"))
+# Requests one connection may have in flight at once
+MAX_STREAMS = int(os.getenv("AGENT_WS_MAX_STREAMS", "8"))
+# Largest message accepted from a client
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+_CLOSE = object()
+
+class Channel:
+    """One client's WebSocket connection, multiplexing many concurrent requests.
+
+    Every message is one JSON object. Clients send {"id": ..., "type": ..., ...} to start
+    a request of a type in handlers, and {"id": ..., "type": "cancel"} to stop one. The
+    handler's (event, data) pairs come back as {"id": ..., "event": ..., "data": ...}
+    frames, the same events the SSE endpoints send, closed by an "end" frame. Ids are
+    strings or integers. Frames without an id are notifications, see notify.
+
+    Handlers are called as handler(frame, cancelled) and should stop promptly once the
+    threading.Event cancelled is set, even while their command or agent is silent.
+
+    Each request runs on its own thread with the session bound, and a single writer
+    thread owns the socket, draining a bounded queue of outgoing frames.
+    """
+
+    def __init__(self, ws, handlers: dict, session):
+        self.ws = ws
+        self.handlers = handlers
+        self.session = session
+        self.closed = threading.Event()
+        self._outbox = queue.Queue(maxsize=SEND_QUEUE_SIZE)
+        # Request id -> event set to cancel it
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def send(self, frame: dict) -> bool:
+        """Queue a frame, waiting while the queue is full. False once the connection is gone."""
+        data = json.dumps(frame)
+        while not self.closed.is_set():
+            try:
+                self._outbox.put(data, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def notify(self, event: str, data: dict) -> bool:
+        """Queue a notification without waiting; it is dropped if the client is too far behind."""
+        if self.closed.is_set():
+            return False
+        try:
+            self._outbox.put_nowait(json.dumps({"event": event, "data": data}))
+            return True
+        except queue.Full:
+            return False
+
+    def serve(self):
+        """Read requests until the client disconnects, then cancel whatever is still running."""
+        writer = threading.Thread(target=self._write, name="ws-writer", daemon=True)
+        writer.start()
+        try:
+            while not self.closed.is_set():
+                message = self.ws.receive()
+                if message is not None:
+                    self._dispatch(message)
+        except Exception:
+            # The connection closed
+            pass
+        finally:
+            self.closed.set()
+            with self._lock:
+                for cancelled in self._streams.values():
+                    cancelled.set()
+            try:
+                self._outbox.put_nowait(_CLOSE)
+            except queue.Full:
+                pass
+            writer.join(timeout=5)
+
+    def _write(self):
+        try:
+            while True:
+                data = self._outbox.get()
+                if data is _CLOSE:
+                    return
+                self.ws.send(data)
+        except Exception:
+            pass
+        finally:
+            self.closed.set()
+
+    def _dispatch(self, message):
+        if len(message) > MAX_MESSAGE_BYTES:
+            self.send({"event": "error", "data": {"error": f"Message larger than {MAX_MESSAGE_BYTES} bytes"}})
+            return
+        try:
+            frame = json.loads(message)
+            request_id, kind = frame.get("id"), frame.get("type")
+        except (ValueError, AttributeError):
+            self.send({"event": "error", "data": {"error": "Messages must be JSON objects"}})
+            return
+        if request_id is not None and (isinstance(request_id, bool) or not isinstance(request_id, (str, int))):
+            self.send({"event": "error", "data": {"error": "Request ids must be strings or integers"}})
+            return
+
+        if kind == "cancel":
+            with self._lock:
+                cancelled = self._streams.get(request_id)
+            if cancelled is not None:
+                cancelled.set()
+            return
+        if kind == "ping":
+            self.send({"id": request_id, "event": "pong", "data": {}})
+            return
+
+        handler = self.handlers.get(kind)
+        error = None
+        if handler is None:
+            error = f"Unknown request type {kind!r}"
+        elif request_id is None:
+            error = "Requests need an id"
+        else:
+            with self._lock:
+                if request_id in self._streams:
+                    error = f"Request {request_id} is already running"
+                elif len(self._streams) >= MAX_STREAMS:
+                    error = f"At most {MAX_STREAMS} requests can run at once on one connection"
+                else:
+                    self._streams[request_id] = threading.Event()
+        if error:
+            self.send({"id": request_id, "event": "error", "data": {"error": error}})
+            self.send({"id": request_id, "event": "end", "data": {}})
+            return
+
+        threading.Thread(target=self._run, args=(request_id, handler, frame), daemon=True).start()
+
+    def _run(self, request_id, handler, frame: dict):
+        cancelled = self._streams[request_id]
+        with use_session(self.session):
+            events = handler(frame, cancelled)
+            try:
+                for event, data in events:
+                    # The handler watches cancelled itself; this catches the event it was producing
+                    if cancelled.is_set() or not self.send({"id": request_id, "event": event, "data": data}):
+                        break
+            except Exception as e:
+                self.send({"id": request_id, "event": "error", "data": {"error": str(e)}})
+            finally:
+                events.close()
+                with self._lock:
+                    del self._streams[request_id]
+        self.send({"id": request_id, "event": "end", "data": {"cancelled": cancelled.is_set()}})
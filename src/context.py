@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from langchain_core.messages import HumanMessage, ToolMessage
+
+# Tokens of conversation history (system prompt included) sent to the model per call
+CONTEXT_TOKEN_BUDGET = int(os.getenv("AGENT_CONTEXT_TOKENS", "8000"))
+# Tool results larger than this are elided down to their head and tail
+MAX_TOOL_MESSAGE_TOKENS = int(os.getenv("AGENT_MAX_TOOL_TOKENS", "1500"))
+
+# Rough estimate that holds well enough for English text and shell output
+CHARS_PER_TOKEN = 4
+# Role markers and framing the provider adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Token counts remembered by message id
+TOKEN_CACHE_SIZE = 4096
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _content_text(message) -> str:
+    content = message.content
+    text = content if isinstance(content, str) else json.dumps(content, default=str)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        text += json.dumps(tool_calls, default=str)
+    return text
+
+def message_tokens(message) -> int:
+    """Estimated token count of a message, cached by message id."""
+    message_id = getattr(message, "id", None)
+    # Elided copies share the original's id, so the content length is part of the key
+    key = (message_id, len(message.content)) if message_id is not None else None
+    if key is not None:
+        with _token_cache_lock:
+            cached = _token_cache.get(key)
+            if cached is not None:
+                _token_cache.move_to_end(key)
+                return cached
+
+    tokens = estimate_tokens(_content_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+    if key is not None:
+        with _token_cache_lock:
+            _token_cache[key] = tokens
+            if len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return tokens
+
+def elide_tool_message(message, max_tokens: int = MAX_TOOL_MESSAGE_TOKENS):
+    """Shorten a large ToolMessage to its head and tail, leaving other messages untouched."""
+    if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+        return message
+    if message_tokens(message) <= max_tokens:
+        return message
+
+    content = message.content
+    keep = max_tokens * CHARS_PER_TOKEN // 2
+    elided = len(content) - 2 * keep
+    shortened = f"{content[:keep]}\n... [{elided} characters elided] ...\n{content[-keep:]}"
+    return message.model_copy(update={"content": shortened})
+
+def _split_turns(messages: list) -> list:
+    """Group messages into turns, each starting at a HumanMessage."""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+def build_context(messages: list, budget: int = CONTEXT_TOKEN_BUDGET) -> list:
+    """Select the most recent history that fits in a token budget.
+
+    Turns are kept or dropped whole so tool calls always stay paired with their
+    results. The current turn is always included, and large tool results are elided.
+    """
+    turns = _split_turns(messages)
+    selected = []
+    used = 0
+
+    for index, turn in enumerate(reversed(turns)):
+        turn = [elide_tool_message(message) for message in turn]
+        turn_tokens = sum(message_tokens(message) for message in turn)
+        if index > 0 and used + turn_tokens > budget:
+            break
+        selected = turn + selected
+        used += turn_tokens
+
+    return selected
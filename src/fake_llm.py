@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Select this model with AGENT_CHAT_MODEL=fake to run the agent without an API key.
+# The script is a JSON list (inline or a path to a JSON file), see FakeChatModel
+FAKE_SCRIPT = os.getenv("AGENT_FAKE_LLM_SCRIPT", "")
+# Seconds each model call takes, to stand in for network and generation time
+FAKE_DELAY = float(os.getenv("AGENT_FAKE_LLM_DELAY", "0"))
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline chat model for benchmarks and local runs.
+
+    script lists the replies of one turn in order. A string step is a text reply and a
+    list step is a set of tool calls, e.g. [[{"name": "detect_system", "args": {}}], "Done"].
+    Which step to play is derived from the number of AI messages since the last user
+    message, so every turn replays the script from the start and concurrent sessions
+    do not interfere. Once the script is used up, the model echoes the user message.
+    """
+
+    script: list = []
+    delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools, **kwargs):
+        """Tools are not needed to play the script, so the model binds to itself."""
+        return self
+
+    def _reply(self, messages: list) -> AIMessage:
+        step = 0
+        prompt = ""
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                prompt = message.content if isinstance(message.content, str) else ""
+                break
+            if isinstance(message, AIMessage):
+                step += 1
+
+        # Rough token counts, so usage metrics have something to report
+        usage = {"input_tokens": sum(len(str(message.content)) for message in messages) // 4}
+        if step >= len(self.script):
+            reply = AIMessage(content=f"You said: {prompt}")
+        elif isinstance(self.script[step], str):
+            reply = AIMessage(content=self.script[step])
+        else:
+            reply = AIMessage(content="", tool_calls=[
+                {"name": call["name"], "args": call.get("args", {}), "id": f"call_{step}_{index}"}
+                for index, call in enumerate(self.script[step])
+            ])
+        usage["output_tokens"] = len(reply.content) // 4 + 10 * len(reply.tool_calls)
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        reply.usage_metadata = usage
+        return reply
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.delay:
+            time.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        # Streamed like a real provider: text word by word, tool calls in one chunk
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        reply = self._reply(messages)
+        if reply.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(reply.tool_calls)
+            ], usage_metadata=reply.usage_metadata))
+            return
+        words = reply.content.split(" ")
+        for index, word in enumerate(words):
+            last = index == len(words) - 1
+            text = word if last else word + " "
+            # Providers report usage once, with the final chunk
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=text, usage_metadata=reply.usage_metadata if last else None
+            ))
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+def load_script(value: str = FAKE_SCRIPT) -> list:
+    """Parse a fake model script given inline as JSON or as the path of a JSON file."""
+    if not value:
+        return []
+    if not value.lstrip().startswith("["):
+        with open(value, "r") as f:
+            value = f.read()
+    return json.loads(value)
+
+def fake_chat_model(script: list = None, delay: float = None) -> FakeChatModel:
+    """A FakeChatModel configured from the arguments, falling back to the environment."""
+    return FakeChatModel(
+        script=load_script() if script is None else script,
+        delay=FAKE_DELAY if delay is None else delay
+    )
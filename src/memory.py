@@ -0,0 +1,43 @@
+import os
+from pathlib import Path
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+# SQLite database holding LangGraph checkpoints, one thread per session
+CHECKPOINT_DB = os.getenv(
+    "AGENT_CHECKPOINT_DB",
+    str(Path(__file__).parent.parent / "agent_memory.sqlite")
+)
+# Checkpoints kept per thread; older ones are pruned after every turn
+CHECKPOINTS_TO_KEEP = int(os.getenv("AGENT_CHECKPOINTS_TO_KEEP", "10"))
+
+async def open_checkpointer(path: str = CHECKPOINT_DB) -> AsyncSqliteSaver:
+    """Open the checkpoint database and return a saver bound to the running loop.
+
+    WAL mode lets readers proceed while a turn is being written, and synchronous=NORMAL
+    makes the commit at the end of every graph step cheap.
+    """
+    conn = await aiosqlite.connect(path)
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    checkpointer = AsyncSqliteSaver(conn)
+    await checkpointer.setup()
+    return checkpointer
+
+async def prune_checkpoints(checkpointer: AsyncSqliteSaver, thread_id: str, keep: int = CHECKPOINTS_TO_KEEP):
+    """Delete all but the newest `keep` checkpoints (and their pending writes) of a thread."""
+    # Checkpoint ids are time-ordered, so the newest sort last
+    keep_query = (
+        "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? "
+        "ORDER BY checkpoint_id DESC LIMIT ?"
+    )
+    async with checkpointer.lock:
+        await checkpointer.conn.execute(
+            f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN ({keep_query})",
+            (thread_id, thread_id, keep)
+        )
+        await checkpointer.conn.execute(
+            f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN ({keep_query})",
+            (thread_id, thread_id, keep)
+        )
+        await checkpointer.conn.commit()
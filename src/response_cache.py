@@ -0,0 +1,155 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# NumPy is optional; without it only exact (normalized) repeats are served from the cache
+# even when near-duplicate matching is turned on
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Set AGENT_RESPONSE_CACHE=0 to always ask the model
+CACHE_ENABLED = os.getenv("AGENT_RESPONSE_CACHE", "1") != "0"
+CACHE_TTL = float(os.getenv("AGENT_RESPONSE_CACHE_TTL", "600"))
+CACHE_SIZE = int(os.getenv("AGENT_RESPONSE_CACHE_SIZE", "256"))
+# Cosine similarity above which a differently worded prompt may count as the same question.
+# 0 (the default) serves only exact repeats of the normalized prompt
+SIMILARITY_THRESHOLD = float(os.getenv("AGENT_RESPONSE_CACHE_SIMILARITY", "0"))
+# Width of the hashed character trigram vectors
+VECTOR_DIM = 512
+
+# Replies are only cached when every tool the turn used is read-only. Anything else
+# (run_command, jobs, list_directory on a changing tree) has to run again each time
+CACHEABLE_TOOLS = frozenset({'detect_system', 'get_system_info', 'calculator', 'web_search'})
+
+# Prompts containing these refer back to the conversation, so their answer depends on it
+_CONTEXT_WORDS = frozenset({
+    'it', 'its', 'them', 'they', 'those', 'these', 'again', 'above', 'previous', 'same',
+    'else', 'earlier', 'also', 'instead',
+})
+
+# Words that don't change what is being asked. Near-duplicates must agree on every other
+# word, in the same order, so "fahrenheit to celsius" never matches "celsius to fahrenheit"
+_FILLER_WORDS = frozenset({
+    'a', 'an', 'the', 'please', 'me', 'i', 'you', 'can', 'could', 'would', 'will', 'do',
+    'does', 'did', 'is', 'are', 'was', 'tell', 'show', 'give', 'what', 'whats', 's', 'how',
+    'of', 'for', 'this', 'current', 'currently', 'hey', 'hi', 'thanks', 'just', 'quickly',
+})
+
+_WORD = re.compile(r"[a-z0-9_./~+-]+")
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase the prompt and drop punctuation and extra whitespace."""
+    return " ".join(word.strip(".") for word in _WORD.findall(text.lower()) if word.strip("."))
+
+def _is_standalone(normalized: str) -> bool:
+    return bool(normalized) and not any(word in _CONTEXT_WORDS for word in normalized.split())
+
+def _content_words(normalized: str) -> tuple:
+    """The prompt's words other than filler, in order; near-duplicates must have the same ones."""
+    return tuple(word for word in normalized.split() if word not in _FILLER_WORDS)
+
+def _vector(normalized: str):
+    """Unit-length hashed character trigram counts of a normalized prompt."""
+    padded = f" {normalized} "
+    slots = [hash(padded[i:i + 3]) % VECTOR_DIM for i in range(len(padded) - 2)]
+    vector = np.bincount(slots, minlength=VECTOR_DIM).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class ResponseCache:
+    """LRU cache of final agent replies keyed on the normalized prompt and a context key.
+
+    The context key should hold whatever the answer depends on besides the prompt
+    (session, working directory, system fingerprint). Only exact repeats of the
+    normalized prompt hit unless a similarity threshold is set. Then, with NumPy, a
+    differently worded prompt is looked up by cosine similarity against a preallocated
+    float32 matrix with one row per entry (a single matrix-vector product) and served
+    only if it also has the same non-filler words in the same order.
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 threshold: float = SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        # (context, normalized prompt) -> (reply, expiry time, matrix row)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        similarity = np is not None and threshold > 0
+        self._vectors = np.zeros((max_entries, VECTOR_DIM), dtype=np.float32) if similarity else None
+        self._row_keys = [None] * max_entries
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+
+    def get(self, prompt: str, context: tuple):
+        """The cached reply for prompt in context, or None."""
+        normalized = normalize_prompt(prompt)
+        if not _is_standalone(normalized):
+            return None
+        key = (context, normalized)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._vectors is not None and self._entries:
+                key = self._nearest(normalized, context)
+                entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                return None
+            if entry[1] < now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, prompt: str, context: tuple, reply: str):
+        """Remember reply for prompt in context, evicting the least recently used entry if full."""
+        normalized = normalize_prompt(prompt)
+        if not _is_standalone(normalized) or self.max_entries <= 0:
+            return
+        key = (context, normalized)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            row = self._free_rows.pop()
+            if self._vectors is not None:
+                self._vectors[row] = _vector(normalized)
+            self._row_keys[row] = key
+            self._entries[key] = (reply, time.monotonic() + self.ttl, row)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _nearest(self, normalized: str, context: tuple):
+        """Key of the most similar cached prompt in the same context, if similar enough."""
+        scores = self._vectors @ _vector(normalized)
+        # Free rows are all zeros and never clear the threshold; check a few best candidates
+        # since the most similar prompt may belong to another context or differ in a
+        # word that matters ("install docker" vs "uninstall docker")
+        words = _content_words(normalized)
+        candidates = np.argpartition(scores, -4)[-4:] if len(scores) > 4 else np.arange(len(scores))
+        for row in sorted(candidates, key=lambda row: scores[row], reverse=True):
+            if scores[row] < self.threshold:
+                break
+            key = self._row_keys[row]
+            if key is not None and key[0] == context and _content_words(key[1]) == words:
+                return key
+        return None
+
+    def _remove(self, key):
+        _, _, row = self._entries.pop(key)
+        if self._vectors is not None:
+            self._vectors[row] = 0
+        self._row_keys[row] = None
+        self._free_rows.append(row)
+
+response_cache = ResponseCache()
@@ -0,0 +1,102 @@
+import os
+import re
+import shlex
+import shutil
+import threading
+
+# Set AGENT_ROUTER=0 to send every AI query to the model
+ROUTER_ENABLED = os.getenv("AGENT_ROUTER", "1") != "0"
+# Longer input is assumed to be prose
+MAX_COMMAND_CHARS = 500
+# PATH lookups remembered until PATH changes
+MAX_CACHED_LOOKUPS = 1024
+
+# Builtins and keywords that shutil.which can't find
+SHELL_BUILTINS = frozenset({
+    'cd', 'pwd', 'echo', 'export', 'unset', 'alias', 'unalias', 'source', 'type',
+    'pushd', 'popd', 'dirs', 'umask', 'ulimit', 'set', 'history', 'jobs', 'for', 'if', 'while',
+})
+
+# Leading words that are commands on some systems but almost always start a question here
+CONVERSATIONAL_WORDS = frozenset({
+    'help', 'what', 'whats', "what's", 'how', 'why', 'when', 'where', 'who', 'can', 'could',
+    'would', 'should', 'is', 'are', 'do', 'does', 'please', 'explain', 'tell', 'show', 'hi',
+    'hello', 'hey', 'thanks', 'thank', 'ok', 'okay', 'yes', 'no', 'i', 'my', 'the', 'a',
+})
+
+# Commands that are also everyday English verbs. Their plain-word arguments must name
+# existing files, so "find large files" goes to the model while "cat notes" runs
+ENGLISH_VERB_COMMANDS = frozenset({
+    'find', 'make', 'sort', 'test', 'time', 'watch', 'kill', 'touch', 'cat', 'head', 'tail',
+    'file', 'date', 'free', 'top', 'say', 'open', 'look', 'join', 'split', 'more', 'less',
+    'install', 'locate', 'write', 'cut', 'paste', 'print', 'read', 'wait', 'list',
+    'compare', 'fold', 'expand', 'link', 'clear', 'run', 'check', 'update', 'upgrade', 'remove',
+})
+
+# Words that mark the rest of the input as English rather than arguments
+PROSE_WORDS = frozenset({
+    'the', 'a', 'an', 'me', 'my', 'is', 'are', 'was', 'what', 'how', 'why', 'please', 'all',
+    'of', 'to', 'for', 'with', 'that', 'this', 'these', 'those', 'it', 'can', 'you', 'your',
+    'and', 'or', 'in', 'on', 'from', 'about', 'which', 'there', 'some', 'any', 'i',
+})
+
+# Operators, redirections, variables, substitutions and options only show up in shell input
+# A lone "&" mid-sentence is more likely to mean "and"
+_SHELL_SYNTAX = re.compile(r'&&|&\s*$|[|;<>`$]|(?:^|\s)-{1,2}[A-Za-z0-9]|(?:^|\s)[A-Za-z_][A-Za-z0-9_]*=')
+
+_lookups = {}
+_lookups_path = None
+_lookups_lock = threading.Lock()
+
+def is_executable(name: str) -> bool:
+    """Whether name is a shell builtin or an executable on PATH. Lookups are cached until PATH changes."""
+    global _lookups_path
+    if name in SHELL_BUILTINS:
+        return True
+    path = os.environ.get("PATH", "")
+    with _lookups_lock:
+        if path != _lookups_path:
+            _lookups.clear()
+            _lookups_path = path
+        found = _lookups.get(name)
+    if found is None:
+        found = shutil.which(name, path=path) is not None
+        with _lookups_lock:
+            if len(_lookups) >= MAX_CACHED_LOOKUPS:
+                _lookups.clear()
+            _lookups[name] = found
+    return found
+
+def _names_file(word: str, cwd: str) -> bool:
+    """Whether an argument is clearly not an English word: a path, pattern, number or existing file."""
+    if not word.isalpha():
+        return True
+    return os.path.lexists(os.path.join(cwd, word))
+
+def route(text: str, cwd: str = None):
+    """Return text as a shell command if it obviously is one, or None to ask the model.
+
+    Input counts as a command when its first word is a builtin or an executable on
+    PATH and the rest either uses shell syntax or reads like arguments rather than
+    an English sentence. cwd is where relative file arguments are looked up.
+    """
+    text = text.strip()
+    if not ROUTER_ENABLED or not text or len(text) > MAX_COMMAND_CHARS or "\n" in text:
+        return None
+    try:
+        words = shlex.split(text)
+    except ValueError:
+        return None
+    if not words:
+        return None
+
+    head = words[0]
+    if head.lower() in CONVERSATIONAL_WORDS or not is_executable(head):
+        return None
+    if _SHELL_SYNTAX.search(text):
+        return text
+    if text.endswith(("?", "!")) or any(word.lower() in PROSE_WORDS for word in words[1:]):
+        return None
+    if head in ENGLISH_VERB_COMMANDS and not all(_names_file(word, cwd or os.getcwd()) for word in words[1:]):
+        return None
+    return text
@@ -0,0 +1,74 @@
+import os
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
+
+# Upper bound on the running summary; the oldest points are dropped beyond it
+MAX_SUMMARY_CHARS = int(os.getenv("AGENT_MAX_SUMMARY_CHARS", "2000"))
+# Characters of each message kept in its summary point
+SNIPPET_CHARS = 200
+# Compact the summary with a cheap LLM call in the background once it grows past this
+COMPACT_SUMMARY_AT = int(MAX_SUMMARY_CHARS * 0.75)
+LLM_COMPACTION = os.getenv("AGENT_LLM_SUMMARY", "0") == "1"
+
+POINT_SEPARATOR = " | "
+
+COMPACTION_PROMPT = f"""Condense the following notes about an earlier conversation between a user and a \
+terminal assistant into at most {MAX_SUMMARY_CHARS // 2} characters. Keep concrete facts such as paths, \
+commands, package names, errors and decisions. Reply with the condensed notes only."""
+
+def _snippet(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= SNIPPET_CHARS else text[:SNIPPET_CHARS] + "..."
+
+def _summary_point(message) -> str:
+    """One short line describing a message, or an empty string for nothing worth keeping."""
+    content = message.content if isinstance(message.content, str) else ""
+    if isinstance(message, HumanMessage):
+        return f"User asked: {_snippet(content)}"
+    if isinstance(message, AIMessage) and content:
+        return f"Assistant: {_snippet(content)}"
+    if isinstance(message, ToolMessage):
+        return f"Tool {message.name or 'call'} returned {len(content)} chars"
+    return ""
+
+def _cap(summary: str, limit: int = MAX_SUMMARY_CHARS) -> str:
+    """Drop the oldest points until the summary fits in limit characters."""
+    while len(summary) > limit:
+        cut = summary.find(POINT_SEPARATOR)
+        if cut == -1:
+            return summary[-limit:]
+        summary = summary[cut + len(POINT_SEPARATOR):]
+    return summary
+
+def fold_messages(summary: str, cursor: str, history: list, end: int) -> tuple:
+    """Fold history[:end] into the running summary, skipping messages already folded.
+
+    cursor is the id of the last message folded so far. Only messages after it are
+    read, so the work per call is proportional to the new messages. If the cursor
+    has been trimmed from the history everything before end is new.
+    Returns the updated (summary, cursor).
+    """
+    start = 0
+    if cursor:
+        for index in range(len(history) - 1, -1, -1):
+            if history[index].id == cursor:
+                start = index + 1
+                break
+
+    new_messages = history[start:end]
+    if not new_messages:
+        return summary, cursor
+
+    points = [point for point in map(_summary_point, new_messages) if point]
+    if points:
+        summary = POINT_SEPARATOR.join(([summary] if summary else []) + points)
+    return _cap(summary), new_messages[-1].id
+
+def needs_compaction(summary: str) -> bool:
+    """Whether the summary is large enough to be worth a background LLM compaction."""
+    return LLM_COMPACTION and len(summary) > COMPACT_SUMMARY_AT
+
+async def compact_summary(llm, summary: str) -> str:
+    """Ask the model for a condensed version of the summary."""
+    response = await llm.ainvoke([SystemMessage(content=COMPACTION_PROMPT), HumanMessage(content=summary)])
+    content = response.content if isinstance(response.content, str) else ""
+    return _cap(content.strip()) or summary
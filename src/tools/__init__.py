@@ -1,5 +1,28 @@
-from .web_search import web_search
-from .calculator import calculator
-from .system_commands import list_directory, run_command, detect_system, get_system_info
+# Tools are imported on first access, so importing e.g. tools.system_commands for the
+# command endpoints does not pull in LangChain, requests (web_search) or NumPy (calculator)
+_TOOL_MODULES = {
+    'web_search': 'web_search',
+    'calculator': 'calculator',
+    'list_directory': 'agent_tools',
+    'search_files': 'agent_tools',
+    'index_files': 'agent_tools',
+    'run_command': 'agent_tools',
+    'detect_system': 'agent_tools',
+    'get_system_info': 'agent_tools',
+    'read_output': 'agent_tools',
+    'start_job': 'agent_tools',
+    'job_status': 'agent_tools',
+    'job_output': 'agent_tools',
+    'cancel_job': 'agent_tools',
+    'list_jobs': 'agent_tools',
+}
 
-__all__ = ['web_search', 'calculator', 'list_directory', 'run_command', 'detect_system', 'get_system_info']
+__all__ = list(_TOOL_MODULES)
+
+def __getattr__(name):
+    if name not in _TOOL_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(f".{_TOOL_MODULES[name]}", __name__), name)
+    globals()[name] = value
+    return value
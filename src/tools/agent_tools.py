@@ -0,0 +1,158 @@
+"""LangChain tool wrappers the agent calls.
+
+The implementations live in plain modules (system_commands, jobs, output_capture)
+so the web endpoints can use them without importing LangChain.
+"""
+from langchain_core.tools import tool
+# Handle both relative and absolute imports
+try:
+    from . import system_commands
+    from .jobs import jobs, describe_job, tail_output
+    from .output_capture import read_output_range, MAX_READ_LINES
+    from . import search_index
+    from .metrics import timed
+    from .session import current_session
+except ImportError:
+    import system_commands
+    from jobs import jobs, describe_job, tail_output
+    from output_capture import read_output_range, MAX_READ_LINES
+    import search_index
+    from metrics import timed
+    from session import current_session
+
+@tool
+@timed("tool")
+def detect_system() -> str:
+    """Detect the operating system and distribution."""
+    return system_commands.detect_system()
+
+@tool
+@timed("tool")
+def get_system_info() -> str:
+    """Get comprehensive system information including OS, kernel, and available package managers."""
+    return system_commands.get_system_info()
+
+@tool
+@timed("tool")
+def list_directory(path: str = ".", pattern: str = "", offset: int = 0, limit: int = 200,
+                   recursive: bool = False) -> str:
+    """List files and directories in the specified path (default: current directory) with size and
+    modification time, sorted by name. pattern is an optional glob such as '*.py'. Large directories
+    are paged: pass the offset the result suggests to see more. recursive=True also lists subdirectories."""
+    return system_commands.list_directory(path, pattern or None, offset, limit, recursive)
+
+@tool
+@timed("tool")
+def search_files(query: str, path: str = ".", regex: bool = False, ignore_case: bool = False,
+                 max_results: int = 50) -> str:
+    """Find where text occurs in the files under a directory (default: current directory), e.g. where a
+    function is defined or which config mentions a setting. Much faster than grep -r on repeated searches:
+    the tree is indexed once and kept up to date. query is a literal substring, or a Python regex with
+    regex=True. Returns file:line: text for each matching line."""
+    try:
+        return search_index.search_files(query, system_commands.resolve_path(path), regex, ignore_case, max_results)
+    except Exception as e:
+        return f"Error searching for '{query}': {str(e)}"
+
+@tool
+@timed("tool")
+def index_files(path: str = ".") -> str:
+    """Build or refresh the search index of a directory tree ahead of search_files calls."""
+    try:
+        return search_index.index_files(system_commands.resolve_path(path))
+    except Exception as e:
+        return f"Error indexing '{path}': {str(e)}"
+
+@tool
+@timed("tool")
+def run_command(command: str) -> str:
+    """Execute any terminal command including sudo commands with automatic password handling."""
+    return system_commands.run_command(command)
+
+# Let the agent's async ToolNode await run_command instead of blocking a thread on it
+run_command.coroutine = timed("tool", "run_command")(system_commands.arun_command)
+
+@tool
+@timed("tool")
+def read_output(output_id: str, start_line: int = 1, max_lines: int = 200) -> str:
+    """Read part of a large command output that was cut short. Pass the output id
+    from the truncated result (e.g. out-...) and the 1-based line to start from."""
+    try:
+        start_line = max(1, start_line)
+        max_lines = max(1, min(max_lines, MAX_READ_LINES))
+        text, first, last, size = read_output_range(output_id, start_line, max_lines)
+        if last < first:
+            return f"Output {output_id} ({size} bytes) has no lines from {start_line} on"
+        return f"Output {output_id}, lines {first}-{last} ({size} bytes in total):\n{text}"
+    except FileNotFoundError:
+        return f"Error reading output '{output_id}': it no longer exists"
+    except Exception as e:
+        return f"Error reading output '{output_id}': {str(e)}"
+
+@tool
+@timed("tool")
+def start_job(command: str) -> str:
+    """Start a long-running command (build, scan, download...) in the background and return
+    its job id at once. Several jobs can run in parallel. Check on them with job_status."""
+    try:
+        if not command.strip():
+            return "Error: Empty command provided"
+        session = current_session()
+        job = jobs.submit(command, session.cwd, session.id)
+        return f"Started job {job.id}: {command}\nWorking directory: {job.cwd}"
+    except Exception as e:
+        return f"Error starting job '{command}': {str(e)}"
+
+@tool
+@timed("tool")
+def job_status(job_id: str) -> str:
+    """Check on a background job started earlier (e.g. a long sudo command) by its job id."""
+    try:
+        job = jobs.get(job_id, current_session().id)
+        if job is None:
+            return f"Error: no job with id '{job_id}'"
+        return describe_job(job)
+    except Exception as e:
+        return f"Error checking job '{job_id}': {str(e)}"
+
+@tool
+@timed("tool")
+def job_output(job_id: str, lines: int = 50) -> str:
+    """Show the last lines of output of a background job."""
+    try:
+        job = jobs.get(job_id, current_session().id)
+        if job is None:
+            return f"Error: no job with id '{job_id}'"
+        return f"Job {job.id} ({job.status}): {job.command}\n{tail_output(job, max(1, lines))}"
+    except Exception as e:
+        return f"Error reading output of job '{job_id}': {str(e)}"
+
+@tool
+@timed("tool")
+def cancel_job(job_id: str) -> str:
+    """Stop a queued or running background job."""
+    try:
+        job = jobs.get(job_id, current_session().id)
+        if job is None:
+            return f"Error: no job with id '{job_id}'"
+        if not jobs.cancel(job):
+            return f"Job {job.id} already finished ({job.status})"
+        return f"Cancelling job {job.id}: {job.command}"
+    except Exception as e:
+        return f"Error cancelling job '{job_id}': {str(e)}"
+
+@tool
+@timed("tool")
+def list_jobs() -> str:
+    """List the background jobs of this session with their status."""
+    try:
+        session_jobs = jobs.list(current_session().id)
+        if not session_jobs:
+            return "No background jobs."
+        lines = []
+        for job in session_jobs:
+            status = job.status if job.exit_code is None else f"{job.status} (exit code {job.exit_code})"
+            lines.append(f"{job.id}  {status}  {job.command}")
+        return "\n".join(lines)
+    except Exception as e:
+        return f"Error listing jobs: {str(e)}"
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+# Upper bound on tool calls executing at the same time. Blocking tools run on the
+# loop's default executor (sized to this value) and async tools take a semaphore slot.
+MAX_TOOL_CONCURRENCY = int(os.getenv("AGENT_MAX_TOOL_CONCURRENCY", "4"))
+# Seconds between checks of a cancellation event while waiting on the loop
+CANCEL_POLL_INTERVAL = 0.2
+
+_loop = None
+_loop_lock = threading.Lock()
+_tool_semaphore = None
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared background event loop, starting it on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(
+                ThreadPoolExecutor(max_workers=MAX_TOOL_CONCURRENCY, thread_name_prefix="agent-tool")
+            )
+            threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def tool_slot() -> asyncio.Semaphore:
+    """Semaphore limiting concurrent async tool executions on the shared loop."""
+    global _tool_semaphore
+    if _tool_semaphore is None:
+        _tool_semaphore = asyncio.Semaphore(MAX_TOOL_CONCURRENCY)
+    return _tool_semaphore
+
+def run_sync(coro):
+    """Run a coroutine on the shared loop and block until it finishes.
+
+    Context variables of the calling thread are visible inside the coroutine.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+async def _aclose(agen, attempts: int = 500):
+    # A cancelled step may still be unwinding inside the generator, which can't be
+    # closed until it has
+    for _ in range(attempts):
+        try:
+            await agen.aclose()
+            return
+        except RuntimeError:
+            await asyncio.sleep(0.01)
+
+def iterate_sync(agen, cancelled: threading.Event = None):
+    """Drive an async generator on the shared loop from synchronous code.
+
+    Setting cancelled stops the iteration within CANCEL_POLL_INTERVAL seconds, cancelling
+    the step in progress rather than waiting for the generator's next item.
+    """
+    loop = get_loop()
+    try:
+        while True:
+            step = asyncio.run_coroutine_threadsafe(agen.__anext__(), loop)
+            try:
+                if cancelled is None:
+                    yield step.result()
+                    continue
+                while True:
+                    try:
+                        item = step.result(timeout=CANCEL_POLL_INTERVAL)
+                        break
+                    except FuturesTimeout:
+                        if cancelled.is_set():
+                            step.cancel()
+                            return
+                yield item
+            except StopAsyncIteration:
+                break
+    finally:
+        asyncio.run_coroutine_threadsafe(_aclose(agen), loop).result()
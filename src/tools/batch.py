@@ -0,0 +1,120 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .system_commands import arun_in_directory, get_system_info, COMMAND_TIMEOUT, STREAM_TIMEOUT
+    from .listing import list_page, format_listing, DEFAULT_LIMIT
+    from .metrics import timed
+except ImportError:
+    from system_commands import arun_in_directory, get_system_info, COMMAND_TIMEOUT, STREAM_TIMEOUT
+    from listing import list_page, format_listing, DEFAULT_LIMIT
+    from metrics import timed
+
+# Batch operations running at the same time, across all batches. Commands run as their
+# own processes and directory listings on a thread pool of this size
+BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", str(min(32, (os.cpu_count() or 4) * 4))))
+# Operations accepted in one batch
+MAX_BATCH_ITEMS = int(os.getenv("AGENT_MAX_BATCH_ITEMS", "1000"))
+
+OPERATIONS = ("command", "list-directory", "system-info")
+
+_executor = None
+_batch_semaphore = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="agent-batch")
+    return _executor
+
+def _batch_slot() -> asyncio.Semaphore:
+    """Semaphore limiting concurrent batch operations on the shared loop."""
+    global _batch_semaphore
+    if _batch_semaphore is None:
+        _batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    return _batch_semaphore
+
+def validate(operations) -> str:
+    """Error message for a malformed batch, or None if every operation can be run."""
+    if not isinstance(operations, list) or not operations:
+        return "operations must be a non-empty list"
+    if len(operations) > MAX_BATCH_ITEMS:
+        return f"A batch holds at most {MAX_BATCH_ITEMS} operations, got {len(operations)}"
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            return f"Operation {index} must be an object"
+        if operation.get("op") not in OPERATIONS:
+            return f"Operation {index} has unknown op {operation.get('op')!r}, expected one of {', '.join(OPERATIONS)}"
+        if operation["op"] == "command" and not str(operation.get("command", "")).strip():
+            return f"Operation {index} has no command"
+    return None
+
+def _list_directory(directory: str, operation: dict) -> dict:
+    offset = int(operation.get("offset", 0))
+    limit = int(operation.get("limit", DEFAULT_LIMIT))
+    pattern = operation.get("pattern") or None
+    entries, total = list_page(directory, offset, limit, pattern, bool(operation.get("show_hidden", True)))
+    return {
+        "result": format_listing(directory, entries, offset, total, offset + len(entries) < total, pattern),
+        "entries": entries,
+        "total": total,
+        "path": directory,
+    }
+
+async def _run_operation(operation: dict, default_cwd: str) -> dict:
+    """Result of one operation: its output fields, or an error."""
+    cwd = os.path.normpath(os.path.join(default_cwd, os.path.expanduser(operation.get("cwd") or ".")))
+    op = operation["op"]
+    try:
+        if op == "command":
+            command = operation["command"].strip()
+            if command.startswith("sudo"):
+                return {"error": "sudo commands can't run in a batch, submit them to /api/jobs", "status": "error"}
+            timeout = min(float(operation.get("timeout", COMMAND_TIMEOUT)), STREAM_TIMEOUT)
+            return {"result": await arun_in_directory(command, cwd, timeout), "command": command, "status": "success"}
+
+        loop = asyncio.get_running_loop()
+        if op == "list-directory":
+            directory = os.path.normpath(os.path.join(cwd, os.path.expanduser(operation.get("path") or ".")))
+            result = await loop.run_in_executor(_get_executor(), _list_directory, directory, operation)
+        else:
+            result = {"result": await loop.run_in_executor(_get_executor(), get_system_info)}
+        return {**result, "status": "success"}
+    except Exception as e:
+        return {"error": f"Error running {op}: {str(e)}", "status": "error"}
+
+@timed("batch", "run")
+async def arun_batch(operations: list, cwd: str) -> list:
+    """Run a validated batch and return the results in the order of the operations."""
+    results = [None] * len(operations)
+    async for index, result in astream_batch(operations, cwd):
+        results[index] = result
+    return results
+
+async def astream_batch(operations: list, cwd: str):
+    """Run a validated batch, yielding (index, result) as each operation finishes.
+
+    At most BATCH_CONCURRENCY operations of all batches together run at a time. Relative cwd and path values are
+    taken from cwd, the session's directory. Closing the generator early cancels what is
+    still running, killing its processes.
+    """
+    finished = asyncio.Queue()
+
+    async def run(index, operation):
+        async with _batch_slot():
+            result = await _run_operation(operation, cwd)
+        result["index"] = index
+        result["op"] = operation["op"]
+        if operation.get("id") is not None:
+            result["id"] = operation["id"]
+        finished.put_nowait((index, result))
+
+    tasks = [asyncio.create_task(run(index, operation)) for index, operation in enumerate(operations)]
+    try:
+        for _ in range(len(tasks)):
+            yield await finished.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
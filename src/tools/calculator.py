@@ -1,10 +1,221 @@
 from langchain_core.tools import tool
+import ast
+import math
+import operator
+import re
+import time
+from functools import lru_cache
+# Handle both relative and absolute imports
+try:
+    from .metrics import timed
+except ImportError:
+    from metrics import timed
 
-@tool  
+# NumPy is optional; without it batch expressions are evaluated one value at a time
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAX_EXPRESSION_LENGTH = 1000
+# Integer results larger than this many bits are refused (e.g. 9**9**9)
+MAX_RESULT_BITS = 100_000
+MAX_FACTORIAL = 1000
+MAX_BATCH_SIZE = 10_000_000
+# Values evaluated one at a time, without NumPy or for functions with no vectorized form
+MAX_SCALAR_BATCH_SIZE = 100_000
+# Seconds a scalar batch may run before it is stopped
+SCALAR_BATCH_TIMEOUT = 5.0
+# Values shown from the start of a batch result
+BATCH_PREVIEW = 5
+
+def _safe_pow(base, exponent):
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent * math.log2(abs(base)) > MAX_RESULT_BITS:
+            raise ValueError("result is too large")
+    return base ** exponent
+
+def _safe_mul(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        if left.bit_length() + right.bit_length() > MAX_RESULT_BITS:
+            raise ValueError("result is too large")
+    return left * right
+
+def _safe_factorial(n):
+    if n > MAX_FACTORIAL:
+        raise ValueError(f"factorial is limited to n <= {MAX_FACTORIAL}")
+    return math.factorial(n)
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _safe_mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _safe_pow,
+}
+
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_CONSTANTS = {
+    'pi': math.pi,
+    'e': math.e,
+    'tau': math.tau,
+    'inf': math.inf,
+}
+
+_SCALAR_FUNCTIONS = {
+    'sqrt': math.sqrt, 'exp': math.exp, 'log': math.log, 'log10': math.log10, 'log2': math.log2,
+    'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'asin': math.asin, 'acos': math.acos,
+    'atan': math.atan, 'floor': math.floor, 'ceil': math.ceil, 'abs': abs, 'round': round,
+    'min': min, 'max': max, 'factorial': _safe_factorial,
+}
+
+_VECTOR_FUNCTIONS = {} if np is None else {
+    'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log, 'log10': np.log10, 'log2': np.log2,
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'asin': np.arcsin, 'acos': np.arccos,
+    'atan': np.arctan, 'floor': np.floor, 'ceil': np.ceil, 'abs': np.abs, 'round': np.round,
+    'min': np.minimum, 'max': np.maximum,
+}
+
+_BATCH_PATTERN = re.compile(
+    r'^(?P<body>.+?)\s+for\s+(?P<var>[A-Za-z_]\w*)\s+in\s+'
+    r'(?:\[(?P<items>.*)\]|(?P<start>.+?)\s*\.\.\s*(?P<stop>.+?)(?:\s+step\s+(?P<step>.+))?)$'
+)
+
+def _compile_node(node, variables: tuple, functions: dict):
+    """Turn a whitelisted AST node into a closure taking a dict of variable values."""
+    if isinstance(node, ast.Constant):
+        if type(node.value) not in (int, float):
+            raise ValueError(f"unsupported constant {node.value!r}")
+        value = node.value
+        return lambda env: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name in variables:
+            return lambda env: env[name]
+        if name in _CONSTANTS:
+            value = _CONSTANTS[name]
+            return lambda env: value
+        raise ValueError(f"unknown name '{name}'")
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        op = _BINARY_OPERATORS[type(node.op)]
+        left = _compile_node(node.left, variables, functions)
+        right = _compile_node(node.right, variables, functions)
+        return lambda env: op(left(env), right(env))
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        op = _UNARY_OPERATORS[type(node.op)]
+        operand = _compile_node(node.operand, variables, functions)
+        return lambda env: op(operand(env))
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        func = functions.get(node.func.id)
+        if func is None:
+            raise ValueError(f"unsupported function '{node.func.id}'")
+        args = [_compile_node(arg, variables, functions) for arg in node.args]
+        return lambda env: func(*[arg(env) for arg in args])
+
+    raise ValueError(f"unsupported syntax '{type(node).__name__}'")
+
+@lru_cache(maxsize=256)
+def compile_expression(expression: str, variables: tuple = (), vectorized: bool = False):
+    """Parse and validate an expression once; later calls with the same string are cached."""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+    tree = ast.parse(expression.strip(), mode='eval')
+    functions = _VECTOR_FUNCTIONS if vectorized else _SCALAR_FUNCTIONS
+    return _compile_node(tree.body, variables, functions)
+
+def evaluate(expression: str, **variables):
+    """Safely evaluate an arithmetic expression with optional scalar variables."""
+    return compile_expression(expression, tuple(sorted(variables)))(variables)
+
+def _integral(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+def _batch_values(match) -> list:
+    """The values a batch expression iterates over, from a [list] or a start..stop range."""
+    if match.group('items') is not None:
+        items = ast.parse(f"[{match.group('items')}]", mode='eval').body.elts
+        return [compile_expression(ast.unparse(item))({}) for item in items]
+
+    start = _integral(evaluate(match.group('start')))
+    stop = _integral(evaluate(match.group('stop')))
+    step = _integral(evaluate(match.group('step'))) if match.group('step') else 1
+    if step == 0:
+        raise ValueError("step must not be zero")
+    count = math.floor((stop - start) / step) + 1
+    limit = MAX_BATCH_SIZE if np is not None else MAX_SCALAR_BATCH_SIZE
+    if count > limit:
+        raise ValueError(f"batch is limited to {limit} values")
+    if count <= 0:
+        return []
+    if np is not None:
+        return start + step * np.arange(count, dtype=np.float64)
+    return [start + step * i for i in range(count)]
+
+def evaluate_batch(body: str, variable: str, values):
+    """Evaluate body for every value of variable, vectorized with NumPy when available."""
+    if np is not None:
+        try:
+            func = compile_expression(body, (variable,), vectorized=True)
+            with np.errstate(all='ignore'):
+                result = func({variable: np.asarray(values, dtype=np.float64)})
+            return np.broadcast_to(result, (len(values),))
+        except ValueError:
+            # e.g. factorial has no vectorized form; fall back to the scalar engine
+            pass
+    if len(values) > MAX_SCALAR_BATCH_SIZE:
+        raise ValueError(f"batch is limited to {MAX_SCALAR_BATCH_SIZE} values for this expression")
+    func = compile_expression(body, (variable,))
+    deadline = time.monotonic() + SCALAR_BATCH_TIMEOUT
+    results = []
+    for value in values:
+        results.append(func({variable: _integral(float(value))}))
+        # Checked every 1024 values, so each check is cheap and a slow body can't run on
+        if len(results) % 1024 == 0 and time.monotonic() > deadline:
+            raise ValueError(f"batch took longer than {SCALAR_BATCH_TIMEOUT:g} seconds")
+    return results
+
+def _format_batch(expression: str, variable: str, values, results) -> str:
+    count = len(results)
+    if count == 0:
+        return f"Result: no values to evaluate for '{expression}'"
+    if np is not None:
+        results = np.asarray(results, dtype=np.float64)
+        stats = f"sum={results.sum():.10g}, min={results.min():.10g}, max={results.max():.10g}, mean={results.mean():.10g}"
+    else:
+        stats = f"sum={sum(results):.10g}, min={min(results):.10g}, max={max(results):.10g}, mean={sum(results) / count:.10g}"
+    preview = ", ".join(
+        f"{variable}={_integral(float(values[i]))}: {_integral(float(results[i]))}"
+        for i in range(min(count, BATCH_PREVIEW))
+    )
+    if count > BATCH_PREVIEW:
+        preview += f", ..., {variable}={_integral(float(values[-1]))}: {_integral(float(results[-1]))}"
+    return f"Result over {count} values: {stats}\n{preview}"
+
+@tool
+@timed("tool")
 def calculator(expression: str) -> str:
-    """Evaluate mathematical expressions."""
+    """Evaluate mathematical expressions. Supports + - * / // % **, math functions such as
+    sqrt, log, sin and constants pi and e. To evaluate over many values use
+    '<expr> for x in <start>..<stop> [step <n>]' or '<expr> for x in [1, 2, 3]'."""
     try:
-        result = eval(expression)
+        batch = _BATCH_PATTERN.match(expression.strip())
+        if batch:
+            variable = batch.group('var')
+            values = _batch_values(batch)
+            results = evaluate_batch(batch.group('body'), variable, values)
+            return _format_batch(expression, variable, values, results)
+
+        result = evaluate(expression)
         return f"Result: {result}"
     except Exception as e:
         return f"Error calculating '{expression}': {str(e)}"
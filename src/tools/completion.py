@@ -0,0 +1,209 @@
+import bisect
+import os
+import shlex
+import threading
+import time
+
+try:
+    from .history import history, TOP_K
+except ImportError:
+    from history import history, TOP_K
+
+# Seconds between checks of the PATH directories for installed or removed programs
+PATH_CHECK_INTERVAL = 5.0
+# Directory entries looked at per path completion, so huge directories stay fast
+MAX_PATH_SCAN = 5000
+
+# Builtins and keywords offered along with the programs on PATH
+SHELL_BUILTINS = (
+    'alias', 'bg', 'cd', 'command', 'dirs', 'echo', 'exec', 'exit', 'export', 'fg', 'history',
+    'jobs', 'popd', 'printf', 'pushd', 'pwd', 'read', 'set', 'source', 'type', 'ulimit', 'umask',
+    'unalias', 'unset', 'wait',
+)
+
+class PathIndex:
+    """Sorted names of the executables on PATH, for prefix lookups by bisection.
+
+    Rebuilt when PATH changes or, checked at most every PATH_CHECK_INTERVAL seconds,
+    when one of its directories' modification time does.
+    """
+
+    def __init__(self):
+        self._names = []
+        self._path = None
+        self._mtimes = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _directory_mtimes(self, directories: list) -> tuple:
+        mtimes = []
+        for directory in directories:
+            try:
+                mtimes.append(os.stat(directory).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _build(self, directories: list) -> list:
+        names = set(SHELL_BUILTINS)
+        for directory in directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_file() and os.access(entry.path, os.X_OK):
+                                names.add(entry.name)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return sorted(names)
+
+    def names(self) -> list:
+        """All executable names, sorted, refreshed if PATH or its directories changed."""
+        path = os.environ.get("PATH", "")
+        now = time.monotonic()
+        with self._lock:
+            if path == self._path and now - self._checked < PATH_CHECK_INTERVAL:
+                return self._names
+            directories = [directory for directory in path.split(os.pathsep) if directory]
+            mtimes = self._directory_mtimes(directories)
+            if path != self._path or mtimes != self._mtimes:
+                self._names = self._build(directories)
+                self._path = path
+                self._mtimes = mtimes
+            self._checked = now
+            return self._names
+
+    def complete(self, prefix: str, limit: int = TOP_K) -> list:
+        """Executable names starting with prefix, in alphabetical order."""
+        names = self.names()
+        start = bisect.bisect_left(names, prefix)
+        matches = []
+        for name in names[start:start + limit]:
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+        return matches
+
+path_index = PathIndex()
+
+def complete_path(word: str, cwd: str, limit: int = TOP_K, directories_only: bool = False) -> list:
+    """Paths completing word, relative to cwd when it isn't absolute. Directories end in '/'."""
+    expanded = os.path.expanduser(word)
+    directory, partial = os.path.split(expanded)
+    base = os.path.join(cwd, directory) if not os.path.isabs(directory) else directory
+    # Completions keep what the user typed (including ~) in front of the name
+    typed = word[:len(word) - len(partial)]
+    show_hidden = partial.startswith(".")
+
+    matches = []
+    try:
+        with os.scandir(base or ".") as entries:
+            for scanned, entry in enumerate(entries):
+                if scanned >= MAX_PATH_SCAN:
+                    break
+                if not entry.name.startswith(partial) or (entry.name.startswith(".") and not show_hidden):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if directories_only and not is_dir:
+                    continue
+                matches.append(typed + entry.name + ("/" if is_dir else ""))
+    except OSError:
+        return []
+    matches.sort()
+    return matches[:limit]
+
+# Characters that end a word and start a shell operator such as | && ; >
+_OPERATOR_CHARS = "|&;<>()"
+
+def _split_last_word(line: str) -> tuple:
+    """(text before the word being typed, the word, whether it is the command name).
+
+    The line is scanned the way the shell splits it, so the word comes back unquoted and
+    unescaped while the text before it is exactly what was typed, open quote or not.
+    """
+    words = []
+    current = []
+    # Index in line where the word being scanned starts, None between words
+    start = None
+    quote = None
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote == "'":
+            if char == "'":
+                quote = None
+            else:
+                current.append(char)
+        elif quote == '"':
+            if char == '"':
+                quote = None
+            elif char == "\\" and line[i + 1:i + 2] in ('"', "\\", "$", "`"):
+                current.append(line[i + 1])
+                i += 1
+            else:
+                current.append(char)
+        elif char.isspace() or char in _OPERATOR_CHARS:
+            if start is not None:
+                words.append("".join(current))
+                current = []
+                start = None
+            if not char.isspace():
+                end = i + 1
+                while end < len(line) and line[end] in _OPERATOR_CHARS:
+                    end += 1
+                words.append(line[i:end])
+                i = end - 1
+        else:
+            if start is None:
+                start = i
+            if char == "\\":
+                current.append(line[i + 1:i + 2])
+                i += 1
+            elif char in "'\"":
+                quote = char
+            else:
+                current.append(char)
+        i += 1
+
+    # The command name follows nothing, or a pipe or list operator
+    is_command = not words or words[-1] in ("|", "||", "&&", ";", "sudo", "time", "nohup")
+    if start is None:
+        return line, "", is_command
+    return line[:start], "".join(current), is_command
+
+def _quote_path(path: str) -> str:
+    """path quoted for the shell where it needs to be, leaving a leading ~user/ to expand."""
+    prefix = path[:path.index("/") + 1] if path.startswith("~") and "/" in path else ""
+    rest = path[len(prefix):]
+    return prefix + shlex.quote(rest) if rest else path
+
+def complete(line: str, cwd: str, session_id: str, limit: int = TOP_K) -> dict:
+    """Completions for a partly typed command line.
+
+    history holds the session's whole earlier command lines starting with line, most used first.
+    completions holds full lines with the word under the cursor completed: a command
+    name from PATH and the shell builtins for the first word, a path relative to cwd
+    for the others (and for command names that look like paths).
+    """
+    result = {"history": history.complete(session_id, line, limit) if line.strip() else [], "completions": []}
+    if line.startswith("gem "):
+        # Natural language for the agent; only history applies
+        return result
+
+    head, word, is_command = _split_last_word(line)
+    if is_command and "/" not in word:
+        if not word:
+            return result
+        candidates = path_index.complete(word, limit)
+        # A trailing space so the next word can be typed straight away
+        result["completions"] = [head + name + " " for name in candidates]
+    else:
+        directories_only = head.split()[:1] == ["cd"]
+        candidates = complete_path(word, cwd, limit, directories_only)
+        result["completions"] = [head + _quote_path(path) for path in candidates]
+    return result
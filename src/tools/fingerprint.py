@@ -0,0 +1,95 @@
+import os
+import shutil
+import threading
+import time
+
+# How long a computed fingerprint stays valid, in seconds
+FINGERPRINT_TTL = float(os.getenv("SYSTEM_FINGERPRINT_TTL", "300"))
+
+# Checked in order, the first existing file decides the distribution
+RELEASE_FILES = [
+    ('/etc/arch-release', 'Arch Linux'),
+    ('/etc/debian_version', 'Debian/Ubuntu'),
+    ('/etc/redhat-release', 'Red Hat/CentOS'),
+    ('/etc/fedora-release', 'Fedora'),
+    ('/etc/opensuse-release', 'openSUSE'),
+]
+
+# Fallback when no release file exists, in priority order
+DISTRO_BY_PACKAGE_MANAGER = {
+    'pacman': 'Arch-based',
+    'apt': 'Debian-based',
+    'yum': 'Red Hat-based',
+    'dnf': 'Fedora-based',
+    'zypper': 'openSUSE-based'
+}
+
+PACKAGE_MANAGERS = ['pacman', 'apt', 'yum', 'dnf', 'zypper', 'brew']
+
+_fingerprint = None
+_fingerprint_time = 0.0
+_fingerprint_path = None
+_lock = threading.Lock()
+
+def _read_os_release(path: str = '/etc/os-release') -> dict:
+    """Parse an os-release file into a dict of its KEY=value pairs."""
+    values = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#') or '=' not in line:
+                    continue
+                key, value = line.split('=', 1)
+                values[key] = value.strip().strip('"\'')
+    except OSError:
+        pass
+    return values
+
+def _probe() -> dict:
+    """Collect the system fingerprint without spawning any process."""
+    available_pm = [pm for pm in PACKAGE_MANAGERS if shutil.which(pm)]
+    uname = os.uname()
+
+    system = None
+    for path, name in RELEASE_FILES:
+        if os.path.exists(path):
+            system = name
+            break
+    if system is None:
+        system = next(
+            (DISTRO_BY_PACKAGE_MANAGER[pm] for pm in DISTRO_BY_PACKAGE_MANAGER if pm in available_pm),
+            uname.sysname or "Unknown system"
+        )
+
+    os_release = _read_os_release()
+    return {
+        'system': system,
+        'distribution': os_release.get('PRETTY_NAME', ''),
+        'kernel': uname.release,
+        'machine': uname.machine,
+        'hostname': uname.nodename,
+        'package_managers': available_pm,
+    }
+
+def get_fingerprint() -> dict:
+    """Return the cached system fingerprint, recomputing it when stale.
+
+    The cache also expires when PATH changes, since package manager lookups depend on it.
+    """
+    global _fingerprint, _fingerprint_time, _fingerprint_path
+
+    path = os.environ.get('PATH', '')
+    with _lock:
+        expired = time.monotonic() - _fingerprint_time > FINGERPRINT_TTL
+        if _fingerprint is None or expired or path != _fingerprint_path:
+            _fingerprint = _probe()
+            _fingerprint_time = time.monotonic()
+            _fingerprint_path = path
+        return _fingerprint
+
+def invalidate_fingerprint():
+    """Drop the cached fingerprint so the next lookup probes the system again."""
+    global _fingerprint
+    with _lock:
+        _fingerprint = None
@@ -0,0 +1,331 @@
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+try:
+    from .session import DEFAULT_SESSION_ID
+except ImportError:
+    from session import DEFAULT_SESSION_ID
+
+# Append-only log of every command entered in the terminal, one JSON object per line
+# tagged with its session. Shared by all server processes
+HISTORY_FILE = os.getenv(
+    "AGENT_HISTORY_FILE",
+    str(Path(__file__).parent.parent.parent / "command_history.jsonl")
+)
+# Entries kept per session for navigation; the log is rewritten down to what is kept once it
+# holds twice as many lines
+MAX_HISTORY_ENTRIES = int(os.getenv("AGENT_MAX_HISTORY_ENTRIES", "100000"))
+# Sessions whose history is kept, the least recently active dropped beyond this many
+MAX_HISTORY_SESSIONS = int(os.getenv("AGENT_MAX_HISTORY_SESSIONS", "256"))
+# Completions offered per prefix
+TOP_K = 10
+# Commands remembered per trie node: one more, since a prefix never completes to itself
+_NODE_TOP = TOP_K + 1
+# Log lines read at once beyond which the trie is rebuilt rather than updated line by line
+BULK_LINES = 1000
+
+class _Node:
+    """Radix trie node. label is the text on the edge from the parent, top the best
+    commands below this node, best first."""
+
+    __slots__ = ("label", "children", "top")
+
+    def __init__(self, label: str, top: list = None):
+        self.label = label
+        self.children = {}
+        self.top = top or []
+
+class _SessionHistory:
+    """One session's commands with prefix completion ranked by frequency, then recency.
+
+    Every distinct command sits in a path-compressed trie whose nodes keep their own
+    top TOP_K commands. Scores only grow, so a command's new score just has to be
+    merged into the lists on its path: recording costs O(len(command) + depth * TOP_K)
+    and completing a prefix O(len(prefix)), however long the history is.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = []
+        # command -> (count, sequence number of its last use)
+        self._scores = {}
+        self._sequence = 0
+        self._root = _Node("")
+
+    def _rank(self, node: _Node, command: str):
+        top = node.top
+        if command in top:
+            top.remove(command)
+        score = self._scores[command]
+        position = len(top)
+        while position > 0 and self._scores[top[position - 1]] < score:
+            position -= 1
+        if position < _NODE_TOP:
+            top.insert(position, command)
+            del top[_NODE_TOP:]
+
+    def _index(self, command: str, rank: bool = True):
+        """Insert command into the trie and, with rank, merge its score into the top lists on its path."""
+        node = self._root
+        if rank:
+            self._rank(node, command)
+        i = 0
+        while i < len(command):
+            child = node.children.get(command[i])
+            if child is None:
+                node.children[command[i]] = _Node(command[i:], [command] if rank else [])
+                return
+            label = child.label
+            if command.startswith(label, i):
+                common = len(label)
+            else:
+                common = 1
+                limit = min(len(label), len(command) - i)
+                while common < limit and label[common] == command[i + common]:
+                    common += 1
+            if common < len(label):
+                # The command leaves (or ends inside) this edge: split it
+                middle = _Node(label[:common], list(child.top))
+                child.label = label[common:]
+                middle.children[child.label[0]] = child
+                node.children[command[i]] = middle
+                child = middle
+            i += common
+            node = child
+            if rank:
+                self._rank(node, command)
+
+    def rebuild(self):
+        """Build the trie from scratch, filling every node's top list bottom up."""
+        self._root = _Node("")
+        for command in self._scores:
+            self._index(command, rank=False)
+        score = self._scores.__getitem__
+        # Post-order walk carrying each node's full prefix
+        stack = [(self._root, "", False)]
+        while stack:
+            node, prefix, visited = stack.pop()
+            if not visited:
+                stack.append((node, prefix, True))
+                stack.extend((child, prefix + child.label, False) for child in node.children.values())
+                continue
+            candidates = [command for child in node.children.values() for command in child.top]
+            if prefix in self._scores:
+                candidates.append(prefix)
+            if len(candidates) > _NODE_TOP:
+                node.top = heapq.nlargest(_NODE_TOP, candidates, key=score)
+            else:
+                node.top = sorted(candidates, key=score, reverse=True)
+
+    def add(self, command: str, index: bool = True):
+        """Count one use of command, listing it for navigation unless it repeats the last entry.
+
+        Without index the trie is left stale, for the caller to rebuild.
+        """
+        count = self._scores.get(command, (0, 0))[0]
+        self._sequence += 1
+        self._scores[command] = (count + 1, self._sequence)
+        # Repeats count towards the ranking but don't clutter navigation
+        if not self.entries or self.entries[-1] != command:
+            self.entries.append(command)
+            if len(self.entries) > self.max_entries * 2:
+                self.trim()
+                if index:
+                    self.rebuild()
+                return
+        if index:
+            self._index(command)
+
+    def trim(self):
+        """Keep the newest max_entries entries, forgetting the scores of commands no longer among them."""
+        del self.entries[:-self.max_entries]
+        if len(self._scores) > self.max_entries:
+            kept = set(self.entries)
+            self._scores = {command: score for command, score in self._scores.items() if command in kept}
+
+    def complete(self, prefix: str, limit: int) -> list:
+        node = self._root
+        i = 0
+        while i < len(prefix):
+            child = node.children.get(prefix[i])
+            if child is None:
+                return []
+            rest = prefix[i:]
+            if rest.startswith(child.label):
+                i += len(child.label)
+            elif child.label.startswith(rest):
+                i = len(prefix)
+            else:
+                return []
+            node = child
+        return [command for command in node.top if command != prefix][:limit]
+
+class CommandHistory:
+    """Command history of every session, read from and appended to the shared log.
+
+    Sessions don't see each other's commands: each has its own navigation list and
+    completion trie (see _SessionHistory).
+    """
+
+    def __init__(self, path: str = HISTORY_FILE, max_entries: int = MAX_HISTORY_ENTRIES,
+                 max_sessions: int = MAX_HISTORY_SESSIONS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        # Session id -> _SessionHistory, least recently active first
+        self._sessions = OrderedDict()
+        # Bytes of the log read so far; anything past it was appended by another process
+        self._read_offset = 0
+        self._logged_lines = 0
+        self._inode = None
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _session(self, session_id: str, create: bool = True) -> _SessionHistory:
+        history = self._sessions.get(session_id)
+        if history is None:
+            if not create:
+                return None
+            history = self._sessions[session_id] = _SessionHistory(self.max_entries)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return history
+
+    def _add(self, session_id: str, command: str, index: bool = True):
+        self._session(session_id).add(command, index)
+
+    def _read_new(self):
+        """Index log lines appended since the last read, by this or another process."""
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return
+        size = info.st_size
+        if info.st_ino != self._inode or size < self._read_offset:
+            # New, or rewritten by another process; start over
+            if self._inode is not None:
+                self._reset()
+            self._inode = info.st_ino
+        if size == self._read_offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._read_offset)
+            data = f.read()
+        # A line still being written has no newline yet; read it next time
+        end = data.rfind(b"\n") + 1
+        self._read_offset += end
+        lines = data[:end].decode("utf-8", errors="replace").split("\n")[:-1]
+        bulk = len(lines) > BULK_LINES
+        touched = set()
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                command = entry["command"]
+                # Lines written before history was kept per session belong to the local one
+                session_id = str(entry.get("session", DEFAULT_SESSION_ID))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            self._logged_lines += 1
+            self._add(session_id, command, index=not bulk)
+            touched.add(session_id)
+        if bulk:
+            for session_id in touched:
+                history = self._session(session_id, create=False)
+                if history is not None:
+                    history.rebuild()
+
+    def _reset(self):
+        self._sessions = OrderedDict()
+        self._read_offset = 0
+        self._logged_lines = 0
+
+    def _sync(self):
+        self._read_new()
+        if not self._loaded:
+            # Trimmed once, on first use, so the rewrite rarely races other processes' appends
+            self._loaded = True
+            kept = sum(min(len(history.entries), self.max_entries) for history in self._sessions.values())
+            if self._logged_lines > max(kept, self.max_entries) * 2:
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the log with only each kept session's newest max_entries entries, atomically."""
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        lines = 0
+        try:
+            with open(temporary, "w") as f:
+                for session_id, history in self._sessions.items():
+                    history.trim()
+                    history.rebuild()
+                    for command in history.entries:
+                        f.write(json.dumps({"command": command, "session": session_id}) + "\n")
+                    lines += len(history.entries)
+            os.replace(temporary, self.path)
+            info = os.stat(self.path)
+            self._inode = info.st_ino
+            self._read_offset = info.st_size
+            self._logged_lines = lines
+        except OSError:
+            pass
+
+    def load(self):
+        """Read the log now rather than on first use."""
+        with self._lock:
+            self._sync()
+
+    def add(self, session_id: str, command: str):
+        """Record a command of a session: append it to the log and index it."""
+        command = command.strip()
+        if not command:
+            return
+        entry = {"command": command, "session": session_id, "ts": round(time.time(), 3)}
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self._lock:
+            self._sync()
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                # O_APPEND writes of one line are not interleaved with other processes' lines
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+            except OSError:
+                # History is a convenience; keep it in memory if the log can't be written
+                self._add(session_id, command)
+                return
+            # Indexed through the log, which also picks up other processes' lines before it
+            self._read_new()
+
+    def recent(self, session_id: str, limit: int = 100, before: int = None) -> tuple:
+        """Up to limit of a session's entries ending before index before (default: the newest),
+        oldest first, with the index of the first one returned."""
+        with self._lock:
+            self._sync()
+            history = self._session(session_id, create=False)
+            entries = history.entries if history is not None else []
+            end = len(entries) if before is None else max(0, min(before, len(entries)))
+            start = max(0, end - max(0, limit))
+            # Indexes count from the start of what is kept, which shifts after trimming
+            return entries[start:end], start
+
+    def complete(self, session_id: str, prefix: str, limit: int = TOP_K) -> list:
+        """A session's most used commands starting with prefix (longer than it), best first."""
+        with self._lock:
+            self._sync()
+            history = self._session(session_id, create=False)
+            return history.complete(prefix, limit) if history is not None else []
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return sum(len(history.entries) for history in self._sessions.values())
+
+history = CommandHistory()
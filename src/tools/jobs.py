@@ -0,0 +1,378 @@
+import asyncio
+import atexit
+import os
+import re
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from ptyprocess import PtyProcess
+# Handle both relative and absolute imports
+try:
+    from .async_runtime import get_loop
+    from .output_capture import OutputCapture
+except ImportError:
+    from async_runtime import get_loop
+    from output_capture import OutputCapture
+
+SHELL = os.getenv("AGENT_SHELL", "/bin/bash")
+# Jobs running at the same time; further submissions wait in the queue
+MAX_RUNNING_JOBS = int(os.getenv("AGENT_MAX_JOBS", str(os.cpu_count() or 4)))
+# Jobs are killed after running this many seconds
+JOB_TIMEOUT = int(os.getenv("AGENT_JOB_TIMEOUT", "3600"))
+# Seconds a cancelled job gets to exit after SIGTERM before it is killed
+CANCEL_GRACE = 5
+# Seconds to keep reading output after a job's main process exits, before
+# anything it left running in its process group is killed
+EXIT_GRACE = 0.5
+# Finished jobs remembered for status queries; the oldest are forgotten first
+MAX_FINISHED_JOBS = int(os.getenv("AGENT_MAX_FINISHED_JOBS", "200"))
+# Recent output kept in memory per job for polling clients
+JOB_TAIL_BYTES = 64 * 1024
+# Output shown by job_status and job_output
+STATUS_OUTPUT_BYTES = 4000
+READ_CHUNK_SIZE = 64 * 1024
+# Only the end of the output is searched for prompts
+PROMPT_WINDOW = 1024
+
+# Stands in for the password in a prompt rule's response
+PASSWORD = object()
+
+# (prompt pattern, response) pairs answered automatically for sudo jobs. The longer
+# apt/pacman/dnf confirmations ("Proceed with installation? [Y/n]" etc.) all end in one
+# of these.
+SUDO_PROMPT_RULES = [
+    (r'\[sudo\] password for [^:\r\n]*:', PASSWORD),
+    (r'[Pp]assword:', PASSWORD),
+    (r'\[Y/n\]', 'y'),
+    (r'\[y/N\]', 'y'),
+    (r'\(y/N\)', 'y'),
+]
+
+def compile_prompt_rules(rules: list) -> tuple:
+    """Combine prompt rules into one regex; returns (pattern, responses by group name)."""
+    groups = [f'(?P<r{index}>{pattern})' for index, (pattern, _) in enumerate(rules)]
+    responses = {f'r{index}': response for index, (_, response) in enumerate(rules)}
+    return re.compile('|'.join(groups).encode()), responses
+
+_SUDO_PROMPTS = compile_prompt_rules(SUDO_PROMPT_RULES)
+
+class Job:
+    """A command running in the background on a PTY, driven by the shared event loop."""
+
+    def __init__(self, command: str, cwd: str, session_id: str, on_finish=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.command = command
+        self.cwd = cwd
+        self.session_id = session_id
+        # queued -> running -> succeeded / failed / timed_out / cancelled
+        self.status = "queued"
+        self.exit_code = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = False
+        self.on_finish = on_finish
+        self.output = OutputCapture(tail_bytes=JOB_TAIL_BYTES)
+        # Guards output, which is written on the loop and read from request threads
+        self.lock = threading.Lock()
+        self._done = threading.Event()
+        self._done_async = asyncio.Event()
+        self._process = None
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the job finishes; returns whether it did within timeout."""
+        return self._done.wait(timeout)
+
+    async def wait_async(self, timeout: float = None) -> bool:
+        """Wait on the shared loop until the job finishes, without holding a thread."""
+        try:
+            await asyncio.wait_for(self._done_async.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def read_output(self, offset: int = 0) -> tuple:
+        """(text, start, end) of the output from byte offset on that is still in memory."""
+        with self.lock:
+            data, start = self.output.read_since(offset)
+            end = self.output.total_bytes
+        return data.decode('utf-8', errors='replace').replace('\r\n', '\n'), start, end
+
+    def output_text(self) -> str:
+        """Head and tail of the output, with the middle elided if it is large."""
+        with self.lock:
+            return self.output.text().replace('\r\n', '\n')
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'command': self.command,
+            'cwd': self.cwd,
+            'status': self.status,
+            'exit_code': self.exit_code,
+            'error': self.error,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'output_bytes': self.output.total_bytes,
+        }
+
+class JobManager:
+    """Registry of background jobs. At most MAX_RUNNING_JOBS run at once; the rest queue."""
+
+    def __init__(self, max_finished: int = MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def submit(self, command: str, cwd: str, session_id: str, prompts: tuple = None,
+               password: str = None, on_finish=None) -> Job:
+        """Queue a command to run on a PTY and return its job at once.
+
+        prompts, from compile_prompt_rules, are answered automatically; PASSWORD
+        responses send password. on_finish is called with the job once it is done.
+        """
+        job = Job(command, cwd, session_id, on_finish)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_finished()
+        future = asyncio.run_coroutine_threadsafe(_supervise(job, prompts, password), get_loop())
+        future.add_done_callback(lambda f: _on_supervisor_done(job, f))
+        return job
+
+    def submit_interactive(self, command: str, cwd: str, session_id: str, password: str = None,
+                           on_finish=None) -> Job:
+        """Queue a sudo command, answering its password and confirmation prompts."""
+        return self.submit(command, cwd, session_id, _SUDO_PROMPTS, password, on_finish)
+
+    def get(self, job_id: str, session_id: str = None) -> Job:
+        """Look up a job, optionally only among those owned by session_id."""
+        job = self._jobs.get(job_id)
+        if job is None or (session_id is not None and job.session_id != session_id):
+            return None
+        return job
+
+    def list(self, session_id: str = None) -> list:
+        """Jobs, oldest first, optionally only those owned by session_id."""
+        with self._lock:
+            return [job for job in self._jobs.values() if session_id is None or job.session_id == session_id]
+
+    def cancel(self, job: Job) -> bool:
+        """Stop a queued or running job; returns False if it had already finished."""
+        if job.done:
+            return False
+        job.cancel_requested = True
+        get_loop().call_soon_threadsafe(_terminate, job)
+        return True
+
+    def add_listener(self, callback):
+        """Call callback with every job that finishes. It runs on the event loop, so it must not block."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _notify(self, job: Job):
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(job)
+            except Exception:
+                pass
+
+    def shutdown(self):
+        """Kill the process groups of all running jobs."""
+        for job in self.list():
+            if job._process is not None and not job.done:
+                _kill(job._process)
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+jobs = JobManager()
+# Jobs run in their own sessions, so they would outlive the server otherwise
+atexit.register(jobs.shutdown)
+
+_job_semaphore = None
+
+def _job_slot() -> asyncio.Semaphore:
+    """Semaphore bounding the jobs running at once; only used on the shared loop."""
+    global _job_semaphore
+    if _job_semaphore is None:
+        _job_semaphore = asyncio.Semaphore(MAX_RUNNING_JOBS)
+    return _job_semaphore
+
+async def _supervise(job: Job, prompts: tuple, password: str):
+    """Wait for a free slot, then run the job."""
+    async with _job_slot():
+        if job.cancel_requested:
+            _finish(job, "cancelled")
+            return
+        await _run_job(job, prompts, password)
+
+async def _run_job(job: Job, prompts: tuple, password: str):
+    """Run a job's process on a PTY, answer prompts, and record how it ended."""
+    loop = asyncio.get_running_loop()
+    pattern, responses = prompts or (None, None)
+    env = dict(os.environ, TERM='dumb', PAGER='cat', GIT_PAGER='cat')
+    # The shell changes directory itself: ptyprocess does not report a failed chdir in the child
+    process = PtyProcess.spawn(
+        [SHELL, '-c', 'cd -- "$1" && eval "$2"', 'agent-job', job.cwd, job.command], env=env, echo=False
+    )
+    job._process = process
+    job.status = "running"
+    job.started = time.time()
+    eof = loop.create_future()
+    window = b""
+    passwords_sent = 0
+
+    def on_readable():
+        nonlocal window, passwords_sent
+        try:
+            data = os.read(process.fd, READ_CHUNK_SIZE)
+        except OSError:
+            # EIO once every process holding the terminal has exited
+            data = b""
+        if not data:
+            loop.remove_reader(process.fd)
+            if not eof.done():
+                eof.set_result(None)
+            return
+
+        with job.lock:
+            job.output.write(data)
+        if pattern is None:
+            return
+        window = (window + data)[-PROMPT_WINDOW:]
+        match = pattern.search(window)
+        if match is None:
+            return
+        window = window[match.end():]
+        response = responses[match.lastgroup]
+        if response is PASSWORD:
+            if password is None or passwords_sent:
+                # No password to give, or sudo rejected the one we sent
+                job.error = "sudo password was rejected" if passwords_sent else "no sudo password available"
+                _kill(process)
+                return
+            passwords_sent += 1
+            response = password
+        os.write(process.fd, f"{response}\n".encode())
+
+    loop.add_reader(process.fd, on_readable)
+    exited = asyncio.ensure_future(_wait_for_exit(process))
+    deadline = loop.time() + JOB_TIMEOUT
+    timed_out = False
+    try:
+        done, _ = await asyncio.wait({eof, exited}, timeout=JOB_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            timed_out = True
+        elif exited in done:
+            # The main process exited; give the rest of its output a moment to arrive
+            await asyncio.wait({eof}, timeout=EXIT_GRACE)
+        else:
+            # Output closed but the process is still running
+            done, _ = await asyncio.wait({exited}, timeout=max(0, deadline - loop.time()))
+            timed_out = not done
+    finally:
+        loop.remove_reader(process.fd)
+        # Reap anything the job left behind in its process group
+        _kill(process)
+        exit_code = await exited
+        process.close(force=True)
+
+    if timed_out:
+        status = "timed_out"
+        job.error = f"killed after {JOB_TIMEOUT} seconds"
+    elif job.cancel_requested:
+        status = "cancelled"
+    else:
+        status = "succeeded" if exit_code == 0 and job.error is None else "failed"
+    _finish(job, status, exit_code)
+
+async def _wait_for_exit(process: PtyProcess) -> int:
+    """Wait for a PTY process to exit without blocking the loop; returns its exit code."""
+    delay = 0.01
+    while process.isalive():
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.1)
+    if process.exitstatus is not None:
+        return process.exitstatus
+    return 128 + (process.signalstatus or 0)
+
+def _kill(process: PtyProcess, sig: int = signal.SIGKILL):
+    """Signal a PTY process along with everything in its process group."""
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _terminate(job: Job):
+    """Ask a running job to stop, killing it if it is still there after CANCEL_GRACE."""
+    process = job._process
+    if process is None or job.done:
+        # Queued jobs notice cancel_requested when they get a slot
+        return
+    _kill(process, signal.SIGTERM)
+    get_loop().call_later(CANCEL_GRACE, lambda: job.done or _kill(process))
+
+def _on_supervisor_done(job: Job, future):
+    """Mark a job failed if its supervisor crashed, e.g. because the command could not start."""
+    if not future.cancelled() and future.exception() is not None:
+        _finish(job, "failed", error=str(future.exception()))
+
+def _finish(job: Job, status: str, exit_code: int = None, error: str = None):
+    if job.done:
+        return
+    job.status = status
+    job.exit_code = exit_code
+    if error:
+        job.error = error
+    job.finished = time.time()
+    with job.lock:
+        job.output.close()
+    job._done.set()
+    # Async waiters live on the shared loop
+    get_loop().call_soon_threadsafe(job._done_async.set)
+    if job.on_finish is not None:
+        job.on_finish(job)
+    jobs._notify(job)
+
+def describe_job(job: Job) -> str:
+    """Human readable status of a job with the end of its output."""
+    lines = [f"Job {job.id}: {job.command}", f"Working directory: {job.cwd}"]
+    if job.done:
+        status = f"Status: {job.status}"
+        if job.exit_code is not None:
+            status += f" (exit code {job.exit_code})"
+        if job.error:
+            status += f" - {job.error}"
+        lines.append(status)
+        lines.append(f"Output:\n{job.output_text()}")
+    elif job.status == "queued":
+        lines.append(f"Status: queued for {int(time.time() - job.submitted)} seconds, waiting for a free slot")
+    else:
+        lines.append(f"Status: running for {int(time.time() - job.started)} seconds")
+        lines.append(tail_output(job))
+    return "\n".join(lines)
+
+def tail_output(job: Job, lines: int = None) -> str:
+    """The end of a job's output, optionally only its last few lines."""
+    text, start, end = job.read_output(max(0, job.output.total_bytes - STATUS_OUTPUT_BYTES))
+    if lines is not None:
+        text = "\n".join(text.rstrip("\n").split("\n")[-lines:]) + "\n"
+    return f"Latest output ({end} bytes so far):\n{text}"
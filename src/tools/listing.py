@@ -0,0 +1,148 @@
+import fnmatch
+import heapq
+import os
+import re
+import stat
+import time
+from itertools import islice
+
+# Entries per page when no limit is given, and the most a single page may hold
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 10_000
+
+def _type_of(entry: os.DirEntry) -> str:
+    # DirEntry caches the d_type from the directory read, so none of these stat the file
+    if entry.is_symlink():
+        return "symlink"
+    if entry.is_dir(follow_symlinks=False):
+        return "dir"
+    if entry.is_file(follow_symlinks=False):
+        return "file"
+    return "other"
+
+def _add_details(item: dict, stat_entry):
+    """Fill in size, mtime and mode; stat_entry is a DirEntry or a path, symlinks are not followed."""
+    try:
+        info = stat_entry.stat(follow_symlinks=False) if isinstance(stat_entry, os.DirEntry) else os.lstat(stat_entry)
+        item["size"] = info.st_size
+        item["mtime"] = info.st_mtime
+        item["mode"] = stat.filemode(info.st_mode)
+    except OSError:
+        item["size"] = item["mtime"] = item["mode"] = None
+    return item
+
+def _describe(entry: os.DirEntry, relative: str, details: bool) -> dict:
+    item = {"name": entry.name, "path": relative, "type": _type_of(entry)}
+    return _add_details(item, entry) if details else item
+
+def _matcher(pattern: str):
+    """Match function for a glob pattern, compiled once. Patterns with a '/' match the relative path."""
+    if not pattern:
+        return None
+    match = re.compile(fnmatch.translate(pattern)).match
+    if "/" in pattern:
+        return lambda item: match(item["path"]) is not None
+    return lambda item: match(item["name"]) is not None
+
+def scan_directory(path: str, pattern: str = None, recursive: bool = False, show_hidden: bool = True,
+                   max_depth: int = None, details: bool = True):
+    """Yield one dict per entry under path, in directory order.
+
+    Entries carry name, path (relative to the listed directory), type and, with details,
+    size, mtime and mode. Recursive scans go depth first without following symlinks and
+    hold only the stack of pending directories, so memory stays bounded however many
+    entries there are. Unreadable subdirectories yield an entry with an 'error' instead
+    of ending the scan; an unreadable top directory raises OSError.
+    """
+    matches = _matcher(pattern)
+    # (absolute path, path relative to the root, depth)
+    pending = [(path, "", 0)]
+    while pending:
+        directory, prefix, depth = pending.pop()
+        try:
+            iterator = os.scandir(directory)
+        except OSError as e:
+            if not prefix:
+                raise
+            yield {"name": os.path.basename(directory), "path": prefix, "type": "dir", "error": e.strerror or str(e)}
+            continue
+        with iterator:
+            subdirectories = []
+            for entry in iterator:
+                if not show_hidden and entry.name.startswith("."):
+                    continue
+                relative = prefix + entry.name
+                item = _describe(entry, relative, details)
+                if matches is None or matches(item):
+                    yield item
+                if recursive and item["type"] == "dir" and (max_depth is None or depth < max_depth):
+                    subdirectories.append((entry.path, relative + "/", depth + 1))
+        # Reversed so subdirectories are visited in the order they were listed
+        pending.extend(reversed(subdirectories))
+
+def list_page(path: str, offset: int = 0, limit: int = DEFAULT_LIMIT, pattern: str = None,
+              show_hidden: bool = True) -> tuple:
+    """One page of a directory's entries sorted by name, and the number of matching entries.
+
+    Only the first offset + limit entries are kept while scanning (a bounded heap),
+    so paging through a huge directory never holds all of it in memory, and only the
+    entries on the page are stat'ed.
+    """
+    limit = max(0, min(limit, MAX_LIMIT))
+    offset = max(0, offset)
+    total = 0
+
+    def counted(entries):
+        nonlocal total
+        for item in entries:
+            total += 1
+            yield item
+
+    entries = scan_directory(path, pattern=pattern, show_hidden=show_hidden, details=False)
+    first = heapq.nsmallest(offset + limit, counted(entries), key=lambda item: item["name"])
+    return [_add_details(item, os.path.join(path, item["path"])) for item in first[offset:]], total
+
+def iter_page(entries, offset: int, limit: int) -> list:
+    """Entries offset .. offset + limit of a stream, plus one more to tell whether it continues."""
+    return list(islice(entries, max(0, offset), max(0, offset) + max(0, limit) + 1))
+
+def format_size(size) -> str:
+    if size is None:
+        return "?"
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_entry(item: dict) -> str:
+    """One line of a text listing."""
+    if "error" in item:
+        return f"⚠️  {item['path']}/ ({item['error']})"
+    if item["type"] == "dir":
+        line = f"📁 {item['path']}/"
+    elif item["type"] == "symlink":
+        line = f"🔗 {item['path']}"
+    else:
+        line = f"📄 {item['path']}"
+    if item.get("mtime") is not None:
+        modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(item["mtime"]))
+        size = "" if item["type"] == "dir" else f"{format_size(item['size'])}, "
+        line += f"  ({size}{modified})"
+    return line
+
+def format_listing(path: str, items: list, offset: int = 0, total: int = None, more: bool = False,
+                   pattern: str = None) -> str:
+    """Text listing of one page of entries, with a hint on how to get the next page."""
+    matching = f" matching '{pattern}'" if pattern else ""
+    if not items:
+        if offset > 0:
+            return f"No more entries in '{path}'{matching} after the first {offset}."
+        return f"Directory '{path}' has no entries{matching}." if pattern else f"Directory '{path}' is empty."
+
+    lines = [f"Contents of '{path}'{matching}:"]
+    lines.extend(format_entry(item) for item in items)
+    if total is not None and (more or offset):
+        lines.append(f"Showing entries {offset + 1}-{offset + len(items)} of {total}.")
+    if more:
+        lines.append(f"More entries follow, use offset={offset + len(items)} to see them.")
+    return "\n".join(lines) + "\n"
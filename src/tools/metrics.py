@@ -0,0 +1,159 @@
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+# Set AGENT_METRICS=0 to disable instrumentation; timed() then returns functions unwrapped
+METRICS_ENABLED = os.getenv("AGENT_METRICS", "1") != "0"
+# When set, every recorded call is also appended to this file as one JSON line
+TRACE_FILE = os.getenv("AGENT_TRACE_FILE", "")
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class _Series:
+    """Counters and latency histogram of one instrumented operation."""
+
+    __slots__ = ("buckets", "count", "seconds", "errors", "output_bytes")
+
+    def __init__(self):
+        # One extra slot for observations above the largest bucket
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.output_bytes = 0
+
+# Metrics are per process; with several gunicorn workers each one reports its own
+_series = {}
+_tokens = {}
+_lock = threading.Lock()
+_trace = None
+_trace_lock = threading.Lock()
+
+def record(kind: str, name: str, seconds: float, error: bool = False, output_bytes: int = 0):
+    """Record one call of an operation, e.g. kind 'tool' and name 'run_command'."""
+    slot = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        series = _series.get((kind, name))
+        if series is None:
+            series = _series[(kind, name)] = _Series()
+        series.buckets[slot] += 1
+        series.count += 1
+        series.seconds += seconds
+        series.errors += error
+        series.output_bytes += output_bytes
+    if TRACE_FILE:
+        _write_trace({
+            "ts": time.time(), "kind": kind, "name": name, "ms": round(seconds * 1000, 3),
+            "error": error, "bytes": output_bytes
+        })
+
+def record_tokens(model: str, input_tokens: int, output_tokens: int):
+    """Count LLM tokens reported by the provider."""
+    with _lock:
+        _tokens[(model, "input")] = _tokens.get((model, "input"), 0) + input_tokens
+        _tokens[(model, "output")] = _tokens.get((model, "output"), 0) + output_tokens
+    if TRACE_FILE:
+        _write_trace({"ts": time.time(), "kind": "tokens", "name": model,
+                      "input": input_tokens, "output": output_tokens})
+
+def _write_trace(entry: dict):
+    global _trace
+    line = json.dumps(entry) + "\n"
+    with _trace_lock:
+        try:
+            if _trace is None:
+                # Line buffered, so concurrent workers appending to one file don't interleave lines
+                _trace = open(TRACE_FILE, "a", buffering=1)
+            _trace.write(line)
+        except OSError:
+            pass
+
+def _result_size(result) -> tuple:
+    """(is_error, output bytes) of a call's return value. Tools report errors as 'Error...' strings."""
+    if isinstance(result, str):
+        return result.startswith("Error"), len(result.encode("utf-8", errors="replace"))
+    return False, 0
+
+def timed(kind: str, name: str = None):
+    """Decorator recording latency, errors and output size of every call of a sync or async function."""
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+        label = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException:
+                    record(kind, label, time.perf_counter() - start, error=True)
+                    raise
+                record(kind, label, time.perf_counter() - start, *_result_size(result))
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                record(kind, label, time.perf_counter() - start, error=True)
+                raise
+            record(kind, label, time.perf_counter() - start, *_result_size(result))
+            return result
+        return wrapper
+    return decorate
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        series = [(kind, name, s.buckets[:], s.count, s.seconds, s.errors, s.output_bytes)
+                  for (kind, name), s in sorted(_series.items())]
+        tokens = sorted(_tokens.items())
+
+    lines = [
+        "# HELP agent_latency_seconds Latency of agent nodes, LLM calls, tools, commands and HTTP routes.",
+        "# TYPE agent_latency_seconds histogram",
+    ]
+    for kind, name, buckets, count, seconds, _, _ in series:
+        labels = f'kind="{_label(kind)}",name="{_label(name)}"'
+        cumulative = 0
+        for bound, observed in zip(LATENCY_BUCKETS, buckets):
+            cumulative += observed
+            lines.append(f'agent_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'agent_latency_seconds_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"agent_latency_seconds_sum{{{labels}}} {seconds}")
+        lines.append(f"agent_latency_seconds_count{{{labels}}} {count}")
+
+    lines += ["# HELP agent_errors_total Calls that raised or returned an error.",
+              "# TYPE agent_errors_total counter"]
+    for kind, name, _, _, _, errors, _ in series:
+        lines.append(f'agent_errors_total{{kind="{_label(kind)}",name="{_label(name)}"}} {errors}')
+
+    lines += ["# HELP agent_output_bytes_total Bytes returned by tools and sent by HTTP routes.",
+              "# TYPE agent_output_bytes_total counter"]
+    for kind, name, _, _, _, _, output_bytes in series:
+        lines.append(f'agent_output_bytes_total{{kind="{_label(kind)}",name="{_label(name)}"}} {output_bytes}')
+
+    lines += ["# HELP agent_llm_tokens_total LLM tokens reported by the provider.",
+              "# TYPE agent_llm_tokens_total counter"]
+    for (model, direction), count in tokens:
+        lines.append(f'agent_llm_tokens_total{{model="{_label(model)}",direction="{direction}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+def reset():
+    """Forget everything recorded so far."""
+    with _lock:
+        _series.clear()
+        _tokens.clear()
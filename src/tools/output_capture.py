@@ -0,0 +1,217 @@
+import mmap
+import os
+import re
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+# Bytes of command output kept in memory from the start and from the end
+HEAD_BYTES = int(os.getenv("AGENT_OUTPUT_HEAD_BYTES", str(8 * 1024)))
+TAIL_BYTES = int(os.getenv("AGENT_OUTPUT_TAIL_BYTES", str(8 * 1024)))
+# Full outputs larger than head + tail are written here so read_output can page through them
+SPILL_DIR = os.getenv("AGENT_OUTPUT_DIR", os.path.join(tempfile.gettempdir(), "agent-output"))
+# Spill files stop growing past this size, and only the newest MAX_SPILL_FILES are kept
+MAX_SPILL_BYTES = int(os.getenv("AGENT_MAX_SPILL_BYTES", str(1024 ** 3)))
+MAX_SPILL_FILES = int(os.getenv("AGENT_MAX_SPILL_FILES", "50"))
+# Upper bound on what a single read_output call returns
+MAX_READ_LINES = 500
+MAX_READ_BYTES = 64 * 1024
+# read_output remembers the offset of every LINE_INDEX_STEP-th line per file
+LINE_INDEX_STEP = 1000
+LINE_INDEX_CACHE_SIZE = 16
+
+_OUTPUT_ID_PATTERN = re.compile(r'out-[0-9a-f]{32}')
+
+class OutputCapture:
+    """Collects a stream of output bytes in constant memory.
+
+    The first HEAD_BYTES and last TAIL_BYTES are kept in memory. Once output grows
+    beyond that, everything is also written to a spill file whose id is reported
+    in the text so the rest can be read later with read_output.
+    """
+
+    def __init__(self, head_bytes: int = HEAD_BYTES, tail_bytes: int = TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.output_id = None
+        self.spill_truncated = False
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._spill = None
+        self._spilled_bytes = 0
+        self._last_byte = b""
+
+    def write(self, data: bytes):
+        """Add a chunk of output."""
+        if not data:
+            return
+        if self._spill is None and self.total_bytes + len(data) > self.head_bytes + self.tail_bytes:
+            self._open_spill()
+        if self._spill is not None:
+            self._write_spill(data)
+
+        self.total_bytes += len(data)
+        self.total_lines += data.count(b"\n")
+        self._last_byte = data[-1:]
+
+        room = self.head_bytes - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if data:
+            # Only the last tail_bytes of a chunk can survive, so never copy more than that
+            self._tail += data[-self.tail_bytes:]
+            if len(self._tail) > self.tail_bytes:
+                del self._tail[:len(self._tail) - self.tail_bytes]
+
+    def flush(self):
+        """File-like no-op so a capture can be used as a pexpect logfile."""
+        if self._spill is not None:
+            self._spill.flush()
+
+    def close(self):
+        """Finish the spill file, if any."""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines, counting a final line without a newline."""
+        return self.total_lines + (1 if self._last_byte not in (b"", b"\n") else 0)
+
+    def read_since(self, offset: int) -> tuple:
+        """Output from byte offset on that is still held in memory.
+
+        Returns (data, start); start is past offset when the bytes in between
+        were already dropped from the middle of the output.
+        """
+        head_length = len(self._head)
+        tail_start = self.total_bytes - len(self._tail)
+        if offset < head_length:
+            data = bytes(self._head[offset:])
+            if tail_start == head_length:
+                data += bytes(self._tail)
+            return data, offset
+        start = max(offset, tail_start)
+        return bytes(self._tail[start - tail_start:]), start
+
+    def text(self) -> str:
+        """The captured output as text, with the middle elided if it did not fit."""
+        head = self._head.decode('utf-8', errors='replace')
+        if self.total_bytes <= self.head_bytes + self.tail_bytes:
+            return head + self._tail.decode('utf-8', errors='replace')
+
+        omitted = self.total_bytes - len(self._head) - len(self._tail)
+        note = f"... [{omitted} bytes omitted; output was {self.total_bytes} bytes, {self.line_count} lines"
+        if self.output_id:
+            note += f"; full output saved as {self.output_id}, use read_output to see the rest"
+            if self.spill_truncated:
+                note += f" (only the first {MAX_SPILL_BYTES} bytes were saved)"
+        note += "] ..."
+        return f"{head}\n{note}\n{self._tail.decode('utf-8', errors='replace')}"
+
+    def _open_spill(self):
+        try:
+            # Outputs can hold secrets: the directory and files are readable by this user only
+            os.makedirs(SPILL_DIR, mode=0o700, exist_ok=True)
+            if os.stat(SPILL_DIR).st_uid != os.getuid():
+                # Created by someone else in a shared temporary directory
+                raise PermissionError(f"{SPILL_DIR} belongs to another user")
+            output_id = f"out-{uuid.uuid4().hex}"
+            fd = os.open(os.path.join(SPILL_DIR, output_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            self._spill = os.fdopen(fd, "wb")
+        except OSError:
+            # Without a spill file the output is still bounded, just not recoverable
+            return
+        self.output_id = output_id
+        _prune_spill_files()
+        # Nothing has been dropped yet, so head + tail is everything seen so far
+        self._write_spill(bytes(self._head) + bytes(self._tail))
+
+    def _write_spill(self, data: bytes):
+        room = MAX_SPILL_BYTES - self._spilled_bytes
+        if len(data) > room:
+            data = data[:room]
+            self.spill_truncated = True
+        if data:
+            self._spill.write(data)
+            self._spilled_bytes += len(data)
+
+def _prune_spill_files():
+    """Delete the oldest spill files beyond MAX_SPILL_FILES."""
+    try:
+        entries = [entry for entry in os.scandir(SPILL_DIR) if _OUTPUT_ID_PATTERN.fullmatch(entry.name)]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:-MAX_SPILL_FILES]:
+            os.remove(entry.path)
+            with _line_index_lock:
+                _line_indexes.pop(entry.name, None)
+    except OSError:
+        pass
+
+_line_indexes = OrderedDict()
+_line_index_lock = threading.Lock()
+
+def _line_index(output_id: str, mm, size: int) -> list:
+    """Byte offsets of line 1, LINE_INDEX_STEP + 1, 2 * LINE_INDEX_STEP + 1, ... of a spill file."""
+    with _line_index_lock:
+        cached = _line_indexes.get(output_id)
+        if cached is not None and cached[0] == size:
+            _line_indexes.move_to_end(output_id)
+            return cached[1]
+
+    offsets = [0]
+    position = 0
+    line = 0
+    while True:
+        position = mm.find(b"\n", position) + 1
+        if position == 0 or position >= size:
+            break
+        line += 1
+        if line % LINE_INDEX_STEP == 0:
+            offsets.append(position)
+
+    with _line_index_lock:
+        _line_indexes[output_id] = (size, offsets)
+        if len(_line_indexes) > LINE_INDEX_CACHE_SIZE:
+            _line_indexes.popitem(last=False)
+    return offsets
+
+def read_output_range(output_id: str, start_line: int, max_lines: int) -> tuple:
+    """Read lines [start_line, start_line + max_lines) of a spill file.
+
+    Returns (text, first_line, last_line, total_bytes). Lines are 1-based; the
+    file is memory-mapped so only the pages that are read are loaded.
+    """
+    if not _OUTPUT_ID_PATTERN.fullmatch(output_id):
+        raise ValueError(f"unknown output id '{output_id}'")
+    path = os.path.join(SPILL_DIR, output_id)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return "", 0, 0, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offsets = _line_index(output_id, mm, size)
+            # Jump to the nearest indexed line, then scan forward to start_line
+            slot = min((start_line - 1) // LINE_INDEX_STEP, len(offsets) - 1)
+            position = offsets[slot]
+            line = slot * LINE_INDEX_STEP + 1
+            while line < start_line:
+                next_position = mm.find(b"\n", position) + 1
+                if next_position == 0 or next_position >= size:
+                    return "", start_line, start_line - 1, size
+                position = next_position
+                line += 1
+
+            end = position
+            last_line = start_line - 1
+            while last_line < start_line - 1 + max_lines and end < size and end - position < MAX_READ_BYTES:
+                next_end = mm.find(b"\n", end)
+                end = size if next_end == -1 else next_end + 1
+                last_line += 1
+            end = min(end, position + MAX_READ_BYTES)
+            return mm[position:end].decode('utf-8', errors='replace'), start_line, last_line, size
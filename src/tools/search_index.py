@@ -0,0 +1,499 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+# NumPy is optional; it makes trigram extraction and posting list builds vectorized
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+# Indexes are persisted here, one file per indexed root
+INDEX_DIR = os.getenv("AGENT_INDEX_DIR", os.path.join(tempfile.gettempdir(), "agent-index"))
+# Files larger than this, and everything past MAX_FILES, are left out of the index
+MAX_FILE_BYTES = int(os.getenv("AGENT_INDEX_MAX_FILE_BYTES", str(4 * 1024 * 1024)))
+MAX_FILES = int(os.getenv("AGENT_INDEX_MAX_FILES", "200000"))
+# A search first rescans the tree for changed files if the index is older than this, in seconds
+REFRESH_INTERVAL = float(os.getenv("AGENT_INDEX_REFRESH", "10"))
+# Worker processes for trigram extraction; small batches of work are done in-process
+INDEX_WORKERS = int(os.getenv("AGENT_INDEX_WORKERS", str(os.cpu_count() or 1)))
+POOL_MIN_FILES = 256
+POOL_BATCH_FILES = 64
+# Directories never indexed
+SKIP_DIRS = frozenset({'.git', '.hg', '.svn', '__pycache__', 'node_modules', '.venv', 'venv',
+                       '.mypy_cache', '.pytest_cache', '.tox', '.cache'})
+# Files with a NUL byte in their first bytes are treated as binary
+BINARY_PROBE_BYTES = 8192
+# Postings of changed files are kept in a small side table until it grows past this
+# fraction of the main one, then both are merged and tombstoned files dropped
+MERGE_RATIO = 0.1
+MAX_MATCH_LINE_CHARS = 300
+INDEX_VERSION = 1
+
+def _trigrams(data: bytes) -> array:
+    """Sorted unique trigram keys of lowercased data; a trigram is packed as b0 << 16 | b1 << 8 | b2."""
+    data = data.lower()
+    if len(data) < 3:
+        return array('I')
+    if np is not None:
+        codes = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+        keys = np.unique((codes[:-2] << 16) | (codes[1:-1] << 8) | codes[2:])
+        return array('I', keys.astype(np.uint32).tobytes())
+    return array('I', sorted({data[i] << 16 | data[i + 1] << 8 | data[i + 2] for i in range(len(data) - 2)}))
+
+def _file_trigrams(path: str):
+    """Trigrams of a text file as bytes of an array('I'), or None for binary or unreadable files."""
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return b""
+            if size > MAX_FILE_BYTES:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm.find(b"\0", 0, BINARY_PROBE_BYTES) != -1:
+                    return None
+                return _trigrams(mm[:]).tobytes()
+    except (OSError, ValueError):
+        return None
+
+def _extract_batch(paths: list) -> list:
+    """Process pool entry point."""
+    return [_file_trigrams(path) for path in paths]
+
+def _walk(root: str):
+    """Yield (relative path, mtime_ns, size) of the regular files under root, without following symlinks."""
+    pending = [(root, "")]
+    while pending:
+        directory, prefix = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in SKIP_DIRS:
+                                pending.append((entry.path, prefix + entry.name + "/"))
+                        elif entry.is_file(follow_symlinks=False):
+                            info = entry.stat(follow_symlinks=False)
+                            yield prefix + entry.name, info.st_mtime_ns, info.st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+def _literal_runs(parsed) -> list:
+    """Literal strings every match of a parsed regex must contain (a conservative subset)."""
+    runs = []
+    current = []
+    for op, value in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(value))
+            continue
+        if current:
+            runs.append("".join(current))
+            current = []
+        if op is sre_constants.SUBPATTERN:
+            runs.extend(_literal_runs(value[-1]))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and value[0] >= 1:
+            runs.extend(_literal_runs(value[2]))
+        # Alternations, classes, wildcards and optional parts guarantee nothing
+    if current:
+        runs.append("".join(current))
+    return runs
+
+def _query_trigrams(query: str, is_regex: bool) -> set:
+    if is_regex:
+        try:
+            runs = _literal_runs(sre_parse.parse(query))
+        except Exception:
+            return set()
+    else:
+        runs = [query]
+    keys = set()
+    for run in runs:
+        keys.update(_trigrams(run.encode('utf-8', errors='replace')))
+    return keys
+
+def _contains(ids, value: int) -> bool:
+    index = bisect.bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+class FileIndex:
+    """Trigram index over the text files under one root directory.
+
+    Every file gets an id; the posting list of a trigram holds the ids of the files
+    containing it, sorted, in one compact CSR layout (keys, starts, ids arrays).
+    Changed files get a new id and their postings go to a small side table, while the
+    old id is tombstoned; the two are merged once the side table grows. A query only
+    opens the files whose ids are in every posting list of its trigrams.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(INDEX_DIR, hashlib.sha1(root.encode()).hexdigest() + ".idx")
+        # file id -> (relative path, mtime_ns, size), or None once the file changed or was removed
+        self.files = []
+        self.by_path = {}
+        # Binary and oversized files, remembered so they are not read again until they change
+        self.skipped = {}
+        self.keys = array('I')
+        self.starts = array('Q', [0])
+        self.ids = array('I')
+        self.delta = {}
+        self.delta_size = 0
+        # Tombstoned files whose ids are still in the posting lists
+        self.stale = 0
+        self.truncated = False
+        self.updated = 0.0
+        self.lock = threading.RLock()
+
+    def load(self) -> bool:
+        """Read the persisted index, if there is a usable one."""
+        try:
+            if not _own_index_dir():
+                return False
+            with open(self.path, 'rb') as f:
+                header = json.loads(f.readline())
+                if header.get("version") != INDEX_VERSION or header.get("root") != self.root:
+                    return False
+                arrays = []
+                for typecode, length in (('I', header["keys"]), ('Q', header["starts"]), ('I', header["ids"])):
+                    values = array(typecode)
+                    values.fromfile(f, length)
+                    arrays.append(values)
+            # A truncated or foreign file can have any shape; nothing is kept unless all of it reads
+            files = [tuple(entry) if entry is not None else None for entry in header["files"]]
+            skipped = {relative: tuple(stat) for relative, stat in header["skipped"].items()}
+            delta = {int(key): array('I', ids) for key, ids in header["delta"].items()}
+            stale, truncated = int(header["stale"]), bool(header["truncated"])
+            by_path = {entry[0]: file_id for file_id, entry in enumerate(files) if entry is not None}
+        except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError, IndexError, OverflowError):
+            return False
+        self.keys, self.starts, self.ids = arrays
+        self.files, self.skipped, self.delta, self.by_path = files, skipped, delta, by_path
+        self.delta_size = sum(len(ids) for ids in self.delta.values())
+        self.stale = stale
+        self.truncated = truncated
+        return True
+
+    def save(self):
+        """Persist the index atomically: a JSON header line followed by the raw posting arrays.
+
+        Persisting only saves rebuilding later, so the index stays in memory if it fails.
+        """
+        try:
+            if not _own_index_dir():
+                return
+        except OSError:
+            return
+        header = {
+            "version": INDEX_VERSION, "root": self.root, "truncated": self.truncated, "stale": self.stale,
+            "files": self.files, "skipped": self.skipped, "delta": {key: ids.tolist() for key, ids in self.delta.items()},
+            "keys": len(self.keys), "starts": len(self.starts), "ids": len(self.ids),
+        }
+        # A fresh name created with O_EXCL and mode 0o600
+        fd, temporary = tempfile.mkstemp(dir=INDEX_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(header).encode() + b"\n")
+                self.keys.tofile(f)
+                self.starts.tofile(f)
+                self.ids.tofile(f)
+            os.replace(temporary, self.path)
+        except OSError:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+
+    @property
+    def file_count(self) -> int:
+        return len(self.by_path)
+
+    def update(self) -> dict:
+        """Bring the index up to date with the tree: index new and changed files, drop removed ones."""
+        with self.lock:
+            start = time.perf_counter()
+            seen = set()
+            todo = []
+            truncated = False
+            for relative, mtime_ns, size in _walk(self.root):
+                if len(seen) >= MAX_FILES:
+                    truncated = True
+                    break
+                seen.add(relative)
+                file_id = self.by_path.get(relative)
+                if file_id is not None and self.files[file_id][1:] == (mtime_ns, size):
+                    continue
+                if self.skipped.get(relative) == (mtime_ns, size):
+                    continue
+                todo.append((relative, mtime_ns, size))
+
+            removed = [relative for relative in self.by_path if relative not in seen]
+            changed = sum(1 for relative, _, _ in todo if relative in self.by_path or relative in self.skipped)
+            for relative in [relative for relative in self.skipped if relative not in seen]:
+                del self.skipped[relative]
+            for relative in removed + [relative for relative, _, _ in todo]:
+                self.skipped.pop(relative, None)
+                file_id = self.by_path.pop(relative, None)
+                if file_id is not None:
+                    self.files[file_id] = None
+                    self.stale += 1
+
+            self._add_files(todo)
+            self.truncated = truncated
+            if self.delta_size > MERGE_RATIO * len(self.ids) or self.stale > MERGE_RATIO * len(self.by_path):
+                self._merge()
+            if todo or removed:
+                self.save()
+            self.updated = time.monotonic()
+            return {
+                "files": self.file_count, "added": len(todo) - changed, "changed": changed,
+                "removed": len(removed), "skipped": len(self.skipped), "seconds": time.perf_counter() - start,
+                "truncated": truncated,
+            }
+
+    def _add_files(self, todo: list):
+        paths = [os.path.join(self.root, relative) for relative, _, _ in todo]
+        if len(paths) >= POOL_MIN_FILES and INDEX_WORKERS > 1:
+            batches = [paths[i:i + POOL_BATCH_FILES] for i in range(0, len(paths), POOL_BATCH_FILES)]
+            # Spawned rather than forked: the server process runs threads and an event loop
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=INDEX_WORKERS, mp_context=context) as pool:
+                results = [trigrams for batch in pool.map(_extract_batch, batches) for trigrams in batch]
+        else:
+            results = _extract_batch(paths)
+
+        added = []
+        for (relative, mtime_ns, size), trigrams in zip(todo, results):
+            if trigrams is None:
+                self.skipped[relative] = (mtime_ns, size)
+                continue
+            file_id = len(self.files)
+            self.files.append((relative, mtime_ns, size))
+            self.by_path[relative] = file_id
+            keys = array('I')
+            keys.frombytes(trigrams)
+            added.append((file_id, keys))
+
+        # Large batches (a first build) go straight into the main lists in one vectorized pass
+        if np is not None and len(added) > POOL_BATCH_FILES:
+            self._merge(added)
+            return
+        for file_id, keys in added:
+            for key in keys:
+                ids = self.delta.get(key)
+                if ids is None:
+                    self.delta[key] = array('I', [file_id])
+                else:
+                    ids.append(file_id)
+            self.delta_size += len(keys)
+
+    def _merge(self, added: list = ()):
+        """Fold the side table and any (file id, trigrams) in added into the main posting
+        lists, dropping tombstoned ids."""
+        alive = [entry is not None for entry in self.files]
+        if np is not None:
+            keys = np.frombuffer(self.keys, dtype=np.uint32)
+            counts = np.diff(np.frombuffer(self.starts, dtype=np.uint64)).astype(np.int64)
+            all_keys = [np.repeat(keys, counts)]
+            all_ids = [np.frombuffer(self.ids, dtype=np.uint32)]
+            for key, ids in self.delta.items():
+                all_keys.append(np.full(len(ids), key, dtype=np.uint32))
+                all_ids.append(np.frombuffer(ids, dtype=np.uint32))
+            for file_id, file_keys in added:
+                all_keys.append(np.frombuffer(file_keys, dtype=np.uint32))
+                all_ids.append(np.full(len(file_keys), file_id, dtype=np.uint32))
+            merged_keys = np.concatenate(all_keys)
+            merged_ids = np.concatenate(all_ids)
+            keep = np.asarray(alive, dtype=bool)[merged_ids] if len(merged_ids) else np.zeros(0, dtype=bool)
+            merged_keys, merged_ids = merged_keys[keep], merged_ids[keep]
+            order = np.lexsort((merged_ids, merged_keys))
+            merged_keys, merged_ids = merged_keys[order], merged_ids[order]
+            unique_keys, first = np.unique(merged_keys, return_index=True)
+            starts = np.append(first, len(merged_ids)).astype(np.uint64)
+            self.keys = array('I', unique_keys.astype(np.uint32).tobytes())
+            self.starts = array('Q', starts.tobytes())
+            self.ids = array('I', merged_ids.astype(np.uint32).tobytes())
+        else:
+            postings = {}
+            for index, key in enumerate(self.keys):
+                postings[key] = [i for i in self.ids[self.starts[index]:self.starts[index + 1]] if alive[i]]
+            for key, ids in self.delta.items():
+                postings.setdefault(key, []).extend(i for i in ids if alive[i])
+            for file_id, file_keys in added:
+                for key in file_keys:
+                    postings.setdefault(key, []).append(file_id)
+            self.keys, self.starts, self.ids = array('I'), array('Q', [0]), array('I')
+            for key in sorted(postings):
+                if postings[key]:
+                    self.keys.append(key)
+                    self.ids.extend(sorted(postings[key]))
+                    self.starts.append(len(self.ids))
+        self.delta = {}
+        self.delta_size = 0
+        self.stale = 0
+
+    def _posting(self, key: int) -> list:
+        index = bisect.bisect_left(self.keys, key)
+        ids = []
+        if index < len(self.keys) and self.keys[index] == key:
+            ids = self.ids[self.starts[index]:self.starts[index + 1]]
+        extra = self.delta.get(key)
+        return list(ids) + list(extra) if extra else ids
+
+    def candidates(self, query_keys: set) -> list:
+        """Ids of live files containing every trigram in query_keys (all live files if there are none)."""
+        if not query_keys:
+            return [file_id for file_id, entry in enumerate(self.files) if entry is not None]
+        postings = sorted((self._posting(key) for key in query_keys), key=len)
+        # Start from the rarest trigram and binary search the others
+        found = [file_id for file_id in postings[0] if self.files[file_id] is not None]
+        for ids in postings[1:]:
+            if not found:
+                break
+            found = [file_id for file_id in found if _contains(ids, file_id)]
+        return found
+
+    def search(self, query: str, is_regex: bool = False, ignore_case: bool = False,
+               max_results: int = 50, prefix: str = "") -> tuple:
+        """Find matching lines. Returns ([(path, line number, line)], files searched, files matched)."""
+        flags = re.IGNORECASE if ignore_case else 0
+        pattern = re.compile(query.encode() if is_regex else re.escape(query.encode()), flags | re.MULTILINE)
+        with self.lock:
+            file_ids = self.candidates(_query_trigrams(query, is_regex))
+            paths = sorted(self.files[file_id][0] for file_id in file_ids)
+        if prefix:
+            paths = [path for path in paths if path.startswith(prefix)]
+
+        matches = []
+        matched_files = 0
+        for relative in paths:
+            found = _search_file(os.path.join(self.root, relative), pattern, max_results - len(matches))
+            if found:
+                matched_files += 1
+                matches.extend((relative, line, text) for line, text in found)
+            if len(matches) >= max_results:
+                break
+        return matches, len(paths), matched_files
+
+def _search_file(path: str, pattern, limit: int) -> list:
+    """(line number, line) of up to limit lines of a file matching pattern."""
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                found = []
+                line = 1
+                counted_to = 0
+                last_line_start = -1
+                for match in pattern.finditer(mm):
+                    start = mm.rfind(b"\n", 0, match.start()) + 1
+                    if start == last_line_start:
+                        continue
+                    line += mm[counted_to:start].count(b"\n")
+                    counted_to = start
+                    last_line_start = start
+                    end = mm.find(b"\n", match.start())
+                    text = mm[start:end if end != -1 else len(mm)].decode('utf-8', errors='replace').rstrip("\r")
+                    found.append((line, text[:MAX_MATCH_LINE_CHARS]))
+                    if len(found) >= limit:
+                        break
+                return found
+    except (OSError, ValueError):
+        return []
+
+def _own_index_dir() -> bool:
+    """Create INDEX_DIR if needed and tell whether it belongs to this user. Indexes in a
+    directory another user made in a shared temporary directory are neither read nor written."""
+    os.makedirs(INDEX_DIR, mode=0o700, exist_ok=True)
+    return os.stat(INDEX_DIR).st_uid == os.getuid()
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(path: str) -> tuple:
+    """The index covering path and path's prefix relative to that index's root.
+
+    An index already built for path or one of its parents is reused; otherwise a new
+    index rooted at path is loaded from disk or built.
+    """
+    path = os.path.realpath(path)
+    with _indexes_lock:
+        candidate = path
+        while True:
+            index = _indexes.get(candidate)
+            if index is None:
+                index = FileIndex(candidate)
+                if not index.load():
+                    index = None
+                else:
+                    _indexes[candidate] = index
+            if index is not None:
+                prefix = os.path.relpath(path, candidate)
+                return index, "" if prefix == "." else prefix + "/"
+            parent = os.path.dirname(candidate)
+            if parent == candidate:
+                break
+            candidate = parent
+
+        index = FileIndex(path)
+        index.load()
+        _indexes[path] = index
+        return index, ""
+
+def index_files(path: str) -> str:
+    """Build or refresh the index for path and describe it."""
+    if not os.path.isdir(path):
+        return f"Error: '{path}' is not a directory"
+    index, _ = get_index(path)
+    stats = index.update()
+    note = f" (stopped at {MAX_FILES} files)" if stats["truncated"] else ""
+    return (f"Indexed {stats['files']} files under '{index.root}'{note} in {stats['seconds']:.2f}s: "
+            f"{stats['added']} added, {stats['changed']} changed, {stats['removed']} removed; "
+            f"{stats['skipped']} binary or oversized files left out.")
+
+def search_files(query: str, path: str, regex: bool = False, ignore_case: bool = False,
+                 max_results: int = 50) -> str:
+    """Search the text files under path for a substring or regex and list the matching lines."""
+    if not query:
+        return "Error: Empty search query"
+    if not os.path.isdir(path):
+        return f"Error: '{path}' is not a directory"
+    if regex:
+        try:
+            re.compile(query)
+        except re.error as e:
+            return f"Error: invalid regular expression: {str(e)}"
+
+    start = time.perf_counter()
+    index, prefix = get_index(path)
+    if time.monotonic() - index.updated > REFRESH_INTERVAL:
+        index.update()
+    matches, searched, matched_files = index.search(query, regex, ignore_case, max(1, max_results), prefix)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if not matches:
+        return f"No matches for '{query}' under '{path}' ({searched} candidate files checked, {elapsed:.0f} ms)."
+    lines = [f"{relative}:{line}: {text}" for relative, line, text in matches]
+    summary = f"{len(matches)} matching lines in {matched_files} files under '{index.root}'"
+    if len(matches) >= max_results:
+        summary += f" (stopped at {max_results}, narrow the query or raise max_results)"
+    summary += f"; {searched} of {index.file_count} indexed files checked, {elapsed:.0f} ms."
+    return "\n".join(lines) + "\n" + summary
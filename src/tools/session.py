@@ -0,0 +1,117 @@
+import asyncio
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Least recently used sessions are evicted beyond this many
+MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "256"))
+
+# Session used by the CLI and any code running outside a request
+DEFAULT_SESSION_ID = "local"
+
+_SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+class Session:
+    """Per-user state. The session id doubles as the agent's checkpoint thread id,
+    so conversation history lives in the checkpointer rather than here."""
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.cwd = os.getcwd()
+        self.last_used = time.monotonic()
+        # Serializes agent turns within one session; only used on the shared event loop
+        self.turn_lock = asyncio.Lock()
+        # Persistent shell used by run_command, created on first use (see system_commands.py)
+        self.shell = None
+        self.shell_lock = threading.Lock()
+
+    def close(self):
+        """Release resources held by the session."""
+        if self.shell is not None:
+            self.shell.close()
+            self.shell = None
+
+class SessionStore:
+    """Thread-safe session registry with LRU eviction."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Session:
+        """Return the session for session_id, creating it if needed."""
+        evicted = []
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    evicted.append(self._sessions.popitem(last=False)[1])
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+
+        for old_session in evicted:
+            old_session.close()
+        return session
+
+    def remove(self, session_id: str):
+        """Drop a session and release its resources."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        """Drop every session and release its resources, e.g. when the process exits."""
+        with self._lock:
+            closing = list(self._sessions.values())
+            self._sessions.clear()
+        for session in closing:
+            session.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+sessions = SessionStore()
+
+_current_session = ContextVar("current_session", default=None)
+
+def is_valid_session_id(session_id) -> bool:
+    """Check that a client supplied session id is safe to use as a key."""
+    return bool(session_id) and _SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+def new_session_id() -> str:
+    """Generate a fresh random session id."""
+    return uuid.uuid4().hex
+
+def current_session() -> Session:
+    """Return the session bound to the current context, or the default local session."""
+    session = _current_session.get()
+    if session is None:
+        session = sessions.get(DEFAULT_SESSION_ID)
+    return session
+
+def bind_session(session: Session):
+    """Bind a session to the current context and return a token for unbind_session."""
+    return _current_session.set(session)
+
+def unbind_session(token):
+    """Restore the session binding that was active before bind_session."""
+    _current_session.reset(token)
+
+@contextmanager
+def use_session(session: Session):
+    """Run a block of code with session bound as the current session."""
+    token = bind_session(session)
+    try:
+        yield session
+    finally:
+        unbind_session(token)
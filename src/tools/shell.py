@@ -0,0 +1,187 @@
+import base64
+import os
+import re
+import time
+import uuid
+import pexpect
+
+SHELL = os.getenv("AGENT_SHELL", "/bin/bash")
+READ_CHUNK_SIZE = 64 * 1024
+# Seconds to wait for the shell to come back after interrupting a command
+INTERRUPT_GRACE = 5
+# Base64 characters sent per input line. A PTY in canonical mode cuts lines off at
+# 4096 bytes, so longer commands are sent over several lines
+PAYLOAD_CHUNK_SIZE = 3072
+
+class ShellExited(Exception):
+    """The shell process died, e.g. because a command ran `exit` or failed under `set -e`.
+
+    exit_code is the shell's exit status and cwd its last working directory, each None
+    when unknown.
+    """
+
+    def __init__(self, exit_code: int = None, cwd: str = None):
+        super().__init__(f"The shell exited with status {exit_code}")
+        self.exit_code = exit_code
+        self.cwd = cwd
+
+class CommandTimeout(Exception):
+    """A command did not finish in time and was interrupted."""
+
+class CommandCancelled(Exception):
+    """A command was stopped by its caller and interrupted."""
+
+class ShellSession:
+    """A long-lived bash process on a PTY that runs commands one at a time.
+
+    Every command is followed by a unique sentinel line carrying its exit status
+    and the shell's working directory, so output framing does not depend on
+    prompts. Commands are passed base64-encoded through eval, which keeps
+    multi-line input, quotes and syntax errors from breaking the framing. An EXIT
+    trap prints the sentinel too, flagged with an x, so a command that ends the
+    shell still reports its status.
+    """
+
+    def __init__(self, cwd: str):
+        self._marker = f"__AGENT_DONE_{uuid.uuid4().hex}__".encode()
+        self._sentinel = re.compile(re.escape(self._marker) + rb':(-?\d+)(x?):([^\r\n]*)\r?\n')
+        env = dict(os.environ, PS1='', PS2='', TERM='dumb', PAGER='cat', GIT_PAGER='cat')
+        self.child = pexpect.spawn(
+            SHELL, ['--norc', '--noprofile', '--noediting'],
+            cwd=cwd, env=env, echo=False, encoding=None
+        )
+        # pexpect sleeps 50 ms before every send by default, which would dominate short commands
+        self.child.delaybeforesend = None
+        self.child.sendline("set +m; unset HISTFILE PROMPT_COMMAND; PS1=''; PS2=''")
+        self.child.sendline(
+            f"__agent_on_exit() {{ __agent_status=$?; {self._sentinel_command('${__agent_status}x')}; }}; "
+            "trap __agent_on_exit EXIT"
+        )
+        self._send_sentinel()
+        self._read_until_sentinel(time.monotonic() + 10, lambda data: None)
+
+    def is_alive(self) -> bool:
+        return self.child.isalive()
+
+    def run(self, command: str, timeout: float, on_output, stop=None) -> tuple:
+        """Run a command, passing its output bytes to on_output as they arrive.
+
+        Returns (exit_code, cwd). Raises CommandTimeout, CommandCancelled once the
+        threading.Event stop is set, or ShellExited carrying the command's status if
+        it ended the shell. Callers must not run commands on the same shell concurrently.
+        """
+        encoded = base64.b64encode(command.encode()).decode()
+        self.child.sendline("__agent_b64=''")
+        for start in range(0, len(encoded), PAYLOAD_CHUNK_SIZE):
+            self.child.sendline(f"__agent_b64+={encoded[start:start + PAYLOAD_CHUNK_SIZE]}")
+        self.child.sendline(
+            f"__agent_cmd=$(printf %s \"$__agent_b64\" | base64 -d); eval \"$__agent_cmd\" </dev/null; "
+            # errexit would end the shell at the next failing command
+            f"__agent_status=$?; set +e; {self._sentinel_command('$__agent_status')}"
+        )
+        try:
+            return self._read_until_sentinel(time.monotonic() + timeout, on_output, stop)
+        except (CommandTimeout, CommandCancelled):
+            self._interrupt()
+            raise
+
+    def close(self):
+        """Terminate the shell process."""
+        try:
+            self.child.close(force=True)
+        except Exception:
+            pass
+
+    def _sentinel_command(self, status: str) -> str:
+        return f"printf '\\n%s:%s:%s\\n' '{self._marker.decode()}' \"{status}\" \"$PWD\""
+
+    def _send_sentinel(self, status: str = '$?'):
+        self.child.sendline(self._sentinel_command(status))
+
+    def _interrupt(self):
+        """Interrupt the running command and resynchronize, or kill the shell."""
+        self.child.sendintr()
+        # An interrupt aborts the whole input line, so the sentinel has to be resent
+        self._send_sentinel('130')
+        try:
+            self._read_until_sentinel(time.monotonic() + INTERRUPT_GRACE, lambda data: None)
+        except (CommandTimeout, ShellExited):
+            self.close()
+
+    def _sentinel_start(self, buffer: bytes, line_start: bool) -> int:
+        """Index from which buffer could be the beginning of the sentinel line, or of the
+        "exit" line an interactive bash prints before its EXIT trap's sentinel.
+
+        line_start tells whether the output before buffer ended a line.
+        """
+        sentinel = b"\r\n" + self._marker
+        exiting = b"exit\r\n" + sentinel
+        for index in range(max(0, len(buffer) - len(exiting)), len(buffer)):
+            rest = buffer[index:]
+            if sentinel.startswith(rest) or sentinel[1:].startswith(rest):
+                return index
+            at_line_start = buffer[index - 1:index] == b"\n" if index else line_start
+            if at_line_start and exiting.startswith(rest):
+                return index
+        return len(buffer)
+
+    def _read_until_sentinel(self, deadline: float, on_output, stop=None) -> tuple:
+        buffer = b""
+        line_start = True
+        # A stoppable command is checked on several times a second even when it is silent
+        poll = 0.2 if stop is not None else 1
+        
+        def emit(data: bytes):
+            nonlocal line_start
+            if data:
+                on_output(data)
+                line_start = data.endswith(b"\n")
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CommandTimeout()
+            if stop is not None and stop.is_set():
+                raise CommandCancelled()
+            try:
+                buffer += self.child.read_nonblocking(READ_CHUNK_SIZE, timeout=min(remaining, poll))
+            except pexpect.TIMEOUT:
+                continue
+            except pexpect.EOF:
+                # The shell died without running its EXIT trap, e.g. killed or replaced by exec
+                emit(buffer)
+                self.close()
+                if self.child.signalstatus is not None:
+                    raise ShellExited(128 + self.child.signalstatus)
+                raise ShellExited(self.child.exitstatus)
+
+            start = buffer.find(self._marker)
+            # Only bytes that might begin the sentinel line are held back, so short output
+            # still streams as soon as it arrives
+            held = self._sentinel_start(buffer if start == -1 else buffer[:start + len(self._marker)], line_start)
+            emit(buffer[:held])
+            buffer = buffer[held:]
+            if start == -1:
+                continue
+
+            match = self._sentinel.search(buffer)
+            if match is None:
+                # Sentinel line not complete yet
+                continue
+
+            # Drop the newline the sentinel printf puts before its marker
+            output = buffer[:match.start()]
+            if output.endswith(b"\r\n"):
+                output = output[:-2]
+            elif output.endswith(b"\n"):
+                output = output[:-1]
+            exit_code, cwd = int(match.group(1)), match.group(3).decode('utf-8', errors='replace')
+            if match.group(2):
+                # Printed by the EXIT trap; an interactive bash says "exit" as it leaves
+                if output.endswith(b"exit\r\n"):
+                    output = output[:-len(b"exit\r\n")]
+                emit(output)
+                self.close()
+                raise ShellExited(exit_code, cwd)
+            emit(output)
+            return exit_code, cwd
@@ -1,11 +1,40 @@
-from langchain_core.tools import tool
+import asyncio
 import os
+import codecs
+import queue
+import selectors
+import signal
 import subprocess
-import pexpect
+import threading
+import time
 from pathlib import Path
+# Handle both relative and absolute imports
+try:
+    from .async_runtime import tool_slot, run_sync
+    from .fingerprint import get_fingerprint, invalidate_fingerprint
+    from .session import current_session
+    from .shell import ShellSession, CommandTimeout, CommandCancelled, ShellExited
+    from .output_capture import OutputCapture
+    from .jobs import Job, jobs
+    from .listing import scan_directory, list_page, iter_page, format_listing, DEFAULT_LIMIT
+    from .metrics import timed
+except ImportError:
+    from async_runtime import tool_slot, run_sync
+    from fingerprint import get_fingerprint, invalidate_fingerprint
+    from session import current_session
+    from shell import ShellSession, CommandTimeout, CommandCancelled, ShellExited
+    from output_capture import OutputCapture
+    from jobs import Job, jobs
+    from listing import scan_directory, list_page, iter_page, format_listing, DEFAULT_LIMIT
+    from metrics import timed
 
-# Global variable to track current working directory
-_current_dir = os.getcwd()
+# Streaming mode reads pipes in bounded chunks so memory stays flat for huge outputs
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_TIMEOUT = 600
+# Seconds a run_command call may take before it is interrupted
+COMMAND_TIMEOUT = 60
+# Seconds run_command waits for a sudo job before handing back its job id
+SUDO_WAIT = int(os.getenv("AGENT_SUDO_WAIT", "10"))
 
 def _get_sudo_password():
     """Read sudo password from sudopass.txt file."""
@@ -23,245 +52,386 @@ def _ask_user_permission(command: str) -> bool:
     response = input("Do you want to proceed? (y/N): ").strip().lower()
     return response in ['y', 'yes']
 
-@tool
 def detect_system() -> str:
     """Detect the operating system and distribution."""
     try:
-        # Check for various OS release files
-        if os.path.exists('/etc/arch-release'):
-            return "Arch Linux"
-        elif os.path.exists('/etc/debian_version'):
-            return "Debian/Ubuntu"
-        elif os.path.exists('/etc/redhat-release'):
-            return "Red Hat/CentOS"
-        elif os.path.exists('/etc/fedora-release'):
-            return "Fedora"
-        elif os.path.exists('/etc/opensuse-release'):
-            return "openSUSE"
-        
-        # Check for package managers
-        package_managers = {
-            'pacman': 'Arch-based',
-            'apt': 'Debian-based',
-            'yum': 'Red Hat-based',
-            'dnf': 'Fedora-based',
-            'zypper': 'openSUSE-based'
-        }
-        
-        for pm, distro in package_managers.items():
-            try:
-                subprocess.run(['which', pm], capture_output=True, check=True)
-                return distro
-            except subprocess.CalledProcessError:
-                continue
-        
-        # Fallback to uname
-        result = subprocess.run(['uname', '-s'], capture_output=True, text=True)
-        if result.returncode == 0:
-            system = result.stdout.strip()
-            return system
-        
-        return "Unknown system"
+        return get_fingerprint()['system']
     except Exception as e:
         return f"Detection error: {str(e)}"
 
-@tool
 def get_system_info() -> str:
     """Get comprehensive system information including OS, kernel, and available package managers."""
     try:
-        info = []
+        fingerprint = get_fingerprint()
+        info = [f"System: {fingerprint['system']}"]
         
-        # Get OS info
-        system = detect_system()
-        info.append(f"System: {system}")
-        
-        # Get kernel info
-        kernel_result = subprocess.run(['uname', '-r'], capture_output=True, text=True)
-        if kernel_result.returncode == 0:
-            info.append(f"Kernel: {kernel_result.stdout.strip()}")
-        
-        # Check available package managers
-        package_managers = ['pacman', 'apt', 'yum', 'dnf', 'zypper', 'brew']
-        available_pm = []
-        
-        for pm in package_managers:
-            try:
-                subprocess.run(['which', pm], capture_output=True, check=True)
-                available_pm.append(pm)
-            except subprocess.CalledProcessError:
-                continue
+        if fingerprint['distribution']:
+            info.append(f"Distribution: {fingerprint['distribution']}")
+        info.append(f"Kernel: {fingerprint['kernel']}")
         
-        if available_pm:
-            info.append(f"Available package managers: {', '.join(available_pm)}")
+        if fingerprint['package_managers']:
+            info.append(f"Available package managers: {', '.join(fingerprint['package_managers'])}")
         
         return '\n'.join(info)
     except Exception as e:
         return f"Error getting system info: {str(e)}"
 
-@tool
-def list_directory(path: str = ".") -> str:
-    """List files and directories in the specified path. Default is current directory."""
-    global _current_dir
-    
-    # If path is relative, make it relative to current working directory
+def resolve_path(path: str) -> str:
+    """Resolve a user supplied path against the session's working directory."""
+    path = os.path.expanduser(path or ".")
     if not os.path.isabs(path):
-        path = os.path.join(_current_dir, path)
+        path = os.path.join(current_session().cwd, path)
+    return path
+
+def list_directory(path: str = ".", pattern: str = None, offset: int = 0, limit: int = DEFAULT_LIMIT,
+                   recursive: bool = False) -> str:
+    """List files and directories in the specified path with their size and modification time.
+    Default is current directory."""
+    path = resolve_path(path)
     
     try:
-        items = os.listdir(path)
-        if not items:
-            return f"Directory '{path}' is empty."
+        if recursive:
+            # Recursive listings come in scan order, so there is no total without a full walk
+            page = iter_page(scan_directory(path, pattern=pattern, recursive=True), offset, limit)
+            items, more, total = page[:limit], len(page) > limit, None
+        else:
+            items, total = list_page(path, offset, limit, pattern)
+            more = offset + len(items) < total
         
-        result = f"Contents of '{path}':\n"
-        for item in sorted(items):
-            full_path = os.path.join(path, item)
-            if os.path.isdir(full_path):
-                result += f"📁 {item}/\n"
-            else:
-                result += f"📄 {item}\n"
-        return result
+        return format_listing(path, items, offset, total, more, pattern)
     except Exception as e:
         return f"Error listing directory '{path}': {str(e)}"
 
-@tool
 def run_command(command: str) -> str:
     """Execute any terminal command including sudo commands with automatic password handling."""
-    global _current_dir
+    session = current_session()
     
     if not command.strip():
         return "Error: Empty command provided"
     
-    # Handle cd command specially
-    if command.strip().startswith('cd'):
-        parts = command.strip().split(maxsplit=1)
-        if len(parts) == 1:
-            # cd without arguments goes to home directory
-            target_dir = os.path.expanduser('~')
-        else:
-            target_dir = parts[1]
-            # Expand ~ and environment variables first
-            target_dir = os.path.expanduser(target_dir)
-            target_dir = os.path.expandvars(target_dir)
-            # Handle relative paths (after expansion)
-            if not os.path.isabs(target_dir):
-                target_dir = os.path.join(_current_dir, target_dir)
-        
-        try:
-            # Resolve the path and check if it exists
-            target_dir = os.path.abspath(target_dir)
-            if os.path.isdir(target_dir):
-                _current_dir = target_dir
-                return f"Changed directory to: {_current_dir}"
-            else:
-                return f"cd: no such file or directory: {target_dir}"
-        except Exception as e:
-            return f"cd: error changing directory: {str(e)}"
-    
     # Check if command requires sudo
     is_sudo_command = command.strip().startswith('sudo')
     
     if is_sudo_command:
-        # For web interface, we'll skip the interactive permission request
-        # and just try to use the password from file
-        sudo_password = _get_sudo_password()
-        if not sudo_password:
-            return "Error: Could not read sudo password from sudopass.txt. Sudo commands require password setup."
+        try:
+            job = start_sudo_job(command)
+        except ValueError as e:
+            return f"Error: {str(e)}"
+        job.wait(SUDO_WAIT)
+        return _format_job_result(job)
+    
+    # Other commands run in the session's persistent shell, so cd, export, source etc.
+    # carry over between calls. If that shell is busy with another command, run a
+    # one-off process in the same directory instead.
+    result = _run_in_shell(session, command)
+    if result is not None:
+        return result
+    
+    return run_sync(_arun_oneshot(session, command))
+
+async def arun_command(command: str) -> str:
+    """Async version of run_command used when the agent graph runs tools concurrently."""
+    if not command.strip():
+        return "Error: Empty command provided"
+    
+    # sudo runs as a background job; waiting for it does not hold a thread
+    if command.strip().startswith('sudo'):
+        try:
+            job = start_sudo_job(command)
+        except ValueError as e:
+            return f"Error: {str(e)}"
+        await job.wait_async(SUDO_WAIT)
+        return _format_job_result(job)
+    
+    session = current_session()
+    result = await asyncio.to_thread(_run_in_shell, session, command)
+    if result is not None:
+        return result
+    
+    # The session's shell is busy with another call from this turn, run this one on its own
+    return await _arun_oneshot(session, command)
+
+async def _arun_oneshot(session, command: str) -> str:
+    """Run a command in its own process in the session's directory, capturing output in bounded memory."""
+    async with tool_slot():
+        return await arun_in_directory(command, session.cwd)
+
+@timed("command", "subprocess")
+async def arun_in_directory(command: str, cwd: str, timeout: float = COMMAND_TIMEOUT) -> str:
+    """Run a command in its own process in cwd and report it the way run_command does.
+
+    Unlike run_command it leaves the session's shell and directory alone, so any number
+    of these can run at once. Cancelling the call kills the command's process group.
+    """
+    stdout, stderr = OutputCapture(), OutputCapture()
+    try:
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=True
+        )
+        reading = asyncio.gather(
+            _read_into(process.stdout, stdout),
+            _read_into(process.stderr, stderr),
+            process.wait()
+        )
+        try:
+            await asyncio.wait_for(reading, timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            if isinstance(e, asyncio.CancelledError):
+                # Collect the cancelled reads so asyncio doesn't warn about them
+                if reading.done() and not reading.cancelled():
+                    reading.exception()
+                raise
+            return f"Command '{command}' timed out after {timeout} seconds"
         
-        # Use pexpect for interactive sudo commands
+        return _format_command_output(command, stdout.text(), stderr.text(), process.returncode, cwd)
+    except Exception as e:
+        return f"Error executing command '{command}': {str(e)}"
+    finally:
+        stdout.close()
+        stderr.close()
+
+async def _read_into(stream, capture: OutputCapture):
+    """Copy an asyncio stream into a capture chunk by chunk."""
+    while True:
+        data = await stream.read(STREAM_CHUNK_SIZE)
+        if not data:
+            break
+        capture.write(data)
+
+def start_sudo_job(command: str) -> Job:
+    """Start a sudo command as a background job that answers password and confirmation prompts."""
+    sudo_password = _get_sudo_password()
+    if not sudo_password:
+        raise ValueError("Could not read sudo password from sudopass.txt. Sudo commands require password setup.")
+    session = current_session()
+    # Sudo commands may install or remove package managers
+    return jobs.submit_interactive(
+        command, session.cwd, session.id, password=sudo_password,
+        on_finish=lambda job: invalidate_fingerprint()
+    )
+
+def _format_job_result(job: Job) -> str:
+    """Report a sudo job the way run_command reports commands, or point at job_status if it is still running."""
+    if not job.done:
+        text, _, end = job.read_output()
+        return (f"Command: {job.command}\nWorking directory: {job.cwd}\n"
+                f"Status: Still running as background job {job.id}. Use job_status to check on it.\n"
+                f"Output so far ({end} bytes):\n{text}")
+    if job.status == "succeeded":
+        status = "Success"
+    else:
+        status = f"Failed (exit code {job.exit_code})"
+        if job.error:
+            status += f": {job.error}"
+    return f"Command: {job.command}\nWorking directory: {job.cwd}\nStatus: {status}\nOutput:\n{job.output_text()}"
+
+@timed("command", "shell")
+def _run_in_shell(session, command: str):
+    """Run a command in the session's persistent shell.
+
+    Returns the formatted result, or None if the shell is busy running something else.
+    """
+    if not session.shell_lock.acquire(blocking=False):
+        return None
+    try:
+        if session.shell is None or not session.shell.is_alive():
+            session.shell = ShellSession(session.cwd)
+        
+        # PTY output uses CRLF line endings
+        capture = OutputCapture()
+        on_output = lambda data: capture.write(data.replace(b"\r\n", b"\n"))
         try:
-            timeout_duration = 120  # 2 minutes timeout
-            
-            child = pexpect.spawn(command, cwd=_current_dir, timeout=timeout_duration)
-            
-            # Wait for password prompt and send password
+            exit_code, cwd = session.shell.run(command, COMMAND_TIMEOUT, on_output)
+        except CommandTimeout:
+            return f"Command '{command}' timed out after {COMMAND_TIMEOUT} seconds. Use start_job for long-running commands."
+        except ShellExited as e:
+            session.shell = None
+            if e.cwd:
+                session.cwd = e.cwd
+            exit_code = e.exit_code if e.exit_code is not None else 1
+            return (_format_command_output(command, capture.text(), "", exit_code)
+                    + "\n(The shell exited and will be restarted)")
+        finally:
+            capture.close()
+        
+        session.cwd = cwd
+        return _format_command_output(command, capture.text(), "", exit_code)
+    finally:
+        session.shell_lock.release()
+
+def _format_command_output(command: str, stdout: str, stderr: str, exit_code: int = None, cwd: str = None) -> str:
+    """Format captured stdout/stderr the way run_command reports it."""
+    output = ""
+    if stdout:
+        output += f"Output:\n{stdout}"
+    if stderr:
+        if output:
+            output += f"\nErrors:\n{stderr}"
+        else:
+            output = f"Errors:\n{stderr}"
+    
+    if exit_code:
+        output = f"Status: Failed (exit code {exit_code})" + (f"\n{output}" if output else "")
+    elif not output:
+        output = "Command completed successfully (no output)"
+        
+    return f"Command: {command}\nWorking directory: {cwd or current_session().cwd}\n{output}"
+
+def stream_in_shell(command: str, timeout: int = STREAM_TIMEOUT, cancelled: threading.Event = None):
+    """Run a command in the session's persistent shell and yield its output as it arrives.
+
+    Yields what stream_command does, with stderr merged into the ('stdout', text)
+    chunks by the PTY, so cd, export, source and alias carry over to later commands.
+    If the shell is busy with another command, this one runs on its own through
+    stream_command instead. Closing the generator, or setting cancelled, interrupts the
+    command; a cancelled one yields no exit event.
+    """
+    session = current_session()
+    if not session.shell_lock.acquire(blocking=False):
+        yield from stream_command(command, timeout, cancelled)
+        return
+    
+    # Bounded, so a slow consumer holds the shell's output back instead of buffering it
+    chunks = queue.Queue(maxsize=64)
+    stop = threading.Event()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    
+    def put(item):
+        while not stop.is_set():
             try:
-                index = child.expect([
-                    r'\[sudo\] password for.*:',
-                    r'Password:',
-                    r'password:',
-                    pexpect.EOF,
-                    pexpect.TIMEOUT
-                ], timeout=10)
-                
-                if index < 3:  # Password prompt detected
-                    child.sendline(sudo_password)
-                    
-            except pexpect.TIMEOUT:
-                pass  # Continue anyway
-            
-            # Handle confirmation prompts
-            while True:
-                try:
-                    index = child.expect([
-                        r'Proceed with installation\? \[Y/n\]',
-                        r'\[Y/n\]',
-                        r'\(y/N\)',
-                        r'Continue\? \[Y/n\]',
-                        r'Do you want to continue\? \[Y/n\]',
-                        pexpect.EOF,
-                        pexpect.TIMEOUT
-                    ], timeout=30)
-                    
-                    if index < 5:  # Any confirmation prompt
-                        child.sendline('y')
-                    elif index == 5:  # EOF - command completed
-                        break
-                    else:  # TIMEOUT
-                        child.expect(pexpect.EOF, timeout=timeout_duration)
-                        break
-                        
-                except pexpect.TIMEOUT:
-                    break
-            
-            child.close(force=False)
-            output = child.before.decode('utf-8', errors='ignore')
-            exit_status = child.exitstatus or 0
-            
-            if exit_status == 0:
-                return f"Command: {command}\nWorking directory: {_current_dir}\nStatus: Success\nOutput:\n{output}"
+                chunks.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+    
+    def on_output(data):
+        text = decoder.decode(data.replace(b"\r\n", b"\n"))
+        if text:
+            put(('stdout', text))
+    
+    def run():
+        try:
+            if session.shell is None or not session.shell.is_alive():
+                session.shell = ShellSession(session.cwd)
+            exit_code, cwd = session.shell.run(command, timeout, on_output, stop)
+            session.cwd = cwd
+            put(('exit', exit_code))
+        except CommandTimeout:
+            put(('error', f"Command '{command}' timed out after {timeout} seconds"))
+            put(('exit', 130))
+        except CommandCancelled:
+            pass
+        except ShellExited as e:
+            session.shell = None
+            if e.cwd:
+                session.cwd = e.cwd
+            if e.exit_code is None:
+                put(('error', "The shell exited and will be restarted"))
+                put(('exit', 1))
             else:
-                return f"Command: {command}\nWorking directory: {_current_dir}\nStatus: Failed (exit code {exit_status})\nOutput:\n{output}"
-                
-        except pexpect.TIMEOUT:
-            return f"Command '{command}' timed out after {timeout_duration} seconds."
+                put(('stdout', "\n(The shell exited and will be restarted)\n"))
+                put(('exit', e.exit_code))
         except Exception as e:
-            return f"Error executing sudo command '{command}': {str(e)}"
+            put(('error', f"Error executing command: {str(e)}"))
+            put(('exit', 1))
+        finally:
+            session.shell_lock.release()
+            put(None)
     
-    # For non-sudo commands, use subprocess
+    worker = threading.Thread(target=run, name="shell-stream", daemon=True)
+    worker.start()
     try:
-        result = subprocess.run(
-            command, 
-            shell=True, 
-            capture_output=True, 
-            text=True, 
-            timeout=60,
-            cwd=_current_dir
-        )
-        
-        output = ""
-        if result.stdout:
-            output += f"Output:\n{result.stdout}"
-        if result.stderr:
-            if output:
-                output += f"\nErrors:\n{result.stderr}"
-            else:
-                output = f"Errors:\n{result.stderr}"
-        
-        if not output:
-            output = "Command completed successfully (no output)"
+        while True:
+            try:
+                item = chunks.get(timeout=0.2)
+            except queue.Empty:
+                if cancelled is not None and cancelled.is_set():
+                    return
+                continue
+            if item is None:
+                return
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+def stream_command(command: str, timeout: int = STREAM_TIMEOUT, cancelled: threading.Event = None):
+    """Run a shell command and yield its output incrementally.
+
+    Yields ('stdout', text) and ('stderr', text) chunks as they arrive, then a final
+    ('exit', returncode). A timeout yields ('error', message) before the exit event.
+    If the consumer stops iterating (e.g. the HTTP client disconnects) or cancelled is
+    set, the whole process group is killed; a cancelled command yields no exit event.
+    """
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=current_session().cwd,
+        start_new_session=True
+    )
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, 'stdout')
+    selector.register(process.stderr, selectors.EVENT_READ, 'stderr')
+    decoders = {
+        'stdout': codecs.getincrementaldecoder('utf-8')(errors='replace'),
+        'stderr': codecs.getincrementaldecoder('utf-8')(errors='replace')
+    }
+    deadline = time.monotonic() + timeout
+    # A silent command is checked for cancellation this often
+    poll = 0.2 if cancelled is not None else 1.0
+    
+    try:
+        while selector.get_map():
+            if cancelled is not None and cancelled.is_set():
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield ('error', f"Command '{command}' timed out after {timeout} seconds")
+                break
             
-        return f"Command: {command}\nWorking directory: {_current_dir}\n{output}"
+            for key, _ in selector.select(timeout=min(remaining, poll)):
+                data = os.read(key.fd, STREAM_CHUNK_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                text = decoders[key.data].decode(data)
+                if text:
+                    yield (key.data, text)
         
-    except subprocess.TimeoutExpired:
-        return f"Command '{command}' timed out after 60 seconds"
-    except Exception as e:
-        return f"Error executing command '{command}': {str(e)}"
+        if process.poll() is None:
+            _kill_process_group(process)
+        yield ('exit', process.wait())
+    finally:
+        selector.close()
+        if process.poll() is None:
+            _kill_process_group(process)
+        process.stdout.close()
+        process.stderr.close()
+
+def _kill_process_group(process: subprocess.Popen):
+    """Kill a process started with start_new_session=True along with its children."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
 
-@tool
 def get_current_directory() -> str:
     """Get the current working directory."""
-    global _current_dir
-    return f"Current working directory: {_current_dir}"
+    return f"Current working directory: {current_session().cwd}"
 
 if __name__ == "__main__":
     input_command = input("Enter a command to run: ")
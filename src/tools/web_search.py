@@ -1,21 +1,129 @@
 from langchain_core.tools import tool
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote_plus
+from collections import OrderedDict
 import json
+import os
+import sqlite3
+import threading
+import time
+# Handle both relative and absolute imports
+try:
+    from .metrics import timed
+except ImportError:
+    from metrics import timed
+
+# DuckDuckGo Instant Answer API (free, no API key required). Point this at a local
+# stub server (see benchmarks/stub_search_server.py) to benchmark offline.
+SEARCH_ENDPOINT = os.getenv("WEB_SEARCH_ENDPOINT", "https://api.duckduckgo.com/")
+# Seconds a cached result stays valid
+CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "3600"))
+# Results kept in memory, least recently used are evicted
+CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "256"))
+# Optional SQLite file that keeps results across restarts
+CACHE_PATH = os.getenv("WEB_SEARCH_CACHE_PATH", "")
+
+class SearchCache:
+    """LRU cache of search results with a TTL and optional SQLite persistence."""
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL, path: str = CACHE_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str):
+        """Return the cached result for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[1], row[0])
+                    self._store(key, entry)
+            if entry is None:
+                return None
+            created, value = entry
+            if now - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str):
+        """Cache a result."""
+        entry = (time.time(), value)
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, entry[0])
+                )
+                self._db.execute("DELETE FROM search_cache WHERE created < ?", (entry[0] - self.ttl,))
+                self._db.commit()
+
+    def clear(self):
+        """Drop every cached result, including persisted ones."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM search_cache")
+                self._db.commit()
+
+    def _store(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+_cache = SearchCache()
+
+# Keep-alive connection pool shared by all searches
+_http = requests.Session()
+_http.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+})
+_http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_http.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
 
 @tool
+@timed("tool")
 def web_search(query: str) -> str:
     """Search the web for current information using DuckDuckGo."""
+    cache_key = _normalize_query(query)
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    result = _search(query)
+    # Failed lookups are not cached so they are retried next time
+    if not result.startswith("Error searching"):
+        _cache.put(cache_key, result)
+    return result
+
+def _search(query: str) -> str:
+    """Query the search API and format the answer."""
     try:
-        # Use DuckDuckGo Instant Answer API (free, no API key required)
         encoded_query = quote_plus(query)
-        url = f"https://api.duckduckgo.com/?q={encoded_query}&format=json&no_redirect=1&no_html=1&skip_disambig=1"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+        url = f"{SEARCH_ENDPOINT}?q={encoded_query}&format=json&no_redirect=1&no_html=1&skip_disambig=1"
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _http.get(url, timeout=10)
         response.raise_for_status()
         
         data = response.json()